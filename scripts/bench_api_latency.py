@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+ダウンロード中の API 応答遅延ベンチマーク (同一プロセス vs 別プロセスのエンジン)
+
+ローカルのスタブミラー (bench_download.py と同じもの) から .osz 相当の zip を並列に落としながら、
+別プロセスのクライアントから GET /api/queue と GET /api/health を叩き続けて応答時間を測る。
+各モードはそれぞれ新しいサーバプロセス (uvicorn) で起動する。
+
+使い方:
+  python scripts/bench_api_latency.py
+  python scripts/bench_api_latency.py --sets 24 --size-mb 64 --concurrency 6
+  python scripts/bench_api_latency.py --modes process
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_download import serve  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_server(mode: str, mirror_port: int, api_port: int, concurrency: int) -> None:
+    workdir = tempfile.mkdtemp(prefix="osu-sync-bench-")
+    # api.config は import 時に環境変数を読むので先に設定する
+    os.environ.update(
+        {
+            "OSUSYNC_CONFIG_DIR": str(Path(workdir) / "config"),
+            "OSU_SONGS_DIR": str(Path(workdir) / "Songs"),
+            "OSU_DB_PATH": str(Path(workdir) / "osu!.db"),
+            "OSU_DOWNLOAD_URL_TEMPLATE": f"http://127.0.0.1:{mirror_port}/d/{{set_id}}",
+            "OSU_DL_RPM": "10000",
+            "OSU_DL_CONCURRENCY": str(concurrency),
+            "OSU_DL_PROCESS": "1" if mode == "process" else "0",
+            "OSU_DL_MIN_FREE_MB": "0",
+            "OSU_HTTP_PREWARM": "0",
+        }
+    )
+    import uvicorn
+
+    from api.main import create_app
+
+    uvicorn.run(create_app(), host="127.0.0.1", port=api_port, log_level="warning")
+
+
+def wait_ready(client: httpx.Client, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if client.get("/api/health").status_code == 200:
+                # エンジンの起動 (別プロセスなら spawn) が終わるまで待つ
+                if client.get("/api/queue").status_code == 200:
+                    return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def sample(client: httpx.Client, path: str, samples: list[float]) -> httpx.Response:
+    started = time.perf_counter()
+    resp = client.get(path)
+    samples.append(time.perf_counter() - started)
+    return resp
+
+
+def summarize(label: str, samples: list[float]) -> str:
+    if not samples:
+        return f"  {label}: no samples"
+    ordered = sorted(samples)
+    p99 = ordered[max(0, int(len(ordered) * 0.99) - 1)]
+    p50 = statistics.median(ordered)
+    return (
+        f"  {label}: n={len(ordered)} p50={p50 * 1000:.1f}ms"
+        f" p99={p99 * 1000:.1f}ms max={ordered[-1] * 1000:.1f}ms"
+    )
+
+
+def bench_mode(args: argparse.Namespace, mode: str, mirror_port: int) -> None:
+    api_port = free_port()
+    server = multiprocessing.Process(
+        target=run_server,
+        args=(mode, mirror_port, api_port, args.concurrency),
+    )  # process モードではここから更にエンジンを spawn するので daemon にしない
+    server.start()
+    try:
+        with httpx.Client(
+            base_url=f"http://127.0.0.1:{api_port}", timeout=60
+        ) as client:
+            wait_ready(client)
+
+            idle: list[float] = []
+            for _ in range(args.idle_requests):
+                sample(client, "/api/queue", idle)
+
+            queue: list[float] = []
+            health: list[float] = []
+            started = time.perf_counter()
+            client.post(
+                "/api/download", json={"set_ids": list(range(1, args.sets + 1))}
+            ).raise_for_status()
+            while True:
+                sample(client, "/api/health", health)
+                status = sample(client, "/api/queue", queue).json()
+                if status["done_total"] >= args.sets:
+                    break
+                time.sleep(args.interval)
+            elapsed = time.perf_counter() - started
+            done = status["done"]
+    finally:
+        server.terminate()
+        server.join(10)
+
+    failed = [t for t in done if t["status"] != "completed"]
+    total = sum(t["bytes_downloaded"] or 0 for t in done)
+    print(f"mode={mode}")
+    print(f"  sets={len(done)} failed={len(failed)} elapsed={elapsed:.1f}s")
+    print(f"  throughput={total / elapsed / 1024 / 1024:.1f} MB/s")
+    print(summarize("idle   /api/queue ", idle))
+    print(summarize("loaded /api/queue ", queue))
+    print(summarize("loaded /api/health", health))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sets", type=int, default=16)
+    parser.add_argument("--size-mb", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=0.02)
+    parser.add_argument("--idle-requests", type=int, default=50)
+    parser.add_argument(
+        "--modes", nargs="+", choices=("inprocess", "process"), default=None
+    )
+    args = parser.parse_args()
+
+    port_queue: multiprocessing.Queue = multiprocessing.Queue()
+    mirror = multiprocessing.Process(
+        target=serve, args=(port_queue, args.size_mb), daemon=True
+    )
+    mirror.start()
+    try:
+        mirror_port = port_queue.get(timeout=30)
+        for mode in args.modes or ("inprocess", "process"):
+            bench_mode(args, mode, mirror_port)
+    finally:
+        mirror.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+ダウンローダのスループット / イベントループ遅延ベンチマーク
+
+ローカルのスタブ HTTP サーバ (別プロセス) から .osz 相当の zip を並列に落とし、
+合計スループットとイベントループの遅延 (sleep のオーバーシュート) を計測する。
+
+使い方:
+  python scripts/bench_download.py                      # 既定設定 (256KB チャンク)
+  python scripts/bench_download.py --chunk-kb 4         # 旧来の 4KB チャンク相当
+  python scripts/bench_download.py --sets 12 --size-mb 64 --concurrency 6
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import multiprocessing
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+
+def build_payload(size_mb: int) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr("bench.osu", "[Metadata]\nArtist:bench\nTitle:bench\n")
+        zf.writestr("audio.bin", bytes(size_mb * 1024 * 1024))
+    return buf.getvalue()
+
+
+def serve(port_queue: multiprocessing.Queue, size_mb: int) -> None:
+    payload = build_payload(size_mb)
+    view = memoryview(payload)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            for offset in range(0, len(payload), 1024 * 1024):
+                self.wfile.write(view[offset : offset + 1024 * 1024])
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+async def measure_loop_lag(samples: list[float], stop: asyncio.Event) -> None:
+    interval = 0.005
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run(args: argparse.Namespace, port: int) -> None:
+    from core.downloader import DownloadManager
+
+    with tempfile.TemporaryDirectory() as songs_dir:
+        manager = DownloadManager(
+            songs_dir=songs_dir,
+            url_template=f"http://127.0.0.1:{port}/d/{{set_id}}",
+            max_concurrency=args.concurrency,
+            requests_per_minute=10_000,
+            chunk_size=args.chunk_kb * 1024,
+            write_buffer_bytes=args.buffer_mb * 1024 * 1024,
+        )
+        lag: list[float] = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(measure_loop_lag(lag, stop))
+        started = time.perf_counter()
+        await manager.start_workers()
+        manager.enqueue(list(range(1, args.sets + 1)))
+        await manager.wait_idle()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+        done = manager.status()["done"]
+        total = sum(t["bytes_downloaded"] or 0 for t in done)
+        failed = [t for t in done if t["status"] != "completed"]
+        lag.sort()
+        print(f"chunk={args.chunk_kb}KB buffer={args.buffer_mb}MB")
+        print(f"  sets={len(done)} failed={len(failed)}")
+        print(f"  throughput={total / elapsed / 1024 / 1024:.1f} MB/s")
+        print(
+            "  loop lag p50={:.2f}ms p99={:.2f}ms max={:.2f}ms".format(
+                statistics.median(lag) * 1000,
+                lag[int(len(lag) * 0.99) - 1] * 1000,
+                lag[-1] * 1000,
+            )
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sets", type=int, default=8)
+    parser.add_argument("--size-mb", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chunk-kb", type=int, default=256)
+    parser.add_argument("--buffer-mb", type=int, default=16)
+    args = parser.parse_args()
+
+    port_queue: multiprocessing.Queue = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve, args=(port_queue, args.size_mb), daemon=True
+    )
+    server.start()
+    try:
+        port = port_queue.get(timeout=30)
+        asyncio.run(run(args, port))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import json
 import os
 from pathlib import Path
 
+from core.scheduler import SCHEDULE_POLICIES
+
 
 class SettingsStore:
     def __init__(self, path: Path) -> None:
@@ -41,6 +43,7 @@ class Settings:
                 / "osu-sync",
             )
         )
+        self.config_dir = settings_dir
         self.store = SettingsStore(settings_dir / "settings.json")
 
         defaults = {
@@ -53,6 +56,57 @@ class Settings:
             "download_query_options": "",
             "max_concurrency": 3,
             "requests_per_minute": 60,
+            "max_retries": 3,
+            "download_chunk_kb": 256,
+            "write_buffer_mb": 16,
+            "postprocess_concurrency": 2,
+            # ダウンロードエンジンを別プロセスで動かす (API / UI の応答を優先する)
+            "download_process": False,
+            # Songs ボリュームに最低限残す空き容量。足りない DL は失敗せず保留になる
+            "min_free_disk_mb": 512,
+            "preallocate": True,
+            # 帯域制限 (KB/s, 0 = 無制限)。schedule は時間帯ごとの上書き
+            # 例: [{"start": "01:00", "end": "07:00", "limit_kbps": 0}]
+            "bandwidth_limit_kbps": 0,
+            "per_task_limit_kbps": 0,
+            "bandwidth_schedule": [],
+            # fifo / shortest / fair。shortest / fair は probe_sizes と併用する
+            "schedule_policy": "fifo",
+            "probe_sizes": False,
+            "probe_requests_per_minute": 240,
+            # 共有 HTTP トランスポート
+            "http_max_connections": 20,
+            "http_max_keepalive": 10,
+            "http_keepalive_expiry": 30.0,
+            "http2": False,
+            "prewarm_connections": True,
+            # 終了済みタスクの保持件数 / 時間 (0 = 無制限)。spill で溢れた分を
+            # 設定ディレクトリの history.jsonl に追記する
+            "history_limit": 1000,
+            "history_max_age_hours": 0,
+            "history_spill": False,
+            # 検索結果キャッシュ (MB / 秒)。compress で zlib 圧縮して持つ
+            "search_cache_mb": 32,
+            "search_cache_ttl": 3600,
+            "search_cache_compress": True,
+            # 再起動後も使う検索キャッシュ (設定ディレクトリの search_cache.sqlite3)。
+            # TTL を過ぎたものも max_age までは即返し、裏で取り直す。0 MB で無効
+            "search_store_mb": 64,
+            "search_store_max_age_hours": 168,
+            # osu! API へのリクエスト上限 (回/分)。UI の検索を先に通し、裏の処理は後回しにする
+            "osu_api_requests_per_minute": 60,
+            # /api/search で次ページを裏で先読みする (1 分あたりの上限回数)
+            "search_prefetch": True,
+            "search_prefetch_per_minute": 30,
+            # 手元の beatmapset カタログ (設定ディレクトリの catalog.sqlite3)。
+            # statuses と modes (空 = 全モード) の組み合わせだけを refresh_hours ごとに差分で巡回する
+            "catalog_enabled": False,
+            "catalog_statuses": ["ranked", "loved"],
+            "catalog_modes": [],
+            "catalog_refresh_hours": 6,
+            # /api/search の検索先。remote / local / auto (カタログで賄える検索はカタログ、
+            # API に繋がらないときもカタログ)
+            "search_source": "auto",
             "player_volume": 0.7,
         }
 
@@ -92,6 +146,110 @@ class Settings:
             os.getenv("OSU_DL_RPM", data.get("requests_per_minute"))
         )
 
+        self.max_retries: int = int(
+            os.getenv("OSU_DL_MAX_RETRIES", data.get("max_retries"))
+        )
+
+        self.download_chunk_kb: int = int(
+            os.getenv("OSU_DL_CHUNK_KB", data.get("download_chunk_kb"))
+        )
+        self.write_buffer_mb: int = int(
+            os.getenv("OSU_DL_WRITE_BUFFER_MB", data.get("write_buffer_mb"))
+        )
+        self.postprocess_concurrency: int = int(
+            os.getenv("OSU_DL_POSTPROCESS", data.get("postprocess_concurrency"))
+        )
+        self.download_process: bool = self._coerce_bool(
+            os.getenv("OSU_DL_PROCESS", data.get("download_process"))
+        )
+        self.min_free_disk_mb: int = int(
+            os.getenv("OSU_DL_MIN_FREE_MB", data.get("min_free_disk_mb"))
+        )
+        self.preallocate: bool = self._coerce_bool(
+            os.getenv("OSU_DL_PREALLOCATE", data.get("preallocate"))
+        )
+        self.bandwidth_limit_kbps: int = int(
+            os.getenv("OSU_DL_BANDWIDTH_KBPS", data.get("bandwidth_limit_kbps"))
+        )
+        self.per_task_limit_kbps: int = int(
+            os.getenv("OSU_DL_PER_TASK_KBPS", data.get("per_task_limit_kbps"))
+        )
+        self.bandwidth_schedule: list[dict] = data.get("bandwidth_schedule") or []
+        self.schedule_policy: str = self._coerce_choice(
+            os.getenv("OSU_DL_SCHEDULE_POLICY", data.get("schedule_policy")),
+            SCHEDULE_POLICIES,
+            "fifo",
+        )
+        self.probe_sizes: bool = self._coerce_bool(
+            os.getenv("OSU_DL_PROBE_SIZES", data.get("probe_sizes"))
+        )
+        self.probe_requests_per_minute: int = int(
+            os.getenv("OSU_DL_PROBE_RPM", data.get("probe_requests_per_minute"))
+        )
+        self.http_max_connections: int = int(
+            os.getenv("OSU_HTTP_MAX_CONNECTIONS", data.get("http_max_connections"))
+        )
+        self.http_max_keepalive: int = int(
+            os.getenv("OSU_HTTP_MAX_KEEPALIVE", data.get("http_max_keepalive"))
+        )
+        self.http_keepalive_expiry: float = float(
+            os.getenv("OSU_HTTP_KEEPALIVE_EXPIRY", data.get("http_keepalive_expiry"))
+        )
+        self.http2: bool = self._coerce_bool(os.getenv("OSU_HTTP2", data.get("http2")))
+        self.prewarm_connections: bool = self._coerce_bool(
+            os.getenv("OSU_HTTP_PREWARM", data.get("prewarm_connections"))
+        )
+
+        self.history_limit: int = int(
+            os.getenv("OSU_DL_HISTORY_LIMIT", data.get("history_limit"))
+        )
+        self.history_max_age_hours: float = float(
+            os.getenv("OSU_DL_HISTORY_MAX_AGE_HOURS", data.get("history_max_age_hours"))
+        )
+        self.history_spill: bool = self._coerce_bool(
+            os.getenv("OSU_DL_HISTORY_SPILL", data.get("history_spill"))
+        )
+
+        self.search_cache_mb: float = float(
+            os.getenv("OSU_SEARCH_CACHE_MB", data.get("search_cache_mb"))
+        )
+        self.search_cache_ttl: float = float(
+            os.getenv("OSU_SEARCH_CACHE_TTL", data.get("search_cache_ttl"))
+        )
+        self.search_cache_compress: bool = self._coerce_bool(
+            os.getenv("OSU_SEARCH_CACHE_COMPRESS", data.get("search_cache_compress"))
+        )
+        self.search_store_mb: float = float(
+            os.getenv("OSU_SEARCH_STORE_MB", data.get("search_store_mb"))
+        )
+        self.search_store_max_age_hours: float = float(
+            os.getenv(
+                "OSU_SEARCH_STORE_MAX_AGE_HOURS", data.get("search_store_max_age_hours")
+            )
+        )
+        self.osu_api_requests_per_minute: int = int(
+            os.getenv("OSU_API_RPM", data.get("osu_api_requests_per_minute"))
+        )
+        self.search_prefetch: bool = self._coerce_bool(
+            os.getenv("OSU_SEARCH_PREFETCH", data.get("search_prefetch"))
+        )
+        self.search_prefetch_per_minute: int = int(
+            os.getenv("OSU_SEARCH_PREFETCH_RPM", data.get("search_prefetch_per_minute"))
+        )
+        self.catalog_enabled: bool = self._coerce_bool(
+            os.getenv("OSU_CATALOG", data.get("catalog_enabled"))
+        )
+        self.catalog_statuses: list[str] = list(data.get("catalog_statuses") or [])
+        self.catalog_modes: list[int] = [
+            int(m) for m in data.get("catalog_modes") or []
+        ]
+        self.catalog_refresh_hours: float = float(
+            os.getenv("OSU_CATALOG_REFRESH_HOURS", data.get("catalog_refresh_hours"))
+        )
+        self.search_source: str = os.getenv(
+            "OSU_SEARCH_SOURCE", data.get("search_source")
+        )
+
         self.player_volume: float = float(
             os.getenv("OSU_PLAYER_VOLUME", data.get("player_volume"))
         )
@@ -118,6 +276,19 @@ class Settings:
         value = os.getenv(key)
         return int(value) if value is not None and value.isdigit() else None
 
+    @staticmethod
+    def _coerce_bool(value: object) -> bool:
+        if isinstance(value, str):
+            return value.strip().lower() in {"1", "true", "yes", "on"}
+        return bool(value)
+
+    @staticmethod
+    def _coerce_choice(value: object, choices: tuple[str, ...], default: str) -> str:
+        # 不正な値で起動できなくならないよう、既定値に戻す
+        if isinstance(value, str) and value.strip().lower() in choices:
+            return value.strip().lower()
+        return default
+
     @staticmethod
     def _coerce_int(value: object) -> int | None:
         try:
@@ -3,15 +3,17 @@ import json
 import logging
 import os
 import platform
+import sqlite3
 import subprocess
 import threading
 import time
 from pathlib import Path
 from typing import Any
 
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+import httpx
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
 from api.config import settings
@@ -19,20 +21,60 @@ from api.osu_client import OsuApiClient
 from api.schemas import (
     BeatmapStatus,
     DownloadRequest,
+    FilterResponse,
     IndexSummary,
+    LookupRequest,
     OpenPathRequest,
+    PriorityRequest,
     QueueStatus,
     SearchResponse,
     SearchResult,
+    SyncPlanRequest,
+    SyncPlanStatus,
+)
+from core.bandwidth import BandwidthLimiter
+from core.catalog import (
+    LOCAL_PARAMS,
+    Catalog,
+    CatalogCrawler,
+    CatalogScope,
+    has_query_filters,
+    same_order_as_api,
 )
 from core.downloader import DownloadManager
+from core.engine import DownloadEngine, LocalEngine, ProcessEngine
+from core.filter_engine import FilterEngine, FilterError, FilterResult
 from core.filter_schema import FilterRequest
+from core.metadata_cache import MetadataCache
+from core.metrics import REGISTRY
+from core.rate_governor import RateGovernor
+from core.retry import RetryPolicy
 from core.scanner import SongIndex
+from core.scheduler import SCHEDULE_POLICIES
+from core.search_cache import SearchCache
+from core.search_prefetch import SearchPrefetcher
+from core.search_store import SearchStore
+from core.sync_plan import SyncPlanner
+from core.transport import HttpTransport
 from update_checker import download_and_run_installer, fetch_latest
 
 API_PREFIX = "/api"
+QUEUE_PAGE_SIZE = 200  # /queue の queued / done の既定ページサイズ
+FILTER_PAGE_LIMIT = 500  # /search/filter の 1 ページの上限
+FILTER_STREAM_FORMATS = ("ndjson", "sse")
+EVENT_QUEUE_SIZE = 1000  # 購読者ごとの未送信イベント上限 (超えたら捨てる)
+SEARCH_SOURCES = ("remote", "local", "auto")
 logger = logging.getLogger("osu_sync.api")
 
+SSE_SUBSCRIBERS = REGISTRY.gauge(
+    "osu_sync_sse_subscribers", "Connected SSE (/events) subscribers."
+)
+SSE_DROPPED = REGISTRY.counter(
+    "osu_sync_sse_dropped_events_total",
+    "Events dropped because a subscriber queue was full.",
+    ("topic",),
+)
+
 
 class EventBus:
     """Very small async pub/sub used for SSE push."""
@@ -40,9 +82,10 @@ class EventBus:
     def __init__(self) -> None:
         self._subscribers: set[asyncio.Queue] = set()
         self._lock = asyncio.Lock()
+        SSE_SUBSCRIBERS.set_function(lambda: len(self._subscribers))
 
     async def subscribe(self) -> asyncio.Queue:
-        q: asyncio.Queue = asyncio.Queue()
+        q: asyncio.Queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
         async with self._lock:
             self._subscribers.add(q)
         return q
@@ -58,7 +101,8 @@ class EventBus:
             try:
                 q.put_nowait(event)
             except asyncio.QueueFull:
-                # drop if subscriber is slow
+                # drop if subscriber is slow (queue は seq の欠番から再同期する)
+                SSE_DROPPED.labels(event.get("topic", "unknown")).inc()
                 continue
 
 
@@ -128,27 +172,164 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
         songs_dir=settings.songs_dir,
         event_bus=app.state.event_bus,
     )
-    app.state.downloader = DownloadManager(
-        songs_dir=settings.songs_dir,
-        url_template=settings.download_url_template,
-        query_options=settings.download_query_options,
-        max_concurrency=settings.max_concurrency,
-        requests_per_minute=settings.requests_per_minute,
-        index=app.state.index,
-        event_bus=app.state.event_bus,
+
+    # HTTP クライアントは用途ごとに共有し、作り直し時に必ず close する
+    app.state.transport = HttpTransport(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive,
+        keepalive_expiry=settings.http_keepalive_expiry,
+        http2=settings.http2,
     )
+
+    # 帯域制限はダウンローダを作り直しても引き継ぐ
+    app.state.bandwidth = BandwidthLimiter(
+        limit_kbps=settings.bandwidth_limit_kbps,
+        per_task_kbps=settings.per_task_limit_kbps,
+        schedule=BandwidthLimiter.parse_schedule(settings.bandwidth_schedule),
+    )
+
+    def history_spill_path() -> Path | None:
+        return settings.config_dir / "history.jsonl" if settings.history_spill else None
+
+    def downloader_options() -> dict[str, Any]:
+        """DownloadManager の引数のうち、別プロセスにもそのまま渡せるもの。"""
+        return dict(
+            songs_dir=settings.songs_dir,
+            url_template=settings.download_url_template,
+            query_options=settings.download_query_options,
+            max_concurrency=settings.max_concurrency,
+            requests_per_minute=settings.requests_per_minute,
+            retry_policy=RetryPolicy(max_retries=settings.max_retries),
+            chunk_size=settings.download_chunk_kb * 1024,
+            write_buffer_bytes=settings.write_buffer_mb * 1024 * 1024,
+            postprocess_concurrency=settings.postprocess_concurrency,
+            min_free_bytes=settings.min_free_disk_mb * 1024 * 1024,
+            preallocate=settings.preallocate,
+            schedule_policy=settings.schedule_policy,
+            probe_sizes=settings.probe_sizes,
+            probe_requests_per_minute=settings.probe_requests_per_minute,
+            history_limit=settings.history_limit,
+            history_max_age=settings.history_max_age_hours * 3600,
+            history_spill_path=history_spill_path(),
+        )
+
+    def build_downloader() -> DownloadEngine:
+        if settings.download_process:
+            # 転送と後処理を別プロセスへ。帯域制限と HTTP プールは子が自前で持つ
+            return ProcessEngine(
+                {
+                    **downloader_options(),
+                    "bandwidth": {
+                        "limit_kbps": settings.bandwidth_limit_kbps,
+                        "per_task_kbps": settings.per_task_limit_kbps,
+                        "schedule": settings.bandwidth_schedule,
+                    },
+                    "transport": {
+                        "max_connections": settings.http_max_connections,
+                        "max_keepalive_connections": settings.http_max_keepalive,
+                        "keepalive_expiry": settings.http_keepalive_expiry,
+                        "http2": settings.http2,
+                    },
+                    "prewarm": settings.prewarm_connections,
+                },
+                index=app.state.index,
+                event_bus=app.state.event_bus,
+            )
+        return LocalEngine(
+            DownloadManager(
+                **downloader_options(),
+                index=app.state.index,
+                event_bus=app.state.event_bus,
+                bandwidth=app.state.bandwidth,
+                client=app.state.transport.client(
+                    "download", follow_redirects=True, timeout=60
+                ),
+            )
+        )
+
+    app.state.downloader = build_downloader()
     logger.info(
-        "App init songs_dir=%s template=%s max_concurrency=%s rpm=%s",
+        "App init songs_dir=%s template=%s max_concurrency=%s rpm=%s process=%s",
         settings.songs_dir,
         settings.download_url_template,
         settings.max_concurrency,
         settings.requests_per_minute,
+        settings.download_process,
     )
 
+    def build_search_cache() -> SearchCache:
+        return SearchCache(
+            max_bytes=int(settings.search_cache_mb * 1024 * 1024),
+            ttl=settings.search_cache_ttl,
+            compress=settings.search_cache_compress,
+        )
+
+    def build_search_store() -> SearchStore | None:
+        if settings.search_store_mb <= 0:
+            return None
+        try:
+            return SearchStore(
+                settings.config_dir / "search_cache.sqlite3",
+                max_bytes=int(settings.search_store_mb * 1024 * 1024),
+                max_age=settings.search_store_max_age_hours * 3600,
+            )
+        except (OSError, sqlite3.Error):
+            logger.exception("Failed to open search cache database")
+            return None
+
+    def build_search_prefetcher() -> SearchPrefetcher:
+        return SearchPrefetcher(
+            per_minute=settings.search_prefetch_per_minute,
+            enabled=settings.search_prefetch,
+        )
+
+    def build_metadata_cache() -> MetadataCache | None:
+        try:
+            return MetadataCache(settings.config_dir / "metadata.sqlite3")
+        except (OSError, sqlite3.Error):
+            logger.exception("Failed to open metadata cache database")
+            return None
+
+    def build_catalog() -> None:
+        app.state.catalog = None
+        app.state.catalog_crawler = None
+        if not settings.catalog_enabled:
+            return
+        try:
+            catalog = Catalog(settings.config_dir / "catalog.sqlite3")
+        except (OSError, sqlite3.Error):
+            logger.exception("Failed to open catalog database")
+            return
+        app.state.catalog = catalog
+        app.state.catalog_crawler = CatalogCrawler(
+            catalog,
+            lambda: app.state.osu if app.state.osu_enabled else None,
+            CatalogScope.from_settings(
+                settings.catalog_statuses, settings.catalog_modes
+            ),
+            refresh_interval=settings.catalog_refresh_hours * 3600,
+            event_bus=app.state.event_bus,
+        )
+
+    # osu! API のペース配分はクライアントを作り直しても引き継ぐ
+    app.state.osu_governor = RateGovernor(settings.osu_api_requests_per_minute)
+    app.state.search_cache = build_search_cache()
+    app.state.search_store = build_search_store()
+    app.state.metadata_cache = build_metadata_cache()
+    app.state.search_prefetcher = build_search_prefetcher()
+
     def build_osu_client() -> None:
         try:
             app.state.osu = OsuApiClient(
-                settings.osu_client_id, settings.osu_client_secret
+                settings.osu_client_id,
+                settings.osu_client_secret,
+                client=app.state.transport.client(
+                    "osu", timeout=20, follow_redirects=True
+                ),
+                cache=app.state.search_cache,
+                store=app.state.search_store,
+                metadata=app.state.metadata_cache,
+                governor=app.state.osu_governor,
             )
             app.state.osu_enabled = True
         except Exception as exc:
@@ -156,6 +337,14 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
             app.state.osu_enabled = False
 
     build_osu_client()
+    build_catalog()
+
+    app.state.sync_planner = SyncPlanner(
+        lambda: app.state.downloader, event_bus=app.state.event_bus
+    )
+    app.state.filter_engine = FilterEngine(
+        lambda: app.state.catalog, lambda: app.state.index
+    )
 
     def map_search_result(item: dict) -> SearchResult:
         set_id = item.get("id")
@@ -235,11 +424,49 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
                 app.state.background_scan_task = asyncio.create_task(
                     app.state.index._start_background_scan()
                 )
+                # フィルタ用の列データを先に作っておく
+                app.state.filter_warm_task = asyncio.create_task(
+                    app.state.filter_engine.table()
+                )
             except Exception:
                 logger.exception("Failed to load osu!.db / start background scan")
 
         app.state.index_load_task = asyncio.create_task(load_index_and_scan())
-        await app.state.downloader.start_workers()
+        await app.state.downloader.start()
+        if app.state.catalog_crawler is not None:
+            app.state.catalog_crawler.start()
+        if settings.prewarm_connections:
+            app.state.prewarm_task = asyncio.create_task(prewarm_connections())
+
+    async def prewarm_connections() -> None:
+        transport: HttpTransport = app.state.transport
+        await asyncio.gather(
+            transport.prewarm("download", [settings.download_url_template]),
+            transport.prewarm("osu", [OsuApiClient.TOKEN_URL]),
+        )
+
+    @app.on_event("shutdown")
+    async def shutdown() -> None:
+        await app.state.sync_planner.close()
+        await close_catalog()
+        await app.state.search_prefetcher.close()
+        await app.state.downloader.close()
+        if isinstance(app.state.osu, OsuApiClient):
+            await app.state.osu.aclose()
+        await app.state.transport.aclose()
+        if app.state.search_store is not None:
+            app.state.search_store.close()
+        if app.state.metadata_cache is not None:
+            app.state.metadata_cache.close()
+
+    async def close_catalog() -> None:
+        if app.state.catalog_crawler is not None:
+            await app.state.catalog_crawler.close()
+        if app.state.catalog is not None:
+            app.state.catalog.close()
+
+    async def queue_page() -> QueueStatus:
+        return QueueStatus(**await app.state.downloader.status(limit=QUEUE_PAGE_SIZE))
 
     # 依存関数
     def require_osu_client() -> OsuApiClient:
@@ -383,7 +610,7 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
         sort: str | None = None,
         played: str | None = None,
         rank: str | None = None,
-        osu: OsuApiClient = Depends(require_osu_client),
+        source: str | None = None,  # remote / local / auto (既定は設定の search_source)
     ) -> SearchResponse:
         # 公式APIのURL短縮形パラメータに完全に対応
         # 高度な検索クエリと通常の検索フィルターの両方をサポート
@@ -392,7 +619,7 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
         search_query = q if q is not None else ""
 
         # 公式APIのパラメータ形式に合わせて直接渡す
-        raw = await osu.search_beatmapsets(
+        params: dict[str, Any] = dict(
             q=search_query,
             page=page,
             limit=limit,
@@ -407,6 +634,54 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
             played=played,
             r=rank,  # rank パラメータ
         )
+        source = source or settings.search_source
+        if source not in SEARCH_SOURCES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"source must be one of {', '.join(SEARCH_SOURCES)}",
+            )
+        catalog: Catalog | None = app.state.catalog
+        # カタログが扱えない条件 (e / c / g / l / played / r、q の stars>5 など) が
+        # 付いていたらリモートだけ
+        local_ok = (
+            catalog is not None
+            and not {
+                k
+                for k, v in params.items()
+                if v not in (None, "") and k not in LOCAL_PARAMS
+            }
+            and not has_query_filters(search_query)
+        )
+        if source == "local":
+            if catalog is None:
+                raise HTTPException(
+                    status_code=400, detail="catalog is disabled (catalog_enabled)"
+                )
+            if not local_ok:
+                raise HTTPException(
+                    status_code=400,
+                    detail="local search supports only q (plain words), s, m, nsfw"
+                    " and sort",
+                )
+            raw = await search_catalog(params)
+        elif (
+            source == "auto"
+            and local_ok
+            and same_order_as_api(search_query, sort)
+            and await catalog.covers(app.state.catalog_crawler.scopes, s, _mode_int(m))
+        ):
+            raw = await search_catalog(params)
+        else:
+            try:
+                raw = await search_remote(params)
+            except (httpx.TransportError, HTTPException) as exc:
+                status = getattr(exc, "status_code", None)
+                offline = status is None or status == 429 or status >= 500
+                # API に届かないときは手元のカタログで答える (網羅していなくても)
+                if source != "auto" or not local_ok or not offline:
+                    raise
+                logger.warning("Search fell back to the local catalog: %s", exc)
+                raw = await search_catalog(params)
 
         # API v2はbeatmapsetsを配列で返す
         beatmapsets = raw.get("beatmapsets", [])
@@ -418,6 +693,37 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
             results=results,
         )
 
+    def _mode_int(m: str | None) -> int | None:
+        return int(m) if m not in (None, "") and str(m).isdigit() else None
+
+    async def search_remote(params: dict[str, Any]) -> dict[str, Any]:
+        osu = require_osu_client()
+        prefetcher: SearchPrefetcher = app.state.search_prefetcher
+        prefetcher.observe(params)
+        raw = await osu.search_beatmapsets(**params)
+        # 次のページを裏で温めておく (条件が変われば取り消される)
+        prefetcher.schedule(
+            params,
+            raw.get("total"),
+            lambda p: osu.search_beatmapsets(**p),
+            lambda p: osu.cached(**p),
+        )
+        return raw
+
+    async def search_catalog(params: dict[str, Any]) -> dict[str, Any]:
+        try:
+            return await app.state.catalog.search(
+                q=params["q"],
+                page=params["page"],
+                limit=params["limit"],
+                s=params["s"],
+                m=_mode_int(params["m"]),
+                nsfw=params["nsfw"],
+                sort=params["sort"],
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+
     @api.post("/download", response_model=QueueStatus)
     async def download(req: DownloadRequest) -> QueueStatus:
         missing = [s for s in req.set_ids if not app.state.index.owned(s)]
@@ -428,53 +734,328 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
             list(req.metadata.keys()) if req.metadata else [],
         )
         if not missing:
-            return QueueStatus(**app.state.downloader.status())
-        app.state.downloader.enqueue(missing, req.metadata)
-        return QueueStatus(**app.state.downloader.status())
+            return await queue_page()
+        metadata = dict(req.metadata or {})
+        cache: MetadataCache | None = app.state.metadata_cache
+        unnamed = [s for s in missing if s not in metadata]
+        if unnamed and cache is not None:
+            # 以前まとめ引きしたセットならキューの表示名をキャッシュから埋める (通信はしない)
+            known, _ = await cache.beatmapsets(unnamed)
+            for set_id, bs in known.items():
+                metadata[set_id] = {
+                    key: bs[key]
+                    for key in ("artist", "title", "artist_unicode", "title_unicode")
+                    if bs.get(key)
+                }
+        await app.state.downloader.enqueue(missing, metadata or None, req.priority)
+        return await queue_page()
+
+    @api.post("/lookup")
+    async def lookup(
+        body: LookupRequest,
+        osu: OsuApiClient = Depends(require_osu_client),
+    ) -> dict:
+        """
+        beatmap id / checksum (MD5) / beatmapset id から情報をまとめて引く。
+        見つからなかったキーは結果に含めない。
+        """
+        beatmaps, checksums, beatmapsets = await asyncio.gather(
+            osu.get_beatmaps(body.beatmap_ids),
+            osu.lookup_checksums(body.checksums),
+            osu.get_beatmapsets(body.set_ids),
+        )
+        return {
+            "beatmaps": beatmaps,
+            "checksums": checksums,
+            "beatmapsets": beatmapsets,
+        }
+
+    @api.post("/sync-plan", response_model=SyncPlanStatus)
+    async def start_sync_plan(
+        body: SyncPlanRequest,
+        osu: OsuApiClient = Depends(require_osu_client),
+    ) -> SyncPlanStatus:
+        """検索結果を全ページ辿り、未所有のセットをページ単位で DL キューに積む。"""
+        params = body.model_dump(
+            exclude={"page_size", "priority", "dry_run", "cursor"}, exclude_none=True
+        )
+        pages = osu.iter_search(
+            q=body.q,
+            limit=body.page_size,
+            s=body.s,
+            m=body.m,
+            e=body.e,
+            c=body.c,
+            g=body.g,
+            l=body.l,
+            nsfw=body.nsfw,
+            sort=body.sort,
+            played=body.played,
+            r=body.rank,
+            cursor=body.cursor,
+        )
+        plan = app.state.sync_planner.start(
+            pages,
+            params,
+            priority=body.priority,
+            dry_run=body.dry_run,
+            cursor=body.cursor,
+        )
+        return SyncPlanStatus(**plan.to_dict())
+
+    @api.get("/sync-plan", response_model=list[SyncPlanStatus])
+    async def list_sync_plans() -> list[SyncPlanStatus]:
+        return [SyncPlanStatus(**p.to_dict()) for p in app.state.sync_planner.plans()]
+
+    @api.get("/sync-plan/{plan_id}", response_model=SyncPlanStatus)
+    async def get_sync_plan(plan_id: str) -> SyncPlanStatus:
+        plan = app.state.sync_planner.get(plan_id)
+        if plan is None:
+            raise HTTPException(status_code=404, detail="Sync plan not found")
+        return SyncPlanStatus(**plan.to_dict())
+
+    @api.post("/sync-plan/{plan_id}/cancel", response_model=SyncPlanStatus)
+    async def cancel_sync_plan(plan_id: str) -> SyncPlanStatus:
+        """ページ送りを止める。既に積んだ分はキューに残る (個別に取り消す)。"""
+        planner: SyncPlanner = app.state.sync_planner
+        plan = planner.get(plan_id)
+        if plan is None:
+            raise HTTPException(status_code=404, detail="Sync plan not found")
+        if not await planner.cancel(plan_id):
+            raise HTTPException(status_code=409, detail="Sync plan is not running")
+        return SyncPlanStatus(**plan.to_dict())
+
+    async def run_filter(body: FilterRequest) -> FilterResult:
+        try:
+            result = await app.state.filter_engine.search(body)
+        except FilterError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        logger.info(
+            "POST /search/filter sets=%s beatmaps=%s elapsed=%sms",
+            len(result.set_ids),
+            result.beatmaps,
+            result.elapsed_ms,
+        )
+        return result
+
+    def filter_page(
+        result: FilterResult, items: list[dict], page: int, limit: int
+    ) -> FilterResponse:
+        results = [map_search_result(item) for item in items]
+        return FilterResponse(
+            total=len(result.set_ids),
+            page=page,
+            limit=limit,
+            results=results,
+            beatmaps=result.beatmaps,
+            owned=sum(r.owned for r in results),
+            missing_set_ids=[r.set_id for r in results if not r.owned],
+        )
 
-    @api.post("/search/filter", response_model=SearchResponse)
+    @api.post("/search/filter", response_model=FilterResponse)
     async def search_by_filter(
         body: FilterRequest,
-        osu: OsuApiClient = Depends(require_osu_client),
-    ) -> SearchResponse:
+        page: int = Query(1, ge=1),
+        limit: int = Query(20, ge=1, le=FILTER_PAGE_LIMIT),
+    ) -> FilterResponse:
         """
-        先人プロジェクト (batch-beatmap-downloader) の FilterRequest 互換の簡易実装。
-        Rule を osu!web 検索クエリ文字列に変換して /search を叩く。
-        例: field=Cs, operator='>', value='5' => 'cs>5'
+        先人プロジェクト (batch-beatmap-downloader) の FilterRequest 互換。
+        groups の and / or / not の木をそのまま、手元のデータ (osu!.db の全難易度と
+        カタログ) に対して評価する。カタログが無効なら手持ちの譜面だけが対象になる。
+        例: field=Cs, operator='>', value='5'
         """
+        result = await run_filter(body)
+        set_ids = result.set_ids[(page - 1) * limit : page * limit]
+        items = await app.state.filter_engine.beatmapsets(set_ids, result.table)
+        return filter_page(result, items, page, limit)
 
-        def rule_to_token(field: str, op: str, value: str) -> str:
-            mapping = {
-                "Cs": "cs",
-                "Ar": "ar",
-                "Od": "od",
-                "Hp": "hp",
-                "Bpm": "bpm",
-                "Length": "length",
-                "Stars": "stars",
-                "Creator": "creator",
-                "Artist": "artist",
-                "Title": "title",
-            }
-            f = mapping.get(field, field.lower())
-            return f"{f}{op}{value}"
+    @api.post("/search/filter/stream")
+    async def stream_filter(
+        body: FilterRequest,
+        request: Request,
+        output: str = Query("ndjson", alias="format"),
+        limit: int = Query(100, ge=1, le=FILTER_PAGE_LIMIT),
+    ) -> StreamingResponse:
+        """
+        /search/filter の結果を全ページ流す (NDJSON か SSE)。最初に件数 (summary)、
+        次にページごと (page、所有状況つき)、最後に done を送る。次のページは前のページを
+        送っている間に組み立てるので、全件揃うのを待たずに表示や /download を始められる。
+        """
+        if output not in FILTER_STREAM_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"format must be one of {', '.join(FILTER_STREAM_FORMATS)}",
+            )
+        result = await run_filter(body)
+        engine: FilterEngine = app.state.filter_engine
+        chunks = [
+            result.set_ids[start : start + limit]
+            for start in range(0, len(result.set_ids), limit)
+        ]
+
+        def encode(event: dict) -> str:
+            line = json.dumps(event, ensure_ascii=False)
+            return f"data: {line}\n\n" if output == "sse" else line + "\n"
+
+        async def pages():
+            yield encode(
+                {
+                    "type": "summary",
+                    "total": len(result.set_ids),
+                    "beatmaps": result.beatmaps,
+                    "pages": len(chunks),
+                    "limit": limit,
+                    "elapsed_ms": result.elapsed_ms,
+                }
+            )
+            owned = missing = 0
+            pending = (
+                asyncio.create_task(engine.beatmapsets(chunks[0], result.table))
+                if chunks
+                else None
+            )
+            try:
+                for number in range(1, len(chunks) + 1):
+                    items = await pending
+                    pending = (
+                        asyncio.create_task(
+                            engine.beatmapsets(chunks[number], result.table)
+                        )
+                        if number < len(chunks)
+                        else None
+                    )
+                    if await request.is_disconnected():
+                        return
+                    page = filter_page(result, items, number, limit)
+                    owned += page.owned
+                    missing += len(page.missing_set_ids)
+                    yield encode({"type": "page", **page.model_dump(mode="json")})
+                yield encode(
+                    {
+                        "type": "done",
+                        "pages": len(chunks),
+                        "owned": owned,
+                        "missing": missing,
+                    }
+                )
+            finally:
+                if pending is not None:
+                    pending.cancel()
 
-        tokens = [rule_to_token(r.field, r.operator, r.value) for r in body.rules]
-        query = " ".join(tokens)
-        raw = await osu.search_beatmapsets(query, 1, 20)
+        return StreamingResponse(
+            pages(),
+            media_type="text/event-stream"
+            if output == "sse"
+            else "application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
-        beatmapsets = raw.get("beatmapsets", [])
-        results = [map_search_result(item) for item in beatmapsets]
-        return SearchResponse(
-            total=raw.get("total", len(results)),
-            page=1,
-            limit=20,
-            results=results,
+    @api.get("/search/cache")
+    async def search_cache_stats() -> dict:
+        """検索キャッシュ (メモリ / ディスク) と次ページ先読みのヒット状況を返す。"""
+        store: SearchStore | None = app.state.search_store
+        return {
+            "memory": app.state.search_cache.stats(),
+            "disk": store.stats() if store is not None else None,
+            "prefetch": app.state.search_prefetcher.stats(),
+        }
+
+    @api.delete("/search/cache")
+    async def clear_search_cache() -> dict:
+        app.state.search_cache.clear()
+        if app.state.search_store is not None:
+            await app.state.search_store.clear()
+        return await search_cache_stats()
+
+    @api.get("/catalog")
+    async def catalog_stats() -> dict:
+        """手元のカタログの件数と、スコープごとの巡回状態 (再開位置・最終完走) を返す。"""
+        crawler: CatalogCrawler | None = app.state.catalog_crawler
+        if crawler is None:
+            return {"enabled": False}
+        return {"enabled": True, **await asyncio.to_thread(crawler.stats)}
+
+    @api.post("/catalog/crawl")
+    async def catalog_crawl() -> dict:
+        crawler: CatalogCrawler | None = app.state.catalog_crawler
+        if crawler is None:
+            raise HTTPException(
+                status_code=400, detail="catalog is disabled (catalog_enabled)"
+            )
+        require_osu_client()
+        crawler.trigger()
+        return await catalog_stats()
+
+    @api.get("/osu/rate")
+    async def osu_rate_stats() -> dict:
+        """osu! API の送信ペース (残りトークン・429 での停止・優先度別の待ち件数)。"""
+        return app.state.osu_governor.stats()
+
+    @api.get("/transport/stats")
+    async def transport_stats() -> dict:
+        """接続の再利用率・ハンドシェイク数・TTFB をクライアント別に返す。"""
+        transport: HttpTransport = app.state.transport
+        # 別プロセスのエンジンは download クライアントを自前で持つ
+        clients = {**transport.stats(), **await app.state.downloader.transport_stats()}
+        return {"http2": transport.http2, "clients": clients}
+
+    @api.get("/metrics", response_class=PlainTextResponse)
+    async def metrics() -> PlainTextResponse:
+        return PlainTextResponse(
+            await app.state.downloader.metrics_text(),
+            media_type="text/plain; version=0.0.4; charset=utf-8",
         )
 
     @api.get("/queue", response_model=QueueStatus)
-    async def queue_status() -> QueueStatus:
-        return QueueStatus(**app.state.downloader.status())
+    @api.get("/queue/snapshot", response_model=QueueStatus)
+    async def queue_status(
+        status: list[str] | None = Query(None),
+        set_id: int | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        offset: int = Query(0, ge=0),
+        limit: int = Query(QUEUE_PAGE_SIZE, ge=1, le=1000),
+    ) -> QueueStatus:
+        """
+        queued / done を offset・limit でページングして返す (done は新しい順)。
+        status は複数指定可、since / until は updated_at (UNIX 秒) の範囲。
+        /queue/snapshot は SSE の差分を取りこぼしたときの再同期用 (epoch と seq 付き)。
+        """
+        return QueueStatus(
+            **await app.state.downloader.status(
+                statuses=set(status) if status else None,
+                set_id=set_id,
+                since=since,
+                until=until,
+                offset=offset,
+                limit=limit,
+            )
+        )
+
+    @api.post("/queue/pause", response_model=QueueStatus)
+    async def queue_pause(interrupt: bool = False) -> QueueStatus:
+        """キュー全体を一時停止。interrupt=true なら転送中のものも中断して戻す。"""
+        await app.state.downloader.pause(interrupt=interrupt)
+        return await queue_page()
+
+    @api.post("/queue/resume", response_model=QueueStatus)
+    async def queue_resume() -> QueueStatus:
+        await app.state.downloader.resume()
+        return await queue_page()
+
+    @api.post("/queue/{set_id}/cancel", response_model=QueueStatus)
+    async def queue_cancel(set_id: int) -> QueueStatus:
+        if not await app.state.downloader.cancel(set_id):
+            raise HTTPException(
+                status_code=409, detail="Task is not queued or downloading"
+            )
+        return await queue_page()
+
+    @api.post("/queue/{set_id}/priority", response_model=QueueStatus)
+    async def queue_priority(set_id: int, body: PriorityRequest) -> QueueStatus:
+        if not await app.state.downloader.set_priority(set_id, body.priority):
+            raise HTTPException(status_code=409, detail="Task is not queued")
+        return await queue_page()
 
     # 設定の取得/更新
     @api.get("/settings")
@@ -487,6 +1068,40 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
             "download_query_options": settings.download_query_options,
             "max_concurrency": settings.max_concurrency,
             "requests_per_minute": settings.requests_per_minute,
+            "max_retries": settings.max_retries,
+            "download_chunk_kb": settings.download_chunk_kb,
+            "write_buffer_mb": settings.write_buffer_mb,
+            "postprocess_concurrency": settings.postprocess_concurrency,
+            "download_process": settings.download_process,
+            "min_free_disk_mb": settings.min_free_disk_mb,
+            "preallocate": settings.preallocate,
+            "bandwidth_limit_kbps": settings.bandwidth_limit_kbps,
+            "per_task_limit_kbps": settings.per_task_limit_kbps,
+            "bandwidth_schedule": settings.bandwidth_schedule,
+            "schedule_policy": settings.schedule_policy,
+            "probe_sizes": settings.probe_sizes,
+            "probe_requests_per_minute": settings.probe_requests_per_minute,
+            "http_max_connections": settings.http_max_connections,
+            "http_max_keepalive": settings.http_max_keepalive,
+            "http_keepalive_expiry": settings.http_keepalive_expiry,
+            "http2": settings.http2,
+            "prewarm_connections": settings.prewarm_connections,
+            "history_limit": settings.history_limit,
+            "history_max_age_hours": settings.history_max_age_hours,
+            "history_spill": settings.history_spill,
+            "search_cache_mb": settings.search_cache_mb,
+            "search_cache_ttl": settings.search_cache_ttl,
+            "search_cache_compress": settings.search_cache_compress,
+            "search_store_mb": settings.search_store_mb,
+            "search_store_max_age_hours": settings.search_store_max_age_hours,
+            "osu_api_requests_per_minute": settings.osu_api_requests_per_minute,
+            "search_prefetch": settings.search_prefetch,
+            "search_prefetch_per_minute": settings.search_prefetch_per_minute,
+            "catalog_enabled": settings.catalog_enabled,
+            "catalog_statuses": settings.catalog_statuses,
+            "catalog_modes": settings.catalog_modes,
+            "catalog_refresh_hours": settings.catalog_refresh_hours,
+            "search_source": settings.search_source,
             "player_volume": settings.player_volume,
         }
 
@@ -500,9 +1115,53 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
             "download_query_options",
             "max_concurrency",
             "requests_per_minute",
+            "max_retries",
+            "download_chunk_kb",
+            "write_buffer_mb",
+            "postprocess_concurrency",
+            "download_process",
+            "min_free_disk_mb",
+            "preallocate",
+            "bandwidth_limit_kbps",
+            "per_task_limit_kbps",
+            "bandwidth_schedule",
+            "schedule_policy",
+            "probe_sizes",
+            "probe_requests_per_minute",
+            "http_max_connections",
+            "http_max_keepalive",
+            "http_keepalive_expiry",
+            "http2",
+            "prewarm_connections",
+            "history_limit",
+            "history_max_age_hours",
+            "history_spill",
+            "search_cache_mb",
+            "search_cache_ttl",
+            "search_cache_compress",
+            "search_store_mb",
+            "search_store_max_age_hours",
+            "osu_api_requests_per_minute",
+            "search_prefetch",
+            "search_prefetch_per_minute",
+            "catalog_enabled",
+            "catalog_statuses",
+            "catalog_modes",
+            "catalog_refresh_hours",
+            "search_source",
             "player_volume",
         }
         filtered = {k: v for k, v in payload.items() if k in allowed}
+        if filtered.get("schedule_policy", "fifo") not in SCHEDULE_POLICIES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"schedule_policy must be one of {', '.join(SCHEDULE_POLICIES)}",
+            )
+        if filtered.get("search_source", "auto") not in SEARCH_SOURCES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"search_source must be one of {', '.join(SEARCH_SOURCES)}",
+            )
         settings.persist(filtered)
 
         # songs_dir, download_url_template, max_concurrency, requests_per_minute が変更された場合のみ再構築
@@ -514,34 +1173,142 @@ def create_app(dist_dir: Path | None = None) -> FastAPI:
                 "download_query_options",
                 "max_concurrency",
                 "requests_per_minute",
+                "max_retries",
+                "download_chunk_kb",
+                "write_buffer_mb",
+                "postprocess_concurrency",
+                "download_process",
+                "min_free_disk_mb",
+                "preallocate",
+                "probe_sizes",
+                "probe_requests_per_minute",
             ]
         )
 
         # osu_client_id, osu_client_secret が変更された場合のみ再構築
-        needs_client_rebuild = any(
+        credentials_changed = any(
             key in filtered for key in ["osu_client_id", "osu_client_secret"]
         )
+        needs_client_rebuild = credentials_changed
+
+        # プール設定が変わったらクライアントを閉じ、両方とも作り直す
+        pool_changed = any(
+            key in filtered
+            for key in [
+                "http_max_connections",
+                "http_max_keepalive",
+                "http_keepalive_expiry",
+                "http2",
+            ]
+        )
+        if pool_changed:
+            needs_rebuild = needs_client_rebuild = True
+        cache_changed = any(
+            key in filtered
+            for key in [
+                "search_cache_mb",
+                "search_cache_ttl",
+                "search_cache_compress",
+            ]
+        )
+        store_changed = any(
+            key in filtered for key in ["search_store_mb", "search_store_max_age_hours"]
+        )
+        needs_client_rebuild = needs_client_rebuild or cache_changed or store_changed
+
+        # 古いクライアントの裏の再検証がキャッシュ / ストアへ書かないよう、
+        # 何かを差し替える前に 1 回だけ止める
+        if needs_client_rebuild and isinstance(app.state.osu, OsuApiClient):
+            await app.state.osu.aclose()
 
         if needs_rebuild:
+            await app.state.downloader.close()
+            if pool_changed:
+                # shutdown と同じく、使っている側を止めてからトランスポートを閉じる
+                await app.state.transport.aclose()
+                app.state.transport.configure(
+                    max_connections=settings.http_max_connections,
+                    max_keepalive_connections=settings.http_max_keepalive,
+                    keepalive_expiry=settings.http_keepalive_expiry,
+                    http2=settings.http2,
+                )
             app.state.index = SongIndex(
                 osu_db_path=settings.osu_db_path,
                 songs_dir=settings.songs_dir,
                 event_bus=app.state.event_bus,
             )
             await app.state.index.refresh()
-            app.state.downloader = DownloadManager(
-                songs_dir=settings.songs_dir,
-                url_template=settings.download_url_template,
-                query_options=settings.download_query_options,
-                max_concurrency=settings.max_concurrency,
-                requests_per_minute=settings.requests_per_minute,
-                index=app.state.index,
-                event_bus=app.state.event_bus,
-            )
-            await app.state.downloader.start_workers()
+            app.state.downloader = build_downloader()
+            await app.state.downloader.start()
+
+        # キャッシュ設定が変わったら作り直す (中身は捨てる)
+        if cache_changed:
+            app.state.search_cache = build_search_cache()
+        if store_changed:
+            if app.state.search_store is not None:
+                app.state.search_store.close()
+            app.state.search_store = build_search_store()
+        if any(
+            key in filtered for key in ["search_prefetch", "search_prefetch_per_minute"]
+        ):
+            await app.state.search_prefetcher.close()
+            app.state.search_prefetcher = build_search_prefetcher()
 
         if needs_client_rebuild:
             build_osu_client()
+        # クライアントが無い間の巡回は次の周期まで寝ているので起こす
+        if credentials_changed and app.state.catalog_crawler is not None:
+            app.state.catalog_crawler.trigger()
+
+        # カタログの範囲を変えたら、外れたセットを消して巡回し直す
+        if any(
+            key in filtered
+            for key in [
+                "catalog_enabled",
+                "catalog_statuses",
+                "catalog_modes",
+                "catalog_refresh_hours",
+            ]
+        ):
+            await close_catalog()
+            build_catalog()
+            if app.state.catalog_crawler is not None:
+                await app.state.catalog.prune(app.state.catalog_crawler.scopes)
+                app.state.catalog_crawler.start()
+
+        if "osu_api_requests_per_minute" in filtered:
+            app.state.osu_governor.configure(settings.osu_api_requests_per_minute)
+
+        if "schedule_policy" in filtered and not needs_rebuild:
+            await app.state.downloader.set_schedule_policy(settings.schedule_policy)
+
+        # 帯域制限は再構築なしで即時反映
+        if any(
+            key in filtered
+            for key in [
+                "bandwidth_limit_kbps",
+                "per_task_limit_kbps",
+                "bandwidth_schedule",
+            ]
+        ):
+            await app.state.downloader.configure_bandwidth(
+                settings.bandwidth_limit_kbps,
+                settings.per_task_limit_kbps,
+                settings.bandwidth_schedule,
+            )
+
+        if (
+            any(
+                key in filtered
+                for key in ["history_limit", "history_max_age_hours", "history_spill"]
+            )
+            and not needs_rebuild
+        ):
+            await app.state.downloader.configure_history(
+                limit=settings.history_limit,
+                max_age=settings.history_max_age_hours * 3600,
+                spill_path=history_spill_path(),
+            )
 
         return {"status": "ok"}
 
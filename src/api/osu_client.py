@@ -1,11 +1,41 @@
 import asyncio
-import json
+import logging
 import time
-from typing import Any
+from collections.abc import AsyncGenerator, Awaitable, Callable, Iterable
+from typing import Any, TypeVar
 
 import httpx
 from fastapi import HTTPException
 
+from core.metadata_cache import METADATA_LOOKUPS, MetadataCache
+from core.metrics import REGISTRY
+from core.rate_governor import (
+    REQUEST_PRIORITY,
+    Priority,
+    RateGovernor,
+    request_priority,
+)
+from core.retry import RetryPolicy, parse_retry_after
+from core.search_cache import SearchCache, canonical_key, project_search_response
+from core.search_cursor import SearchPage, walk_search
+from core.search_store import SearchStore
+from core.singleflight import SingleFlight
+
+logger = logging.getLogger("osu_sync.osu_client")
+
+T = TypeVar("T")
+
+API_LATENCY = REGISTRY.histogram(
+    "osu_sync_osu_api_request_seconds",
+    "osu! API request latency.",
+    ("endpoint",),
+)
+API_REQUESTS = REGISTRY.counter(
+    "osu_sync_osu_api_requests_total",
+    "osu! API requests by endpoint and HTTP status.",
+    ("endpoint", "status"),
+)
+
 
 class OsuApiClient:
     """
@@ -15,18 +45,58 @@ class OsuApiClient:
 
     TOKEN_URL = "https://osu.ppy.sh/oauth/token"
     SEARCH_URL = "https://osu.ppy.sh/api/v2/beatmapsets/search"
+    BEATMAPS_URL = "https://osu.ppy.sh/api/v2/beatmaps"
+    BEATMAP_LOOKUP_URL = "https://osu.ppy.sh/api/v2/beatmaps/lookup"
+    BEATMAPSET_URL = "https://osu.ppy.sh/api/v2/beatmapsets/{set_id}"
+    # /beatmaps?ids[]= は 1 回 50 件まで。まとめ引きは同時にこの本数まで
+    LOOKUP_CHUNK = 50
+    LOOKUP_CONCURRENCY = 4
+    # 429 を受けたときに待って送り直す回数と、待ってよい上限 (秒)
+    THROTTLE_RETRIES = 2
+    INTERACTIVE_THROTTLE_WAIT = 10.0
+    BACKGROUND_THROTTLE_WAIT = 300.0
+    # 裏での再検証に失敗したら、しばらくは古いキャッシュを返すだけにする
+    REVALIDATE_BACKOFF = 30.0
 
-    def __init__(self, client_id: int | None, client_secret: str | None) -> None:
+    def __init__(
+        self,
+        client_id: int | None,
+        client_secret: str | None,
+        client: httpx.AsyncClient | None = None,
+        cache: SearchCache | None = None,
+        store: SearchStore | None = None,
+        metadata: MetadataCache | None = None,
+        governor: RateGovernor | None = None,
+    ) -> None:
         if not client_id or not client_secret:
             raise ValueError("OSU_CLIENT_ID/OSU_CLIENT_SECRET が未設定です。")
         self.client_id = client_id
         self.client_secret = client_secret
         self._token: str | None = None
         self._token_exp: float = 0.0
-        self._client = httpx.AsyncClient(timeout=20, follow_redirects=True)
-        self._cache: dict[str, tuple[float, dict[str, Any]]] = {}
-        self._cache_ttl = 3600  # seconds
-        self._cache_lock = asyncio.Lock()
+        self._owns_client = client is None
+        self._client = client or httpx.AsyncClient(timeout=20, follow_redirects=True)
+        # 認証情報の変更でクライアントを作り直してもキャッシュは引き継げるよう外から渡せる
+        self.cache = cache if cache is not None else SearchCache()
+        self.store = store
+        self.metadata = metadata
+        # 作り直しても上流へのペースを引き継げるよう外から渡せる
+        self.governor = governor if governor is not None else RateGovernor()
+        self._revalidating: dict[str, asyncio.Task] = {}
+        self._revalidate_after = 0.0
+        # 同じ検索 / トークン取得が同時に来たら上流へは 1 回だけ送る
+        self._search_flight = SingleFlight("search")
+        self._token_flight = SingleFlight("token")
+
+    async def aclose(self) -> None:
+        tasks = list(self._revalidating.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._search_flight.close()
+        await self._token_flight.close()
+        if self._owns_client:
+            await self._client.aclose()
 
     async def _ensure_token(self) -> str:
         now = time.time()
@@ -34,8 +104,8 @@ class OsuApiClient:
         if self._token and now < (self._token_exp - 300):
             return self._token
 
-        print("DEBUG: Token expired or missing, getting new token...")
-        return await self._get_new_token()
+        logger.debug("osu! token expired or missing, requesting a new one")
+        return await self._token_flight.do("token", self._get_new_token)
 
     async def _get_new_token(self) -> str:
         now = time.time()
@@ -45,7 +115,7 @@ class OsuApiClient:
             "grant_type": "client_credentials",
             "scope": "public",
         }
-        resp = await self._client.post(self.TOKEN_URL, data=data)
+        resp = await self._request("token", "POST", self.TOKEN_URL, data=data)
         if resp.status_code != 200:
             raise HTTPException(
                 status_code=502,
@@ -56,8 +126,45 @@ class OsuApiClient:
         self._token_exp = now + payload.get("expires_in", 3600)
         return self._token
 
-    async def search_beatmapsets(
-        self,
+    async def _request(
+        self, endpoint: str, method: str, url: str, **kwargs: Any
+    ) -> httpx.Response:
+        """governor の許可を待ってから送る。429 は Retry-After の分だけ待って送り直す。"""
+        attempts = 0
+        while True:
+            attempts += 1
+            await self.governor.acquire()
+            started = time.perf_counter()
+            status = "error"
+            try:
+                resp = await self._client.request(method, url, **kwargs)
+                status = str(resp.status_code)
+            finally:
+                API_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+                API_REQUESTS.labels(endpoint, status).inc()
+            if resp.status_code != 429:
+                if resp.status_code < 500:
+                    self.governor.succeeded()
+                return resp
+            delay = self.governor.penalize(
+                parse_retry_after(resp.headers.get("retry-after"))
+            )
+            # UI の検索は長く待たせず 429 をそのまま返す
+            limit = (
+                self.INTERACTIVE_THROTTLE_WAIT
+                if REQUEST_PRIORITY.get() == Priority.INTERACTIVE
+                else self.BACKGROUND_THROTTLE_WAIT
+            )
+            if attempts > self.THROTTLE_RETRIES or delay > limit:
+                return resp
+            logger.warning(
+                "osu! API rate limited endpoint=%s, pausing requests for %.1fs",
+                endpoint,
+                delay,
+            )
+
+    @staticmethod
+    def _search_params(
         q: str = "",
         page: int = 1,
         limit: int = 20,
@@ -72,8 +179,7 @@ class OsuApiClient:
         played: str | None = None,
         r: str | None = None,
     ) -> dict[str, Any]:
-        token = await self._ensure_token()
-        params = {"q": q, "page": page, "limit": limit}
+        params: dict[str, Any] = {"q": q, "page": page, "limit": limit}
 
         # osu! API v2は個別パラメータ形式をサポート
         # URL短縮形パラメータを追加
@@ -97,42 +203,301 @@ class OsuApiClient:
             params["played"] = played
         if r is not None:
             params["r"] = r
+        return params
+
+    def cached(self, **kwargs: Any) -> bool:
+        """search_beatmapsets(**kwargs) がメモリキャッシュだけで返せるか。"""
+        return canonical_key(self._search_params(**kwargs)) in self.cache
+
+    async def search_beatmapsets(
+        self,
+        q: str = "",
+        page: int = 1,
+        limit: int = 20,
+        s: str | None = None,
+        m: str | None = None,
+        e: str | None = None,
+        c: str | None = None,
+        g: str | None = None,
+        l: str | None = None,  # noqa: E741
+        nsfw: bool | None = None,
+        sort: str | None = None,
+        played: str | None = None,
+        r: str | None = None,
+    ) -> dict[str, Any]:
+        params = self._search_params(
+            q, page, limit, s, m, e, c, g, l, nsfw, sort, played, r
+        )
 
-        # build cache key
-        key = json.dumps(params, sort_keys=True, ensure_ascii=False)
+        # 表記揺れだけ違う検索は同じキーにまとめる
+        key = canonical_key(params)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
 
-        # serve from cache if fresh
-        async with self._cache_lock:
-            cached = self._cache.get(key)
-            if cached:
-                exp, data = cached
-                if time.time() < exp:
-                    print("DEBUG: Serving from cache")
+        if self.store is not None:
+            stored = await self.store.get(key)
+            if stored is not None:
+                stored_at, data = stored
+                remaining = self.cache.ttl - (time.time() - stored_at)
+                if remaining > 0:
+                    self.store.record("fresh")
+                    self.cache.put(key, data, ttl=remaining)
                     return data
-                else:
-                    self._cache.pop(key, None)
+                # 古いものはすぐ返し、裏で取り直す (API に届かなくても返せる)
+                self.store.record("stale")
+                self._revalidate(key, params)
+                return data
+            self.store.record("miss")
 
-        headers = {"Authorization": f"Bearer {token}"}
+        return await self._fetch_search(key, params)
 
-        # デバッグ: 実際に送信しているURLをログ出力
-        import urllib.parse
+    async def _fetch_search(self, key: str, params: dict[str, Any]) -> dict[str, Any]:
+        return await self._search_flight.do(
+            key, lambda: self._fetch_search_once(key, params)
+        )
 
-        query_string = urllib.parse.urlencode(params)
-        full_url = f"{self.SEARCH_URL}?{query_string}"
-        print(f"DEBUG: Sending request to: {full_url}")
+    def _revalidate(self, key: str, params: dict[str, Any]) -> None:
+        if key in self._revalidating or time.time() < self._revalidate_after:
+            return
+        with request_priority(Priority.PREFETCH):
+            task = asyncio.create_task(self._fetch_search(key, params))
+        self._revalidating[key] = task
+        task.add_done_callback(lambda t: self._revalidated(key, t))
 
-        resp = await self._client.get(self.SEARCH_URL, params=params, headers=headers)
-        print(f"DEBUG: Response status: {resp.status_code}")
+    def _revalidated(self, key: str, task: asyncio.Task) -> None:
+        self._revalidating.pop(key, None)
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            self._revalidate_after = time.time() + self.REVALIDATE_BACKOFF
+            logger.warning(
+                "Search revalidation failed, serving stale results: %s",
+                getattr(exc, "detail", None) or exc,
+            )
 
+    async def _fetch_search_once(
+        self, key: str, params: dict[str, Any]
+    ) -> dict[str, Any]:
+        raw = await self._search_raw(params)
+        # キャッシュには使う項目だけを持ち、ヒット時と同じ形で返す
+        result = project_search_response(raw)
+        self.cache.put(key, result)
+        if self.store is not None:
+            await self.store.put(key, result)
+        return result
+
+    def iter_search(
+        self,
+        q: str = "",
+        limit: int = 50,
+        s: str | None = None,
+        m: str | None = None,
+        e: str | None = None,
+        c: str | None = None,
+        g: str | None = None,
+        l: str | None = None,  # noqa: E741
+        nsfw: bool | None = None,
+        sort: str | None = None,
+        played: str | None = None,
+        r: str | None = None,
+        cursor: str | None = None,
+        window: int = 2,
+        retry: RetryPolicy | None = None,
+        raw: bool = False,
+    ) -> AsyncGenerator[SearchPage, None]:
+        """
+        検索結果を cursor_string で最後まで辿る (page 番号より深いページでも速く、ずれない)。
+        一括同期のように一度しか読まないページなのでキャッシュは通さない。
+        一時的な失敗 (接続断 / 429 / 5xx) は retry に従ってやり直す。
+        """
+        params = self._search_params(
+            q, 1, limit, s, m, e, c, g, l, nsfw, sort, played, r
+        )
+        del params["page"]
+        policy = retry or RetryPolicy(max_retries=3, base_delay=1.0, max_delay=30.0)
+
+        async def fetch(query: dict[str, Any]) -> dict[str, Any]:
+            with request_priority(Priority.BULK):
+                return await self._search_raw(query, policy)
+
+        return walk_search(fetch, params, cursor, window, raw=raw)
+
+    async def get_beatmaps(self, ids: Iterable[int]) -> dict[int, dict[str, Any]]:
+        """
+        beatmap id から譜面情報をまとめて引く (見つからない id は含めない)。
+        キャッシュに無い分だけ /beatmaps を LOOKUP_CHUNK 件ずつ、並列数を絞って叩く。
+        """
+        wanted = list(dict.fromkeys(ids))
+        found, todo = await self._cached_lookup("beatmap", wanted)
+        responses = await self._gather_bounded(
+            [
+                lambda chunk=chunk: self._get_json(
+                    "beatmaps",
+                    self.BEATMAPS_URL,
+                    params=[("ids[]", beatmap_id) for beatmap_id in chunk],
+                )
+                for chunk in _chunks(todo, self.LOOKUP_CHUNK)
+            ]
+        )
+        fetched = [bm for resp in responses if resp for bm in resp.get("beatmaps", [])]
+        await self._store_lookup("beatmap", todo, {bm["id"]: bm for bm in fetched})
+        found.update({bm["id"]: bm for bm in fetched})
+        return found
+
+    async def lookup_checksums(
+        self, checksums: Iterable[str]
+    ) -> dict[str, dict[str, Any]]:
+        """
+        譜面の MD5 (osu!.db / .osu の checksum) から譜面情報を引く。
+        上流に一括 API は無いので 1 件ずつだが、キャッシュと並列数の上限を通す。
+        """
+        wanted = list(dict.fromkeys(c.lower() for c in checksums))
+        found, todo = await self._cached_lookup("checksum", wanted)
+        responses = await self._gather_bounded(
+            [
+                lambda checksum=checksum: self._get_json(
+                    "beatmap_lookup",
+                    self.BEATMAP_LOOKUP_URL,
+                    params={"checksum": checksum},
+                )
+                for checksum in todo
+            ]
+        )
+        fetched = {
+            checksum: bm
+            for checksum, bm in zip(todo, responses, strict=True)
+            if bm is not None
+        }
+        await self._store_lookup("checksum", todo, fetched)
+        found.update(fetched)
+        return found
+
+    async def get_beatmapsets(
+        self, set_ids: Iterable[int]
+    ) -> dict[int, dict[str, Any]]:
+        """beatmapset id からセット情報 (全難易度を含む) をまとめて引く。"""
+        wanted = list(dict.fromkeys(set_ids))
+        found, todo = await self._cached_lookup("beatmapset", wanted)
+        responses = await self._gather_bounded(
+            [
+                lambda set_id=set_id: self._get_json(
+                    "beatmapset", self.BEATMAPSET_URL.format(set_id=set_id)
+                )
+                for set_id in todo
+            ]
+        )
+        fetched = {bs["id"]: bs for bs in responses if bs is not None}
+        await self._store_lookup("beatmapset", todo, fetched)
+        found.update(fetched)
+        return found
+
+    async def _cached_lookup(self, kind: str, keys: list) -> tuple[dict, list]:
+        """(キャッシュにあったもの, 上流に問い合わせるキー) を返す。"""
+        if self.metadata is None or not keys:
+            return {}, keys
+        loader = {
+            "beatmap": self.metadata.beatmaps,
+            "checksum": self.metadata.checksums,
+            "beatmapset": self.metadata.beatmapsets,
+        }[kind]
+        found, missing = await loader(keys)
+        METADATA_LOOKUPS.labels(kind, "cached").inc(len(found) + len(missing))
+        return found, [k for k in keys if k not in found and k not in missing]
+
+    async def _store_lookup(self, kind: str, requested: list, fetched: dict) -> None:
+        missing = [k for k in requested if k not in fetched]
+        METADATA_LOOKUPS.labels(kind, "fetched").inc(len(fetched))
+        METADATA_LOOKUPS.labels(kind, "missing").inc(len(missing))
+        if self.metadata is None:
+            return
+        if kind == "beatmapset":
+            await self.metadata.put_beatmapsets(list(fetched.values()))
+            # セットに含まれる難易度も id / checksum で引けるようにしておく
+            await self.metadata.put_beatmaps(
+                [
+                    {"beatmapset_id": bs["id"], **bm}
+                    for bs in fetched.values()
+                    for bm in bs.get("beatmaps") or []
+                ]
+            )
+        else:
+            await self.metadata.put_beatmaps(list(fetched.values()))
+        if missing:
+            await self.metadata.mark_missing(kind, missing)
+
+    async def _gather_bounded(self, calls: list[Callable[[], Awaitable[T]]]) -> list[T]:
+        semaphore = asyncio.Semaphore(self.LOOKUP_CONCURRENCY)
+
+        async def run(call: Callable[[], Awaitable[T]]) -> T:
+            async with semaphore:
+                return await call()
+
+        # まとめ引きは UI の検索より後回しにする
+        with request_priority(Priority.BULK):
+            return await asyncio.gather(*(run(call) for call in calls))
+
+    async def _get_json(
+        self, endpoint: str, url: str, params: Any = None
+    ) -> dict[str, Any] | None:
+        """GET して JSON を返す。404 は None。"""
+        token = await self._ensure_token()
+        resp = await self._request(
+            endpoint,
+            "GET",
+            url,
+            params=params,
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        if resp.status_code == 404:
+            return None
         if resp.status_code != 200:
             raise HTTPException(
                 status_code=resp.status_code,
                 detail=f"osu! API error: {resp.status_code} {resp.text}",
             )
+        return resp.json()
 
-        result = resp.json()
-        print(f"DEBUG: Response total: {result.get('total', 'unknown')}")
-        # store to cache
-        async with self._cache_lock:
-            self._cache[key] = (time.time() + self._cache_ttl, result)
-        return result
+    async def _search_raw(
+        self, params: dict[str, Any], retry: RetryPolicy | None = None
+    ) -> dict[str, Any]:
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return await self._search_raw_once(params)
+            except (httpx.TransportError, HTTPException) as exc:
+                status = getattr(exc, "status_code", None)
+                transient = status is None or status == 429 or status >= 500
+                if retry is None or not transient or attempts > retry.max_retries:
+                    raise
+                delay = retry.next_delay(attempts)
+                logger.warning(
+                    "Search request failed (%s), retrying in %.1fs attempt=%s",
+                    status or type(exc).__name__,
+                    delay,
+                    attempts,
+                )
+                await asyncio.sleep(delay)
+
+    async def _search_raw_once(self, params: dict[str, Any]) -> dict[str, Any]:
+        token = await self._ensure_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        resp = await self._request(
+            "search", "GET", self.SEARCH_URL, params=params, headers=headers
+        )
+        logger.debug("osu! search url=%s status=%s", resp.request.url, resp.status_code)
+        if resp.status_code != 200:
+            raise HTTPException(
+                status_code=resp.status_code,
+                detail=f"osu! API error: {resp.status_code} {resp.text}",
+            )
+
+        raw = resp.json()
+        logger.debug("osu! search total=%s", raw.get("total"))
+        return raw
+
+
+def _chunks(values: list[T], size: int) -> list[list[T]]:
+    return [values[start : start + size] for start in range(0, len(values), size)]
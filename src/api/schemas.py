@@ -1,6 +1,7 @@
 from enum import Enum
+from typing import Any
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class BeatmapStatus(str, Enum):
@@ -48,16 +49,34 @@ class SearchResponse(BaseModel):
     results: list[SearchResult]
 
 
+class FilterResponse(SearchResponse):
+    """/search/filter の 1 ページ。owned / missing_set_ids はこのページの分。"""
+
+    beatmaps: int  # 条件に当てはまった難易度の数 (全ページ)
+    owned: int
+    missing_set_ids: list[int]  # そのまま /download に渡せる
+
+
 class DownloadRequest(BaseModel):
     set_ids: list[int]
     metadata: dict[int, dict[str, str]] | None = (
         None  # set_id -> {artist, title, artist_unicode, title_unicode}
     )
+    priority: int = 0  # 大きいほど先に DL される
+
+
+class LookupRequest(BaseModel):
+    """譜面 / セット情報のまとめ引き。キャッシュに無い分だけ osu! API に問い合わせる。"""
+
+    beatmap_ids: list[int] = Field(default_factory=list, max_length=5000)
+    checksums: list[str] = Field(default_factory=list, max_length=5000)
+    set_ids: list[int] = Field(default_factory=list, max_length=5000)
 
 
 class QueueEntry(BaseModel):
     set_id: int
     status: str
+    priority: int = 0
     message: str | None = None
     path: str | None = None
     archive_path: str | None = None
@@ -69,14 +88,73 @@ class QueueEntry(BaseModel):
     progress: float | None = None
     bytes_downloaded: int = 0
     total_bytes: int | None = None
+    expected_bytes: int | None = None
     speed_bps: float | None = None
     updated_at: float | None = None
+    attempts: int = 0
+    last_error: str | None = None
+    error_kind: str | None = None
+    next_retry_at: float | None = None
 
 
 class QueueStatus(BaseModel):
+    epoch: str | None = None
+    seq: int = 0  # この状態に反映済みの最後の差分イベント番号
     queued: list[QueueEntry]
     running: list[QueueEntry]
     done: list[QueueEntry]
+    queued_total: int = 0  # ページング前の件数
+    done_total: int = 0
+    paused: bool = False
+    schedule_policy: str = "fifo"
+    estimated_total_bytes: int | None = None  # 待機中 + 実行中の残りバイト数
+    unknown_size_count: int = 0
+    eta_seconds: float | None = None
+
+
+class SyncPlanRequest(BaseModel):
+    """/search と同じ検索条件。一致する全ページの未所有セットを DL キューに積む。"""
+
+    q: str = ""
+    s: str | None = None  # status
+    m: str | None = None  # mode
+    e: str | None = None
+    c: str | None = None
+    g: str | None = None
+    l: str | None = None  # noqa: E741
+    nsfw: bool | None = None
+    sort: str | None = None
+    played: str | None = None
+    rank: str | None = None
+    page_size: int = Field(50, ge=1, le=50)
+    priority: int = 0
+    dry_run: bool = False  # True なら積まずに件数と容量の見積もりだけ返す
+    cursor: str | None = None  # 止まった計画の cursor を渡すと続きから辿る
+
+
+class SyncPlanStatus(BaseModel):
+    plan_id: str
+    params: dict[str, Any]
+    priority: int = 0
+    dry_run: bool = False
+    state: str
+    total: int | None = None
+    pages: int = 0
+    scanned: int = 0
+    owned: int = 0
+    already_queued: int = 0
+    enqueued: int = 0
+    missing: int = 0
+    estimated_bytes: int = 0
+    estimate_source: str | None = None
+    cursor: str | None = None
+    error: str | None = None
+    started_at: float
+    finished_at: float | None = None
+
+
+class PriorityRequest(BaseModel):
+    priority: int
 
 
 class IndexSummary(BaseModel):
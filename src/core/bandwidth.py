@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+logger = logging.getLogger("osu_sync.bandwidth")
+
+
+class TokenBucket:
+    """
+    バイト単位のトークンバケット。残高をマイナスまで借りられる方式なので
+    consume は O(1) で、不足分だけ sleep する。rate <= 0 は無制限。
+    """
+
+    def __init__(self, rate: float = 0.0, burst: float | None = None) -> None:
+        self.rate = 0.0
+        self.burst = 0.0
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.configure(rate, burst)
+
+    def configure(self, rate: float, burst: float | None = None) -> None:
+        self.rate = max(0.0, float(rate))
+        # 既定のバースト幅は 0.5 秒分 (最低 64KB)
+        self.burst = burst if burst is not None else max(64 * 1024, self.rate / 2)
+        self._tokens = min(self._tokens, self.burst)
+        self._updated = time.monotonic()
+
+    async def consume(self, amount: int) -> None:
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= amount
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate)
+
+
+@dataclass
+class ScheduleRule:
+    """start <= 時刻 < end の間だけ limit_kbps を適用する (日付またぎ可)。"""
+
+    start: str  # "HH:MM"
+    end: str  # "HH:MM"
+    limit_kbps: int  # 0 = 無制限
+
+    def active_at(self, minute_of_day: int) -> bool:
+        start, end = _parse_hhmm(self.start), _parse_hhmm(self.end)
+        if start <= end:
+            return start <= minute_of_day < end
+        return minute_of_day >= start or minute_of_day < end
+
+
+def _parse_hhmm(value: str) -> int:
+    hours, _, minutes = value.partition(":")
+    return (int(hours) % 24) * 60 + int(minutes or 0) % 60
+
+
+class BandwidthLimiter:
+    """
+    DownloadManager 全体の帯域制限。全ストリーム共通のバケットと、
+    タスクごとの上限 (per_task_kbps) を持つ。スケジュールは 1 秒ごとに評価する。
+    """
+
+    SCHEDULE_CHECK_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        limit_kbps: int = 0,
+        per_task_kbps: int = 0,
+        schedule: list[ScheduleRule] | None = None,
+    ) -> None:
+        self._global = TokenBucket()
+        self._base_kbps = 0
+        self.per_task_kbps = 0
+        self.schedule: list[ScheduleRule] = []
+        self._effective_kbps = 0
+        self._next_check = 0.0
+        self.configure(limit_kbps, per_task_kbps, schedule)
+
+    @property
+    def effective_kbps(self) -> int:
+        return self._effective_kbps
+
+    def configure(
+        self,
+        limit_kbps: int | None = None,
+        per_task_kbps: int | None = None,
+        schedule: list[ScheduleRule] | None = None,
+    ) -> None:
+        """実行中でも呼べる。None の項目は現状維持。"""
+        if limit_kbps is not None:
+            self._base_kbps = max(0, int(limit_kbps))
+        if per_task_kbps is not None:
+            self.per_task_kbps = max(0, int(per_task_kbps))
+        if schedule is not None:
+            self.schedule = list(schedule)
+        self._next_check = 0.0
+        self._refresh(time.monotonic())
+
+    def task_bucket(self) -> TokenBucket | None:
+        if self.per_task_kbps <= 0:
+            return None
+        return TokenBucket(self.per_task_kbps * 1024)
+
+    async def throttle(self, amount: int, task_bucket: TokenBucket | None) -> None:
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._refresh(now)
+        if self._global.rate > 0:
+            await self._global.consume(amount)
+        if task_bucket is not None:
+            await task_bucket.consume(amount)
+
+    def _refresh(self, now: float) -> None:
+        self._next_check = now + self.SCHEDULE_CHECK_INTERVAL
+        limit = self._base_kbps
+        if self.schedule:
+            wall = datetime.now()
+            minute_of_day = wall.hour * 60 + wall.minute
+            for rule in self.schedule:
+                if rule.active_at(minute_of_day):
+                    limit = max(0, rule.limit_kbps)
+                    break
+        if limit != self._effective_kbps:
+            logger.info(
+                "Bandwidth limit changed %s -> %s KB/s", self._effective_kbps, limit
+            )
+            self._effective_kbps = limit
+            self._global.configure(limit * 1024)
+
+    @staticmethod
+    def parse_schedule(raw: object) -> list[ScheduleRule]:
+        """設定ファイルの [{"start", "end", "limit_kbps"}, ...] を読み込む。"""
+        rules: list[ScheduleRule] = []
+        if not isinstance(raw, list):
+            return rules
+        for item in raw:
+            try:
+                rule = ScheduleRule(
+                    start=str(item["start"]),
+                    end=str(item["end"]),
+                    limit_kbps=int(item.get("limit_kbps", 0)),
+                )
+                rule.active_at(0)  # 形式チェック
+            except (KeyError, TypeError, ValueError, AttributeError):
+                logger.warning("Ignoring invalid bandwidth schedule entry: %r", item)
+                continue
+            rules.append(rule)
+        return rules
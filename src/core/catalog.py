@@ -0,0 +1,866 @@
+import asyncio
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from core.metrics import REGISTRY
+from core.search_cache import project_beatmapset
+
+logger = logging.getLogger("osu_sync.catalog")
+
+CATALOG_SETS = REGISTRY.gauge(
+    "osu_sync_catalog_beatmapsets", "Beatmapsets held in the local catalog."
+)
+CATALOG_CRAWLED = REGISTRY.counter(
+    "osu_sync_catalog_crawled_total",
+    "Beatmapsets written to the local catalog by the crawler.",
+    ("scope",),
+)
+
+MODES = ("osu", "taiko", "fruits", "mania")
+
+# 検索 API の s= と、それに含まれる譜面の status
+STATUS_GROUPS: dict[str, frozenset[str]] = {
+    "ranked": frozenset({"ranked", "approved"}),
+    "qualified": frozenset({"qualified"}),
+    "loved": frozenset({"loved"}),
+    "pending": frozenset({"pending", "wip"}),
+    "graveyard": frozenset({"graveyard"}),
+}
+STATUS_GROUPS["leaderboard"] = (
+    STATUS_GROUPS["ranked"] | STATUS_GROUPS["qualified"] | STATUS_GROUPS["loved"]
+)
+STATUS_GROUPS["any"] = frozenset().union(
+    *(STATUS_GROUPS[s] for s in ("leaderboard", "pending", "graveyard"))
+)
+# 巡回できる (s= に 1 つだけ指定できる) 単位
+CRAWL_STATUSES = ("ranked", "qualified", "loved", "pending", "graveyard")
+# 日数が経つだけで抜けていく (last_updated は動かない) ので、差分ではなく毎回全部辿る
+VOLATILE_STATUSES = frozenset({"qualified"})
+
+# sort=<field>_<asc|desc> → 列
+_SORT_COLUMNS = {
+    "title": "title COLLATE NOCASE",
+    "artist": "artist COLLATE NOCASE",
+    "creator": "creator COLLATE NOCASE",
+    "difficulty": "min_rating",
+    "ranked": "ranked_date",
+    "updated": "last_updated",
+    "plays": "play_count",
+    "favourites": "favourite_count",
+}
+# ローカル検索で扱える検索パラメータ
+LOCAL_PARAMS = frozenset({"q", "page", "limit", "s", "m", "nsfw", "sort"})
+# q の中の osu! の絞り込み構文 (stars>5 / artist=foo / status=loved など)
+_QUERY_FILTER = re.compile(r"(?:^|\s)\w+(?:[<>]=?|!?=|:)", re.ASCII)
+# ranked 以外も含めた詳細な数値 (フィルタエンジン用)
+_BEATMAP_COLUMNS = (
+    "id",
+    "beatmapset_id",
+    "mode",
+    "difficulty_rating",
+    "total_length",
+    "bpm",
+    "cs",
+    "ar",
+    "od",
+    "hp",
+    "max_combo",
+    "checksum",
+    "version",
+)
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS beatmapsets (
+        id INTEGER PRIMARY KEY,
+        status TEXT NOT NULL,
+        artist TEXT,
+        artist_unicode TEXT,
+        title TEXT,
+        title_unicode TEXT,
+        creator TEXT,
+        ranked_date TEXT,
+        last_updated TEXT,
+        play_count INTEGER,
+        favourite_count INTEGER,
+        bpm REAL,
+        nsfw INTEGER NOT NULL DEFAULT 0,
+        modes INTEGER NOT NULL DEFAULT 0,
+        min_rating REAL,
+        max_rating REAL,
+        max_length INTEGER,
+        crawled_at REAL NOT NULL,
+        body BLOB NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS beatmapsets_status ON beatmapsets (status)",
+    "CREATE INDEX IF NOT EXISTS beatmapsets_ranked ON beatmapsets (ranked_date)",
+    "CREATE INDEX IF NOT EXISTS beatmapsets_updated ON beatmapsets (last_updated)",
+    """
+    CREATE TABLE IF NOT EXISTS beatmaps (
+        id INTEGER PRIMARY KEY,
+        beatmapset_id INTEGER NOT NULL,
+        mode INTEGER,
+        difficulty_rating REAL,
+        total_length INTEGER,
+        bpm REAL,
+        cs REAL,
+        ar REAL,
+        od REAL,
+        hp REAL,
+        max_combo INTEGER,
+        checksum TEXT,
+        version TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS beatmaps_set ON beatmaps (beatmapset_id)",
+    # スコープごとの巡回状態。cursor は途中で止まった巡回の再開位置、
+    # high_water は最後に完走した巡回が見た最新の last_updated、
+    # full_pass_at は最後に差分でなく最後まで辿り終えた時刻
+    """
+    CREATE TABLE IF NOT EXISTS crawl_state (
+        scope TEXT PRIMARY KEY,
+        cursor TEXT,
+        pass_high_water TEXT,
+        high_water TEXT,
+        pages INTEGER NOT NULL DEFAULT 0,
+        sets INTEGER NOT NULL DEFAULT 0,
+        started_at REAL,
+        completed_at REAL,
+        full_pass_at REAL,
+        error TEXT
+    )
+    """,
+)
+# 既存の DB に後から足した列
+_ADDED_COLUMNS = (("crawl_state", "full_pass_at", "REAL"),)
+# 3 文字以上の部分一致は trigram の全文検索、それ未満は LIKE で探す
+_FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS beatmapsets_fts USING fts5("
+    "artist, artist_unicode, title, title_unicode, creator, source, tags,"
+    " tokenize='trigram')"
+)
+# filter_rows の列。先頭は scanner.LIBRARY_COLUMNS と揃えてある
+FILTER_COLUMNS = (
+    "beatmap_id",
+    "set_id",
+    "mode",
+    "stars",
+    "length",
+    "bpm",
+    "cs",
+    "ar",
+    "od",
+    "hp",
+    "status",
+    "version",
+    "source",
+    "tags",
+    "artist",
+    "title",
+    "creator",
+    "plays",
+    "favourites",
+    "ranked",
+)
+_LIKE_COLUMNS = ("artist", "artist_unicode", "title", "title_unicode", "creator")
+
+
+@dataclass(frozen=True)
+class CatalogScope:
+    """巡回の単位。status は s= の値、mode は None なら全モード。"""
+
+    status: str
+    mode: int | None = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.status}:{'any' if self.mode is None else MODES[self.mode]}"
+
+    def params(self) -> dict[str, Any]:
+        params: dict[str, Any] = {"s": self.status, "sort": "updated_desc"}
+        if self.mode is not None:
+            params["m"] = str(self.mode)
+        return params
+
+    @staticmethod
+    def from_settings(
+        statuses: Iterable[str], modes: Iterable[int]
+    ) -> list["CatalogScope"]:
+        mode_list = [int(m) for m in modes if 0 <= int(m) < len(MODES)] or [None]
+        return [
+            CatalogScope(status, mode)
+            for status in dict.fromkeys(statuses)
+            if status in CRAWL_STATUSES
+            for mode in mode_list
+        ]
+
+
+def has_query_filters(q: str | None) -> bool:
+    """q に key<op>value の絞り込みが入っているか (カタログでは解釈できない)。"""
+    return bool(q and _QUERY_FILTER.search(q))
+
+
+def same_order_as_api(q: str | None, sort: str | None) -> bool:
+    """カタログの並びが API と同じになるか。"""
+    if sort:
+        return sort.rpartition("_")[0] in _SORT_COLUMNS
+    # 並びの指定が無いと API は q があれば relevance 順 (カタログでは再現できない)
+    return not (q or "").strip()
+
+
+def _scope_clause(scope: CatalogScope) -> tuple[str, list[Any]]:
+    """スコープに入るセットの WHERE 句と引数。"""
+    statuses = sorted(STATUS_GROUPS[scope.status])
+    clause = f"status IN ({','.join('?' * len(statuses))})"
+    args: list[Any] = list(statuses)
+    if scope.mode is not None:
+        clause += " AND (modes & ?) != 0"
+        args.append(1 << scope.mode)
+    return clause, args
+
+
+def _mode_mask(beatmaps: list[dict[str, Any]]) -> int:
+    mask = 0
+    for bm in beatmaps:
+        mode = bm.get("mode_int")
+        if mode is None and bm.get("mode") in MODES:
+            mode = MODES.index(bm["mode"])
+        if isinstance(mode, int):
+            mask |= 1 << mode
+    return mask
+
+
+class Catalog:
+    """
+    osu! の beatmapset を手元に持つ SQLite カタログ。検索 API と同じ形の結果をローカルで返す。
+    セットは表示用に絞った JSON と、並べ替え / 絞り込み用の列を持つ。
+    難易度ごとの数値 (cs / ar / od / hp など) は beatmaps テーブルに分けて持つ。
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self.fts = False
+        # 書き込むたびに増える。フィルタエンジンが列データを作り直す目印
+        self.revision = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = self._connect()
+        CATALOG_SETS.set_function(self.count)
+
+    def _connect(self) -> sqlite3.Connection:
+        try:
+            return self._open()
+        except sqlite3.DatabaseError:
+            logger.warning("Catalog database is corrupt, recreating %s", self.path)
+            self.path.unlink(missing_ok=True)
+            return self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        for table, column, kind in _ADDED_COLUMNS:
+            names = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in names:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+        try:
+            conn.execute(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # trigram が無い古い SQLite では LIKE だけで探す
+            logger.warning("SQLite trigram tokenizer unavailable, using LIKE")
+        return conn
+
+    def close(self) -> None:
+        CATALOG_SETS.set_function(None)
+        with self._lock:
+            self._conn.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM beatmapsets").fetchone()[0]
+
+    # --- 書き込み -------------------------------------------------------
+
+    async def upsert(self, beatmapsets: list[dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._upsert_sync, beatmapsets)
+
+    def _upsert_sync(self, beatmapsets: list[dict[str, Any]]) -> None:
+        now = time.time()
+        sets, maps, fts, ids = [], [], [], []
+        for item in beatmapsets:
+            set_id = item.get("id")
+            if not isinstance(set_id, int):
+                continue
+            beatmaps = item.get("beatmaps") or []
+            ratings = [bm.get("difficulty_rating") or 0 for bm in beatmaps]
+            body = json.dumps(
+                project_beatmapset(item), ensure_ascii=False, separators=(",", ":")
+            ).encode()
+            ids.append(set_id)
+            sets.append(
+                (
+                    set_id,
+                    item.get("status") or "",
+                    item.get("artist"),
+                    item.get("artist_unicode"),
+                    item.get("title"),
+                    item.get("title_unicode"),
+                    item.get("creator"),
+                    item.get("ranked_date"),
+                    item.get("last_updated"),
+                    item.get("play_count"),
+                    item.get("favourite_count"),
+                    item.get("bpm"),
+                    int(bool(item.get("nsfw"))),
+                    _mode_mask(beatmaps),
+                    min(ratings, default=None),
+                    max(ratings, default=None),
+                    max((bm.get("total_length") or 0 for bm in beatmaps), default=None),
+                    now,
+                    zlib.compress(body, 6),
+                )
+            )
+            for bm in beatmaps:
+                if not isinstance(bm.get("id"), int):
+                    continue
+                mode = bm.get("mode_int")
+                if mode is None and bm.get("mode") in MODES:
+                    mode = MODES.index(bm["mode"])
+                maps.append(
+                    (
+                        bm["id"],
+                        set_id,
+                        mode,
+                        bm.get("difficulty_rating"),
+                        bm.get("total_length"),
+                        bm.get("bpm"),
+                        bm.get("cs"),
+                        bm.get("ar"),
+                        bm.get("accuracy"),
+                        bm.get("drain"),
+                        bm.get("max_combo"),
+                        bm.get("checksum"),
+                        bm.get("version"),
+                    )
+                )
+            fts.append(
+                (
+                    set_id,
+                    *(
+                        item.get(key) or ""
+                        for key in (
+                            "artist",
+                            "artist_unicode",
+                            "title",
+                            "title_unicode",
+                            "creator",
+                            "source",
+                            "tags",
+                        )
+                    ),
+                )
+            )
+        if not sets:
+            return
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO beatmapsets VALUES"
+                    " (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    sets,
+                )
+                # 難易度の削除にも追従できるよう、セット単位で入れ替える
+                self._conn.execute(
+                    f"DELETE FROM beatmaps WHERE beatmapset_id IN ({marks})", ids
+                )
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO beatmaps ({', '.join(_BEATMAP_COLUMNS)})"
+                    f" VALUES ({','.join('?' * len(_BEATMAP_COLUMNS))})",
+                    maps,
+                )
+                if self.fts:
+                    self._conn.execute(
+                        f"DELETE FROM beatmapsets_fts WHERE rowid IN ({marks})", ids
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO beatmapsets_fts (rowid, artist, artist_unicode,"
+                        " title, title_unicode, creator, source, tags)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        fts,
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.revision += 1
+
+    async def prune(self, scopes: list[CatalogScope]) -> int:
+        """どのスコープにも入らないセットを消す (スコープを狭めたとき用)。"""
+        return await asyncio.to_thread(self._prune_sync, scopes)
+
+    def _prune_sync(self, scopes: list[CatalogScope]) -> int:
+        keep: list[str] = []
+        args: list[Any] = []
+        for scope in scopes:
+            clause, scope_args = _scope_clause(scope)
+            keep.append(f"({clause})")
+            args += scope_args
+        where = f"NOT ({' OR '.join(keep)})" if keep else "1"
+        with self._lock:
+            ids = [
+                row[0]
+                for row in self._conn.execute(
+                    f"SELECT id FROM beatmapsets WHERE {where}", args
+                )
+            ]
+            self._delete_locked(ids)
+        return len(ids)
+
+    async def unseen(self, scope: CatalogScope, since: float) -> list[int]:
+        """スコープ内にあって since 以降の巡回で書かれていないセット。"""
+        return await asyncio.to_thread(self._unseen_sync, scope, since)
+
+    def _unseen_sync(self, scope: CatalogScope, since: float) -> list[int]:
+        clause, args = _scope_clause(scope)
+        with self._lock:
+            return [
+                row[0]
+                for row in self._conn.execute(
+                    f"SELECT id FROM beatmapsets WHERE {clause} AND crawled_at < ?",
+                    [*args, since],
+                )
+            ]
+
+    async def delete(self, set_ids: list[int]) -> None:
+        await asyncio.to_thread(self._delete_sync, set_ids)
+
+    def _delete_sync(self, set_ids: list[int]) -> None:
+        with self._lock:
+            self._delete_locked(set_ids)
+
+    def _delete_locked(self, ids: list[int]) -> None:
+        self._conn.execute("BEGIN")
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            marks = ",".join("?" * len(chunk))
+            self._conn.execute(f"DELETE FROM beatmapsets WHERE id IN ({marks})", chunk)
+            self._conn.execute(
+                f"DELETE FROM beatmaps WHERE beatmapset_id IN ({marks})", chunk
+            )
+            if self.fts:
+                self._conn.execute(
+                    f"DELETE FROM beatmapsets_fts WHERE rowid IN ({marks})", chunk
+                )
+        self._conn.execute("COMMIT")
+        if ids:
+            self.revision += 1
+
+    # --- 巡回状態 -------------------------------------------------------
+
+    async def crawl_state(self, scope: str) -> dict[str, Any]:
+        return await asyncio.to_thread(self._crawl_state_sync, scope)
+
+    def _crawl_state_sync(self, scope: str) -> dict[str, Any]:
+        with self._lock:
+            return self._read_crawl_state(scope)
+
+    def _read_crawl_state(self, scope: str) -> dict[str, Any]:
+        cur = self._conn.execute("SELECT * FROM crawl_state WHERE scope = ?", (scope,))
+        row = cur.fetchone()
+        if row is None:
+            return {"scope": scope}
+        return dict(zip([c[0] for c in cur.description], row, strict=True))
+
+    async def save_crawl_state(self, scope: str, **fields: Any) -> None:
+        await asyncio.to_thread(self._save_crawl_state_sync, scope, fields)
+
+    def _save_crawl_state_sync(self, scope: str, fields: dict[str, Any]) -> None:
+        with self._lock:
+            state = {**self._read_crawl_state(scope), **fields, "scope": scope}
+            columns = list(state)
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO crawl_state ({', '.join(columns)})"
+                f" VALUES ({','.join('?' * len(columns))})",
+                [state[c] for c in columns],
+            )
+
+    def crawl_states(self) -> list[dict[str, Any]]:
+        with self._lock:
+            cur = self._conn.execute("SELECT * FROM crawl_state ORDER BY scope")
+            names = [c[0] for c in cur.description]
+            return [dict(zip(names, row, strict=True)) for row in cur.fetchall()]
+
+    async def covers(
+        self, scopes: list[CatalogScope], s: str | None, m: int | None
+    ) -> bool:
+        """(s, m) の検索結果をカタログだけで全部出せるか (該当スコープが完走済みか)。"""
+        return await asyncio.to_thread(self._covers_sync, scopes, s, m)
+
+    def _covers_sync(
+        self, scopes: list[CatalogScope], s: str | None, m: int | None
+    ) -> bool:
+        wanted = STATUS_GROUPS.get(s or "leaderboard")
+        if wanted is None:
+            return False
+        complete = {
+            state["scope"] for state in self.crawl_states() if state.get("completed_at")
+        }
+        covered: set[str] = set()
+        for scope in scopes:
+            if scope.key not in complete:
+                continue
+            if scope.mode is None or scope.mode == m:
+                covered |= STATUS_GROUPS[scope.status]
+        return wanted <= covered
+
+    # --- 検索 -----------------------------------------------------------
+
+    async def search(
+        self,
+        q: str = "",
+        page: int = 1,
+        limit: int = 20,
+        s: str | None = None,
+        m: int | str | None = None,
+        nsfw: bool | None = None,
+        sort: str | None = None,
+    ) -> dict[str, Any]:
+        """/beatmapsets/search を射影したものと同じ形 ({total, beatmapsets}) で返す。"""
+        return await asyncio.to_thread(
+            self._search_sync, q, page, limit, s, m, nsfw, sort
+        )
+
+    def _search_sync(
+        self,
+        q: str,
+        page: int,
+        limit: int,
+        s: str | None,
+        m: int | str | None,
+        nsfw: bool | None,
+        sort: str | None,
+    ) -> dict[str, Any]:
+        where: list[str] = []
+        args: list[Any] = []
+        statuses = sorted(STATUS_GROUPS.get(s or "leaderboard", ()))
+        if not statuses:
+            raise ValueError(f"unsupported status filter for local search: {s}")
+        if set(statuses) != STATUS_GROUPS["any"]:
+            where.append(f"status IN ({','.join('?' * len(statuses))})")
+            args += statuses
+        if m is not None and str(m) != "":
+            where.append("(modes & ?) != 0")
+            args.append(1 << int(m))
+        if nsfw is False:
+            where.append("nsfw = 0")
+        terms = q.split()
+        for term in terms:
+            if self.fts and len(term) >= 3:
+                where.append(
+                    "id IN (SELECT rowid FROM beatmapsets_fts WHERE beatmapsets_fts MATCH ?)"
+                )
+                args.append('"' + term.replace('"', '""') + '"')
+            else:
+                pattern = (
+                    "%"
+                    + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                    + "%"
+                )
+                where.append(
+                    "("
+                    + " OR ".join(f"{col} LIKE ? ESCAPE '\\'" for col in _LIKE_COLUMNS)
+                    + ")"
+                )
+                args += [pattern] * len(_LIKE_COLUMNS)
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        field, _, direction = (sort or "ranked_desc").rpartition("_")
+        column = _SORT_COLUMNS.get(field, _SORT_COLUMNS["ranked"])
+        direction = "ASC" if direction == "asc" else "DESC"
+        offset = max(0, page - 1) * limit
+        with self._lock:
+            total = self._conn.execute(
+                f"SELECT COUNT(*) FROM beatmapsets {clause}", args
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT body FROM beatmapsets {clause}"
+                f" ORDER BY {column} IS NULL, {column} {direction}, id DESC"
+                " LIMIT ? OFFSET ?",
+                [*args, limit, offset],
+            ).fetchall()
+        return {
+            "total": total,
+            "beatmapsets": [json.loads(zlib.decompress(row[0])) for row in rows],
+        }
+
+    async def bodies(self, set_ids: list[int]) -> dict[int, dict[str, Any]]:
+        """set_id → 表示用の beatmapset (search と同じ形)。"""
+        return await asyncio.to_thread(self._bodies_sync, set_ids)
+
+    def _bodies_sync(self, set_ids: list[int]) -> dict[int, dict[str, Any]]:
+        found: dict[int, dict[str, Any]] = {}
+        with self._lock:
+            for start in range(0, len(set_ids), 500):
+                chunk = set_ids[start : start + 500]
+                rows = self._conn.execute(
+                    "SELECT id, body FROM beatmapsets"
+                    f" WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update(
+                    (row[0], json.loads(zlib.decompress(row[1]))) for row in rows
+                )
+        return found
+
+    def filter_rows(self) -> list[tuple]:
+        """難易度ごとに set の値も並べた行 (FILTER_COLUMNS の順)。フィルタエンジン用。"""
+        text = "f.source, f.tags" if self.fts else "'', ''"
+        join = "LEFT JOIN beatmapsets_fts f ON f.rowid = s.id" if self.fts else ""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT b.id, b.beatmapset_id, b.mode, b.difficulty_rating,"
+                " b.total_length, COALESCE(b.bpm, s.bpm), b.cs, b.ar, b.od, b.hp,"
+                " s.status, b.version, "
+                + text
+                + ", s.artist, s.title, s.creator, s.play_count, s.favourite_count,"
+                " s.ranked_date"
+                " FROM beatmaps b JOIN beatmapsets s ON s.id = b.beatmapset_id " + join
+            ).fetchall()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            by_status = dict(
+                self._conn.execute(
+                    "SELECT status, COUNT(*) FROM beatmapsets GROUP BY status"
+                ).fetchall()
+            )
+            beatmaps = self._conn.execute("SELECT COUNT(*) FROM beatmaps").fetchone()[0]
+        return {
+            "path": str(self.path),
+            "beatmapsets": sum(by_status.values()),
+            "beatmaps": beatmaps,
+            "by_status": by_status,
+            "full_text": self.fts,
+        }
+
+
+class CatalogCrawler:
+    """
+    スコープごとに検索 API を sort=updated_desc の cursor で辿り、カタログを埋める。
+    1 回目は最後まで辿り (途中で止まっても cursor から再開)、完走した時点で見た最新の
+    last_updated を high_water として残す。2 回目以降はそれより古いページに来たら止める。
+    差分巡回では last_updated の動かない status の変化 (qualified → ranked など) が
+    見えないので、full_pass_interval ごと (VOLATILE_STATUSES は毎回) 最後まで辿り、
+    そこで見えなかったスコープ内のセットを引き直して今の status で上書きするか消す。
+    osu! API への負荷は BULK 優先度 (iter_search) で UI の検索より後回しになる。
+    """
+
+    def __init__(
+        self,
+        catalog: Catalog,
+        client: Callable[[], Any],
+        scopes: list[CatalogScope],
+        refresh_interval: float = 6 * 3600,
+        event_bus=None,
+        full_pass_interval: float = 7 * 24 * 3600,
+    ) -> None:
+        # 設定変更で OsuApiClient が作り直されるので都度取りに行く (無効なら None)
+        self._client = client
+        self.catalog = catalog
+        self.scopes = scopes
+        self.refresh_interval = refresh_interval
+        self.full_pass_interval = full_pass_interval
+        self._event_bus = event_bus
+        self._task: asyncio.Task | None = None
+        self._wake = asyncio.Event()
+        self.running_scope: str | None = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    def trigger(self) -> None:
+        """次の巡回を今すぐ始める。"""
+        self._wake.set()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        states = {state["scope"]: state for state in self.catalog.crawl_states()}
+        return {
+            **self.catalog.stats(),
+            "scopes": [
+                {"scope": scope.key, **states.get(scope.key, {})}
+                for scope in self.scopes
+            ],
+            "running": self.running_scope,
+            "refresh_interval": self.refresh_interval,
+        }
+
+    async def _loop(self) -> None:
+        while True:
+            # 巡回中に trigger() されたら、次の周期を待たずにもう 1 回回る
+            self._wake.clear()
+            for scope in self.scopes:
+                client = self._client()
+                if client is None:
+                    break
+                try:
+                    await self.crawl(client, scope)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    logger.exception("Catalog crawl failed scope=%s", scope.key)
+                    await self.catalog.save_crawl_state(
+                        scope.key, error=getattr(exc, "detail", None) or str(exc)
+                    )
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.refresh_interval)
+            except TimeoutError:
+                pass
+
+    async def crawl(self, client: Any, scope: CatalogScope) -> int:
+        """1 スコープを 1 回巡回する。書き込んだセット数を返す。"""
+        state = await self.catalog.crawl_state(scope.key)
+        cursor = state.get("cursor")
+        high_water = state.get("high_water")
+        pass_high = state.get("pass_high_water") if cursor else None
+        if not cursor:
+            await self.catalog.save_crawl_state(
+                scope.key, started_at=time.time(), pages=0, sets=0, error=None
+            )
+            state = await self.catalog.crawl_state(scope.key)
+        full_pass_at = state.get("full_pass_at") or 0
+        if (
+            scope.status in VOLATILE_STATUSES
+            or state["started_at"] - full_pass_at >= self.full_pass_interval
+        ):
+            # 最後まで辿る。high_water で止めない
+            high_water = None
+        pages, written = state.get("pages") or 0, state.get("sets") or 0
+        self.running_scope = scope.key
+        logger.info(
+            "Catalog crawl started scope=%s resume=%s high_water=%s",
+            scope.key,
+            bool(cursor),
+            high_water,
+        )
+        try:
+            # 差分巡回は大抵 1〜2 ページで終わるので、先読みは 1 ページに抑える
+            async for page in client.iter_search(
+                limit=50,
+                cursor=cursor,
+                window=1 if high_water else 2,
+                raw=True,
+                **scope.params(),
+            ):
+                items = page.beatmapsets
+                await self.catalog.upsert(items)
+                updated = [i.get("last_updated") or "" for i in items]
+                if updated:
+                    pass_high = max(pass_high or "", *updated)
+                pages += 1
+                written += len(items)
+                CATALOG_CRAWLED.labels(scope.key).inc(len(items))
+                # 前回の巡回で見た所まで来たら、それより先は変わっていない
+                # (新しい順なので、古いものが 1 件でも出たら以降は全部古い)
+                caught_up = bool(high_water) and any(u <= high_water for u in updated)
+                next_cursor = None if caught_up else page.next_cursor
+                await self.catalog.save_crawl_state(
+                    scope.key,
+                    cursor=next_cursor,
+                    pass_high_water=pass_high,
+                    pages=pages,
+                    sets=written,
+                )
+                self._publish(scope, "progress", pages=pages, sets=written)
+                if caught_up:
+                    break
+        finally:
+            self.running_scope = None
+        completed = {"completed_at": time.time()}
+        if not high_water:
+            await self._settle_unseen(client, scope, state["started_at"])
+            completed["full_pass_at"] = completed["completed_at"]
+        await self.catalog.save_crawl_state(
+            scope.key,
+            cursor=None,
+            high_water=pass_high or high_water or state.get("high_water"),
+            pass_high_water=None,
+            error=None,
+            **completed,
+        )
+        self._publish(scope, "completed", pages=pages, sets=written)
+        logger.info(
+            "Catalog crawl completed scope=%s pages=%s sets=%s",
+            scope.key,
+            pages,
+            written,
+        )
+        return written
+
+    async def _settle_unseen(
+        self, client: Any, scope: CatalogScope, since: float
+    ) -> None:
+        """最後まで辿った巡回で見えなかったスコープ内のセットを片付ける。"""
+        ids = await self.catalog.unseen(scope, since)
+        if not ids:
+            return
+        fresh: dict[int, dict[str, Any]] = {}
+        try:
+            fresh = await client.get_beatmapsets(ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning(
+                "Catalog recheck failed scope=%s sets=%s", scope.key, len(ids)
+            )
+        # スコープから出て行ったものは今の status で残す (他のスコープの検索に出る)
+        moved = [
+            bs
+            for bs in fresh.values()
+            if bs.get("status") not in STATUS_GROUPS[scope.status]
+        ]
+        await self.catalog.upsert(moved)
+        # 消えたもの / 引き直せなかったものは消す。まだ入っていれば次の巡回で戻る
+        kept = {bs["id"] for bs in moved}
+        gone = [set_id for set_id in ids if set_id not in kept]
+        await self.catalog.delete(gone)
+        logger.info(
+            "Catalog settled unseen scope=%s moved=%s removed=%s",
+            scope.key,
+            len(moved),
+            len(gone),
+        )
+
+    def _publish(self, scope: CatalogScope, kind: str, **data: Any) -> None:
+        if not self._event_bus:
+            return
+        try:
+            self._last_publish_task = asyncio.create_task(
+                self._event_bus.publish(
+                    {
+                        "topic": "catalog",
+                        "data": {"type": kind, "scope": scope.key, **data},
+                    }
+                )
+            )
+        except RuntimeError:
+            pass
@@ -1,28 +1,85 @@
 import asyncio
+import heapq
+import itertools
+import json
 import logging
+import secrets
+import shutil
 import time
 import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
+from urllib.parse import urlsplit
 
 import httpx
 from aiolimiter import AsyncLimiter
 
+from core.bandwidth import BandwidthLimiter
+from core.metrics import REGISTRY
+from core.retry import DownloadError, FailureKind, RetryPolicy, classify_error
 from core.scanner import SongIndex
+from core.scheduler import DownloadScheduler, PendingEntry
+from core.writer import DiskWriter
 
 logger = logging.getLogger("osu_sync.downloader")
 
+FINISHED_STATUSES = frozenset({"completed", "failed", "skipped", "cancelled"})
+ACTIVE_STATUSES = frozenset({"queued", "running", "processing"})
+
+DOWNLOAD_BYTES = REGISTRY.counter(
+    "osu_sync_download_bytes_total", "Bytes received from mirrors.", ("mirror",)
+)
+DOWNLOAD_TTFB = REGISTRY.histogram(
+    "osu_sync_download_ttfb_seconds",
+    "Time from sending the request to receiving response headers.",
+    ("mirror",),
+)
+DOWNLOAD_DURATION = REGISTRY.histogram(
+    "osu_sync_download_duration_seconds",
+    "Wall time of successful transfers.",
+    ("mirror",),
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+DOWNLOAD_OUTCOMES = REGISTRY.counter(
+    "osu_sync_download_outcomes_total",
+    "Download outcomes (completed/failed/skipped/cancelled/retry/held).",
+    ("mirror", "outcome"),
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "osu_sync_queue_depth", "Tasks per queue state.", ("state",)
+)
+# ダウンロードエンジン (別プロセス実行時は子プロセス側) が持つメトリクス
+ENGINE_METRICS = frozenset(
+    metric.name
+    for metric in (
+        DOWNLOAD_BYTES,
+        DOWNLOAD_TTFB,
+        DOWNLOAD_DURATION,
+        DOWNLOAD_OUTCOMES,
+        QUEUE_DEPTH,
+    )
+)
+
+
+def _mirror(url: str) -> str:
+    return urlsplit(url).hostname or "unknown"
+
 
 @dataclass
 class DownloadTask:
     set_id: int
     url: str
-    status: str = "queued"  # queued -> running -> completed/failed/skipped
+    # queued -> running -> processing -> completed/failed/skipped/cancelled
+    status: str = "queued"
+    priority: int = 0
     message: str = ""
     path: Path | None = None
     archive_path: Path | None = None
     bytes_downloaded: int = 0
     total_bytes: int | None = None
+    expected_bytes: int | None = None  # HEAD プローブで得た Content-Length
     progress: float | None = 0.0
     speed_bps: float | None = None
     started_at: float | None = None
@@ -32,7 +89,12 @@ class DownloadTask:
     title: str | None = None
     artist_unicode: str | None = None
     title_unicode: str | None = None
+    attempts: int = 0
+    last_error: str | None = None
+    error_kind: str | None = None
+    next_retry_at: float | None = None
     created_at: float = field(default_factory=time.time)
+    queue_seq: int | None = None  # scheduler から取り出したときの seq
 
 
 class DownloadManager:
@@ -40,6 +102,9 @@ class DownloadManager:
     DLキュー: 進捗計測を行いながら .osz を保存する簡易ダウンローダ。
     """
 
+    PROBE_CONCURRENCY = 4
+    DISK_RECHECK_SECONDS = 30.0  # 空き容量不足で保留したタスクを見直す間隔
+
     def __init__(
         self,
         songs_dir: str,
@@ -49,19 +114,87 @@ class DownloadManager:
         requests_per_minute: int = 60,
         index: SongIndex | None = None,
         event_bus=None,
+        retry_policy: RetryPolicy | None = None,
+        chunk_size: int = 256 * 1024,
+        write_buffer_bytes: int = 16 * 1024 * 1024,
+        progress_interval: float = 0.5,
+        postprocess_concurrency: int = 2,
+        bandwidth: BandwidthLimiter | None = None,
+        client: httpx.AsyncClient | None = None,
+        schedule_policy: str = "fifo",
+        probe_sizes: bool = False,
+        probe_requests_per_minute: int = 240,
+        history_limit: int = 1000,
+        history_max_age: float = 0.0,
+        history_spill_path: Path | None = None,
+        min_free_bytes: int = 512 * 1024 * 1024,
+        preallocate: bool = True,
     ) -> None:
         self.songs_dir = Path(songs_dir)
+        # 書きかけの .part は別フォルダに置き、Songs 直下の mtime (索引の再列挙条件) を
+        # 動かさないようにする。リネームで移すので同じファイルシステム上に作る
+        self.partial_dir = self.songs_dir / ".partial"
         self.url_template = url_template
         self.query_options = query_options
         self.max_concurrency = max_concurrency
         self.index = index
-        self._queue: asyncio.Queue[DownloadTask] = asyncio.Queue()
+        self.chunk_size = max(4096, chunk_size)
+        self.progress_interval = progress_interval
+        self._writer = DiskWriter(write_buffer_bytes)
+        # 空き容量のアドミッション制御。実行中タスクがまだ書いていない分を予約として
+        # 差し引く (事前確保できたものは既にディスク上で確保済みなので予約しない)
+        self.min_free_bytes = max(0, min_free_bytes)
+        self.preallocate = preallocate
+        self._reserved: dict[int, int] = {}
+        self.bandwidth = bandwidth or BandwidthLimiter()
+        # zip 検証やリネームはネットワークワーカーとは別のプールで行う
+        self._process_pool = ThreadPoolExecutor(
+            max_workers=max(1, postprocess_concurrency),
+            thread_name_prefix="osu-sync-post",
+        )
+        self._processing: set[asyncio.Task] = set()
+        self._scheduler = DownloadScheduler(schedule_policy)
+        # HEAD でサイズを先読みするステージ (DL 本体とは別のレート制限)
+        self.probe_sizes = probe_sizes
+        self._probe_limiter = AsyncLimiter(probe_requests_per_minute, time_period=60)
+        self._probe_pending: deque[int] = deque()
+        self._probe_wakeup = asyncio.Event()
+        # DownloadTask はワーカーが取り出したときに作る。待機中の id は scheduler が
+        # 配列で持ち、enqueue 時に渡されたメタデータだけをここに置いておく
         self._tasks: dict[int, DownloadTask] = {}
+        self._pending_meta: dict[int, dict[str, str]] = {}
+        self._enqueued = 0  # 次の差分通知で知らせる追加件数
+        # 終了済みタスクの履歴 (set_id -> 終了時刻、古い順)。件数/経過時間の上限
+        # (0 = 無制限) を超えたら _tasks から落とし、spill 先があれば JSON Lines で残す
+        self._history: OrderedDict[int, float] = OrderedDict()
+        self.history_limit = max(0, history_limit)
+        self.history_max_age = max(0.0, history_max_age)
+        self.history_spill_path = history_spill_path
+        # 実行中の HTTP ストリーム (cancel で中断できるように保持)
+        self._active: dict[int, asyncio.Task] = {}
+        self._interrupts: dict[int, str] = {}  # set_id -> "cancel" | "pause"
         self._worker_handles: list[asyncio.Task] = []
         self._workers_started = False
+        self._retry_policy = retry_policy or RetryPolicy()
+        # (due_at, set_id) の min-heap。待機中のタスクはワーカー枠を占有しない
+        self._delayed: list[tuple[float, int]] = []
+        self._delayed_wakeup = asyncio.Event()
         self._limiter = AsyncLimiter(requests_per_minute, time_period=60)
-        self._client = httpx.AsyncClient(follow_redirects=True, timeout=60)
+        # 共有トランスポートのクライアントを渡された場合は close しない
+        self._owns_client = client is None
+        self._client = client or httpx.AsyncClient(follow_redirects=True, timeout=60)
         self._event_bus = event_bus
+        # queue トピックは変更のあったタスクだけを seq 付きの差分で流す
+        # epoch はマネージャ再構築で seq が巻き戻ったことをクライアントに知らせる
+        self._epoch = secrets.token_hex(4)
+        self._seq = 0
+        self._dirty: set[int] = set()
+        self._flush_scheduled = False
+        # 再構築されたら新しいマネージャの値を返すように差し替える
+        QUEUE_DEPTH.labels("queued").set_function(self._queued_count)
+        QUEUE_DEPTH.labels("running").set_function(lambda: len(self._active))
+        QUEUE_DEPTH.labels("processing").set_function(lambda: len(self._processing))
+        QUEUE_DEPTH.labels("history").set_function(lambda: len(self._history))
         logger.info(
             "Downloader initialized songs_dir=%s template=%s max_concurrency=%s rpm=%s",
             self.songs_dir,
@@ -71,36 +204,72 @@ class DownloadManager:
         )
 
     def enqueue(
-        self, set_ids: list[int], metadata: dict[int, dict[str, str]] | None = None
-    ) -> list[DownloadTask]:
-        new_tasks: list[DownloadTask] = []
-        for set_id in set_ids:
-            if set_id in self._tasks and self._tasks[set_id].status in {
-                "queued",
-                "running",
-            }:
+        self,
+        set_ids: list[int],
+        metadata: dict[int, dict[str, str]] | None = None,
+        priority: int = 0,
+    ) -> list[int]:
+        """
+        待機列に追加し、追加した id を返す。タスク本体は作らずに id だけを積み、
+        通知も個別ではなく件数だけを 1 回流す。
+        """
+        accepted: list[int] = []
+        for set_id in dict.fromkeys(set_ids):
+            task = self._tasks.get(set_id)
+            if set_id in self._scheduler or (
+                task is not None and task.status in ACTIVE_STATUSES
+            ):
                 continue
-            url = self._build_url(set_id)
-            task = DownloadTask(set_id=set_id, url=url)
-            # Use provided metadata first, then fall back to index
+            if task is not None:
+                # 終了済みの古い結果は捨てて入れ直す
+                del self._tasks[set_id]
+                self._history.pop(set_id, None)
             if metadata and set_id in metadata:
-                task.artist = metadata[set_id].get("artist")
-                task.title = metadata[set_id].get("title")
-                task.artist_unicode = metadata[set_id].get("artist_unicode")
-                task.title_unicode = metadata[set_id].get("title_unicode")
-            elif self.index and set_id in self.index.metadata:
-                index_metadata = self.index.metadata[set_id]
-                if len(index_metadata) >= 4:
-                    _, artist, title, _creator = index_metadata
-                    task.artist = artist
-                    task.title = title
-            self._tasks[set_id] = task
-            self._queue.put_nowait(task)
-            new_tasks.append(task)
-        if new_tasks:
-            logger.info("Enqueued downloads: %s", [t.set_id for t in new_tasks])
-            self._publish_status()
-        return new_tasks
+                self._pending_meta[set_id] = metadata[set_id]
+            accepted.append(set_id)
+        if not accepted:
+            return accepted
+        self._scheduler.put_many(accepted, priority)
+        if self.probe_sizes:
+            self._probe_pending.extend(accepted)
+            self._probe_wakeup.set()
+        logger.info(
+            "Enqueued downloads count=%s first=%s", len(accepted), accepted[:10]
+        )
+        self._enqueued += len(accepted)
+        self._publish_status()
+        return accepted
+
+    def _materialize(self, entry: PendingEntry) -> DownloadTask:
+        """待機中の id から DownloadTask を組み立てる (登録はしない)。"""
+        task = DownloadTask(
+            set_id=entry.set_id,
+            url=self._build_url(entry.set_id),
+            priority=entry.priority,
+            expected_bytes=entry.size,
+            created_at=entry.queued_at,
+        )
+        metadata = self._pending_meta.get(entry.set_id)
+        if metadata:
+            task.artist = metadata.get("artist")
+            task.title = metadata.get("title")
+            task.artist_unicode = metadata.get("artist_unicode")
+            task.title_unicode = metadata.get("title_unicode")
+        return task
+
+    def _adopt(self, entry: PendingEntry) -> DownloadTask:
+        task = self._materialize(entry)
+        self._pending_meta.pop(entry.set_id, None)
+        self._tasks[entry.set_id] = task
+        return task
+
+    def _view(self, set_id: int) -> DownloadTask | None:
+        """登録済みのタスク、無ければ待機中 id の一時的な DownloadTask。"""
+        task = self._tasks.get(set_id)
+        if task is not None:
+            return task
+        entry = self._scheduler.entry(set_id)
+        return self._materialize(entry) if entry else None
 
     def _build_url(self, set_id: int) -> str:
         base = self.url_template.format(set_id=set_id)
@@ -117,42 +286,351 @@ class DownloadManager:
         if self._workers_started:
             return
         self._workers_started = True
+        # 前回のプロセスが落ちて残った .part を片付ける (転送は途中から再開しない)
+        parts = await self._writer.run(self._list_partials)
+        await self._writer.run(
+            self._remove_partials, [p for p in parts if not self._owns_partial(p)]
+        )
         for _ in range(self.max_concurrency):
             handle = asyncio.create_task(self._worker())
             self._worker_handles.append(handle)
+        self._worker_handles.append(asyncio.create_task(self._retry_scheduler()))
+        self._worker_handles.append(asyncio.create_task(self._progress_ticker()))
+        if self.probe_sizes:
+            for _ in range(self.PROBE_CONCURRENCY):
+                self._worker_handles.append(asyncio.create_task(self._prober()))
+
+    def _list_partials(self) -> list[Path]:
+        try:
+            return list(self.partial_dir.glob("*.part"))
+        except OSError:
+            return []
+
+    def _owns_partial(self, path: Path) -> bool:
+        """{set_id}-{ms}.part が待機中 / 転送中のタスクのものか。"""
+        set_id = path.stem.partition("-")[0]
+        if not set_id.isdigit():
+            return False
+        task = self._tasks.get(int(set_id))
+        return int(set_id) in self._scheduler or (
+            task is not None and task.status not in FINISHED_STATUSES
+        )
+
+    def _remove_partials(self, paths: list[Path]) -> None:
+        for path in paths:
+            try:
+                path.unlink()
+            except OSError as exc:
+                logger.warning("Failed to remove stale partial %s: %s", path, exc)
+        if paths:
+            logger.info("Removed stale partial files count=%s", len(paths))
+        try:
+            self.partial_dir.rmdir()
+        except OSError:
+            # 無い / まだ中身がある
+            pass
+
+    def pause(self, interrupt: bool = False) -> None:
+        """新規の取り出しを止める。interrupt なら実行中の転送も中断して先頭へ戻す。"""
+        self._scheduler.pause()
+        if interrupt:
+            for set_id, job in list(self._active.items()):
+                self._interrupts[set_id] = "pause"
+                job.cancel()
+        logger.info("Queue paused interrupt=%s", interrupt)
+        self._publish_event("paused", interrupt=interrupt)
+        self._publish_status()
+
+    def resume(self) -> None:
+        self._scheduler.resume()
+        logger.info("Queue resumed")
+        self._publish_event("resumed")
+        self._publish_status()
+
+    @property
+    def paused(self) -> bool:
+        return self._scheduler.paused
+
+    def cancel(self, set_id: int) -> bool:
+        """待機中なら取り除き、転送中なら HTTP ストリームごと中断する。"""
+        task = self._tasks.get(set_id)
+        if task is None:
+            entry = self._scheduler.entry(set_id)
+            if entry is None:
+                return False
+            task = self._adopt(entry)
+        if task.status == "queued":
+            self._scheduler.remove(set_id)
+            self._mark_cancelled(task)
+        elif task.status == "running" and set_id in self._active:
+            self._interrupts[set_id] = "cancel"
+            if not self._active[set_id].cancel():
+                self._interrupts.pop(set_id, None)
+                return False
+        else:
+            return False
+        logger.info("Download cancel requested set_id=%s", set_id)
+        self._publish_event("cancelled", set_id=set_id)
+        self._publish_status(task)
+        return True
+
+    def set_priority(self, set_id: int, priority: int) -> bool:
+        task = self._tasks.get(set_id)
+        if task is not None and task.status != "queued":
+            return False
+        if task is not None:
+            # リトライ待ちのものは再投入時に新しい優先度が使われる
+            task.priority = priority
+        if not self._scheduler.reprioritize(set_id, priority) and task is None:
+            return False
+        self._publish_event("reprioritized", set_id=set_id, priority=priority)
+        self._publish_status(task or self._view(set_id))
+        return True
+
+    def configure_bandwidth(
+        self,
+        limit_kbps: int | None = None,
+        per_task_kbps: int | None = None,
+        schedule: object = None,
+    ) -> None:
+        """schedule は設定ファイルと同じ [{"start", "end", "limit_kbps"}, ...] 形式。"""
+        self.bandwidth.configure(
+            limit_kbps,
+            per_task_kbps,
+            BandwidthLimiter.parse_schedule(schedule) if schedule is not None else None,
+        )
+
+    def set_schedule_policy(self, policy: str) -> None:
+        self._scheduler.set_policy(policy)
+        logger.info("Schedule policy set to %s", policy)
+        self._publish_status()
+
+    async def _prober(self) -> None:
+        """待機中タスクのサイズを HEAD で先に調べ、スケジューラへ渡す。"""
+        while True:
+            if not self._probe_pending:
+                self._probe_wakeup.clear()
+                await self._probe_wakeup.wait()
+                continue
+            set_id = self._probe_pending.popleft()
+            entry = self._scheduler.entry(set_id)
+            if entry is None or entry.size is not None:
+                continue
+            size = await self._probe_size(set_id)
+            if size is None or not self._scheduler.set_size(set_id, size):
+                continue
+            task = self._tasks.get(set_id)
+            if task is not None:
+                task.expected_bytes = size
+
+    async def _probe_size(self, set_id: int) -> int | None:
+        # 既に手元にあるものはすぐ skip されるので最小サイズ扱い
+        if self._find_existing_archive(set_id):
+            return 0
+        try:
+            async with self._probe_limiter:
+                resp = await self._client.head(self._build_url(set_id))
+        except httpx.HTTPError as exc:
+            logger.debug("Probe failed set_id=%s error=%s", set_id, exc)
+            return None
+        content_length = resp.headers.get("content-length")
+        if resp.status_code >= 400 or not (content_length or "").isdigit():
+            return None
+        return int(content_length)
+
+    def _mark_cancelled(self, task: DownloadTask) -> None:
+        task.status = "cancelled"
+        task.message = "cancelled"
+        task.next_retry_at = None
+        task.speed_bps = None
+        task.updated_at = time.time()
+        self._finish(task)
+
+    async def close(self) -> None:
+        """ワーカーを止め、後処理の完了を待ってからスレッドとクライアントを片付ける。"""
+        for handle in self._worker_handles:
+            handle.cancel()
+        await asyncio.gather(*self._worker_handles, return_exceptions=True)
+        self._worker_handles.clear()
+        self._workers_started = False
+        if self._processing:
+            await asyncio.gather(*self._processing, return_exceptions=True)
+        self._process_pool.shutdown(wait=False)
+        self._writer.shutdown()
+        if self._owns_client:
+            await self._client.aclose()
+        logger.info("Downloader closed songs_dir=%s", self.songs_dir)
 
     async def _worker(self) -> None:
         while True:
-            task: DownloadTask = await self._queue.get()
-            if task.status != "queued":
-                self._queue.task_done()
+            entry = await self._scheduler.get()
+            set_id = entry.set_id
+            task = self._tasks.get(set_id)
+            if task is None:
+                task = self._adopt(entry)
+            elif task.status != "queued":
                 continue
+            task.queue_seq = entry.seq
             task.status = "running"
             task.progress = 0.0
             task.bytes_downloaded = 0
-            self._publish_status()
+            task.attempts += 1
+            task.next_retry_at = None
+            self._publish_status(task)
             try:
-                logger.info("Start download set_id=%s url=%s", task.set_id, task.url)
-                await self._download(task)
-                if task.status not in {"failed", "skipped"}:
-                    task.status = "completed"
-                    task.progress = 1.0
-                    task.updated_at = time.time()
-            except Exception as exc:
-                task.status = "failed"
-                task.message = str(exc)
-                logger.exception(
-                    "Download failed set_id=%s url=%s error=%s",
+                logger.info(
+                    "Start download set_id=%s url=%s attempt=%s",
                     task.set_id,
                     task.url,
-                    exc,
+                    task.attempts,
                 )
+                job = asyncio.create_task(self._download(task))
+                self._active[set_id] = job
+                tmp_path = await job
+                if tmp_path is not None:
+                    self._start_processing(task, tmp_path)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise  # ワーカー自体の停止
+                self._handle_interrupt(task)
+            except Exception as exc:
+                self._handle_failure(task, exc)
             finally:
-                self._queue.task_done()
-                self._publish_status()
+                self._active.pop(set_id, None)
+                self._publish_status(task)
+
+    def _handle_interrupt(self, task: DownloadTask) -> None:
+        reason = self._interrupts.pop(task.set_id, "cancel")
+        if reason == "pause":
+            # 一時停止による中断は試行回数に数えず、そのまま待ち行列へ戻す
+            task.status = "queued"
+            task.message = "paused"
+            task.attempts = max(0, task.attempts - 1)
+            task.progress = 0.0
+            task.bytes_downloaded = 0
+            task.speed_bps = None
+            # 取り出したときの順番のまま戻す (まとめて中断したものも元の順に並ぶ)
+            self._scheduler.requeue(
+                task.set_id,
+                task.priority,
+                task.queue_seq,
+                task.expected_bytes,
+                task.created_at,
+            )
+        else:
+            self._mark_cancelled(task)
+        logger.info("Download interrupted set_id=%s reason=%s", task.set_id, reason)
+
+    def _handle_failure(self, task: DownloadTask, exc: Exception) -> None:
+        kind, retry_after = classify_error(exc)
+        if kind is FailureKind.DISK_FULL:
+            self._hold(task, str(exc))
+            return
+        task.last_error = str(exc) or type(exc).__name__
+        task.error_kind = kind.value
+        task.updated_at = time.time()
+        if not self._retry_policy.should_retry(kind, task.attempts):
+            task.status = "failed"
+            task.message = task.last_error
+            self._finish(task)
+            logger.error(
+                "Download failed set_id=%s url=%s kind=%s attempts=%s error=%s",
+                task.set_id,
+                task.url,
+                kind.value,
+                task.attempts,
+                exc,
+            )
+            return
+
+        delay = self._retry_policy.next_delay(task.attempts, retry_after)
+        DOWNLOAD_OUTCOMES.labels(_mirror(task.url), "retry").inc()
+        task.status = "queued"
+        task.progress = 0.0
+        task.bytes_downloaded = 0
+        task.speed_bps = None
+        task.next_retry_at = time.time() + delay
+        task.message = f"retrying in {delay:.0f}s ({kind.value})"
+        heapq.heappush(self._delayed, (task.next_retry_at, task.set_id))
+        self._delayed_wakeup.set()
+        logger.warning(
+            "Download retry scheduled set_id=%s kind=%s attempt=%s delay=%.1fs error=%s",
+            task.set_id,
+            kind.value,
+            task.attempts,
+            delay,
+            exc,
+        )
+
+    def _admit(self, task: DownloadTask, size: int | None) -> None:
+        """
+        空き容量 - 他タスクの予約 - min_free_bytes に size が収まれば予約する。
+        収まらなければ DISK_FULL を送出する (失敗ではなく保留として扱われる)。
+        size が不明 (None) なら予約せず、min_free_bytes を割っていないかだけを見る。
+        """
+        size = int(size or 0)
+        # 書き込み済みの分は free に反映されているので、残りだけを予約として数える
+        reserved = sum(
+            max(0, v - other.bytes_downloaded)
+            for k, v in self._reserved.items()
+            if k != task.set_id and (other := self._tasks.get(k)) is not None
+        )
+        try:
+            free = shutil.disk_usage(self.songs_dir).free
+        except OSError:
+            return
+        available = free - reserved - self.min_free_bytes
+        if size > available:
+            raise DownloadError(
+                FailureKind.DISK_FULL,
+                f"insufficient disk space: need {size} bytes, free {free}, "
+                f"reserved {reserved}, keep {self.min_free_bytes}",
+            )
+        self._reserved[task.set_id] = size
+
+    def _hold(self, task: DownloadTask, reason: str) -> None:
+        """空き容量が足りないタスクを試行回数に数えずに待機させ、定期的に見直す。"""
+        task.status = "queued"
+        task.attempts = max(0, task.attempts - 1)
+        task.progress = 0.0
+        task.bytes_downloaded = 0
+        task.speed_bps = None
+        task.last_error = reason
+        task.error_kind = FailureKind.DISK_FULL.value
+        task.updated_at = time.time()
+        task.next_retry_at = task.updated_at + self.DISK_RECHECK_SECONDS
+        task.message = "waiting for disk space"
+        heapq.heappush(self._delayed, (task.next_retry_at, task.set_id))
+        self._delayed_wakeup.set()
+        DOWNLOAD_OUTCOMES.labels(_mirror(task.url), "held").inc()
+        logger.warning("Download held set_id=%s reason=%s", task.set_id, reason)
 
-    async def _download(self, task: DownloadTask) -> None:
-        self.songs_dir.mkdir(parents=True, exist_ok=True)
+    async def _retry_scheduler(self) -> None:
+        """待機時間が過ぎたリトライ対象をキューへ戻す。"""
+        while True:
+            if not self._delayed:
+                self._delayed_wakeup.clear()
+                await self._delayed_wakeup.wait()
+                continue
+            due_at, set_id = self._delayed[0]
+            wait = due_at - time.time()
+            if wait > 0:
+                self._delayed_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._delayed_wakeup.wait(), timeout=wait)
+                except TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._delayed)
+            task = self._tasks.get(set_id)
+            if task is None or task.status != "queued" or task.next_retry_at is None:
+                continue
+            task.next_retry_at = None
+            self._scheduler.put(set_id, task.priority, task.expected_bytes)
+            self._publish_status(task)
+
+    async def _download(self, task: DownloadTask) -> Path | None:
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
         existing_archive = self._find_existing_archive(task.set_id)
         if existing_archive:
             task.status = "skipped"
@@ -165,17 +643,30 @@ class DownloadManager:
             task.bytes_downloaded = task.total_bytes
             task.updated_at = time.time()
             if self.index:
-                self.index.mark_owned(task.set_id)
-            self._publish_status()
+                self.index.mark_owned(task.set_id, archive_path=existing_archive)
+            self._finish(task)
+            self._publish_status(task)
             logger.info(
                 "Skip download (exists) set_id=%s path=%s",
                 task.set_id,
                 existing_archive,
             )
-            return
+            return None
 
+        # サイズが分かっていればリクエスト前に判定し、入らないものはミラーに投げない。
+        # 不明なものは min_free_bytes を割っていなければ通し、足りなければ ENOSPC で保留する
+        self._admit(task, task.expected_bytes)
+        try:
+            return await self._transfer(task)
+        finally:
+            self._reserved.pop(task.set_id, None)
+
+    async def _transfer(self, task: DownloadTask) -> Path:
+        mirror = _mirror(task.url)
         async with self._limiter:
+            requested_at = time.perf_counter()
             async with self._client.stream("GET", task.url) as resp:
+                DOWNLOAD_TTFB.labels(mirror).observe(time.perf_counter() - requested_at)
                 resp.raise_for_status()
                 content_type = (resp.headers.get("content-type") or "").lower()
                 logger.info(
@@ -190,8 +681,6 @@ class DownloadManager:
                 # HTMLなど明らかに .osz でない場合は即失敗させる
                 if not any(x in content_type for x in ("zip", "octet-stream", "osu")):
                     snippet = await resp.aread()
-                    task.status = "failed"
-                    task.message = f"unexpected content-type: {content_type}"
                     logger.error(
                         "Abort download set_id=%s due to content-type=%s size=%s first256=%r",
                         task.set_id,
@@ -199,152 +688,485 @@ class DownloadManager:
                         len(snippet),
                         snippet[:256],
                     )
-                    return
+                    raise DownloadError(
+                        FailureKind.BAD_CONTENT,
+                        f"unexpected content-type: {content_type}",
+                    )
 
                 tmp_path = (
-                    self.songs_dir / f"{task.set_id}-{int(time.time() * 1000)}.part"
+                    self.partial_dir / f"{task.set_id}-{int(time.time() * 1000)}.part"
                 )
                 task.started_at = time.time()
                 task.updated_at = task.started_at
                 content_length = resp.headers.get("content-length")
                 if content_length and content_length.isdigit():
                     task.total_bytes = int(content_length)
+                    # 次回の保留判定で使えるよう控えておく
+                    task.expected_bytes = task.total_bytes
                 else:
                     task.total_bytes = None
+                self._admit(task, task.total_bytes)
 
+                out = await self._writer.open(
+                    tmp_path, task.total_bytes if self.preallocate else None
+                )
+                if out.preallocated:
+                    self._reserved.pop(task.set_id, None)
+                task_bucket = self.bandwidth.task_bucket()
                 downloaded = 0
-                last_emit = time.time()
-                with tmp_path.open("wb") as f:
-                    async for chunk in resp.aiter_bytes(4096):
-                        f.write(chunk)
+                try:
+                    last_tick = time.time()
+                    async for chunk in resp.aiter_bytes(self.chunk_size):
+                        await self.bandwidth.throttle(len(chunk), task_bucket)
+                        await out.write(chunk)
                         downloaded += len(chunk)
-                        task.bytes_downloaded = downloaded
                         now = time.time()
-                        elapsed = max(1e-3, now - (task.updated_at or now))
-                        instant_speed = len(chunk) / elapsed
-                        if task.speed_bps is None:
-                            task.speed_bps = instant_speed
-                        else:
-                            task.speed_bps = (task.speed_bps * 0.6) + (
-                                instant_speed * 0.4
-                            )
-                        task.updated_at = now
-                        if task.total_bytes:
-                            task.progress = min(downloaded / task.total_bytes, 0.999)
-                        if now - last_emit >= 0.5:
-                            last_emit = now
-                            self._publish_status()
-                metadata = self._derive_metadata_from_archive(tmp_path)
-                if metadata:
-                    task.artist, task.title = metadata
-                base_name = self._build_display_name(task)
-                archive_path = self.songs_dir / f"{base_name}.osz"
-                archive_path.parent.mkdir(parents=True, exist_ok=True)
-                if archive_path.exists():
-                    archive_path.unlink()
-                tmp_path.rename(archive_path)
-                task.archive_path = archive_path
-                task.path = archive_path
-                duration = time.time() - (task.started_at or time.time())
-                size = archive_path.stat().st_size
+                        if now - last_tick >= self.progress_interval:
+                            self._account_progress(task, downloaded, now - last_tick)
+                            last_tick = now
+                    await out.close()
+                except BaseException:
+                    # 途中で切れた .part はリトライ前に片付ける
+                    await out.abort()
+                    raise
+                finally:
+                    DOWNLOAD_BYTES.labels(mirror).inc(downloaded)
+                DOWNLOAD_DURATION.labels(mirror).observe(
+                    time.perf_counter() - requested_at
+                )
+                task.bytes_downloaded = downloaded
+                task.updated_at = time.time()
                 logger.info(
                     "HTTP done set_id=%s bytes=%s elapsed=%.2fs content_length=%s path=%s",
                     task.set_id,
-                    size,
-                    duration,
+                    downloaded,
+                    task.updated_at - task.started_at,
                     task.total_bytes,
-                    archive_path,
+                    tmp_path,
                 )
-                if task.total_bytes and size != task.total_bytes:
-                    logger.warning(
-                        "Size mismatch set_id=%s expected=%s actual=%s url=%s",
-                        task.set_id,
-                        task.total_bytes,
-                        size,
-                        task.url,
-                    )
-                if not zipfile.is_zipfile(archive_path):
-                    task.status = "failed"
-                    task.message = "downloaded file is not a valid zip/osz"
-                    logger.error(
-                        "Invalid archive set_id=%s size=%sB content_type=%s url=%s",
-                        task.set_id,
-                        size,
-                        content_type,
-                        task.url,
-                    )
-                    try:
-                        archive_path.unlink()
-                    except FileNotFoundError:
-                        pass
-                    return
-                if size < 20_000:  # だいたい 11KB 近辺の壊れを拾う
-                    logger.warning(
-                        "Downloaded file is unusually small set_id=%s size=%sB url=%s",
-                        task.set_id,
-                        size,
-                        task.url,
-                    )
+        return tmp_path
 
-        if self.index:
-            meta = None
-            if task.artist or task.title:
-                meta = (task.set_id, task.artist or "", task.title or "", "")
-            self.index.mark_owned(task.set_id, meta)
-
-    def status(self) -> dict[str, object]:
-        queued = [t for t in self._tasks.values() if t.status == "queued"]
-        running = [t for t in self._tasks.values() if t.status == "running"]
-        finished = [
-            t
+    def _start_processing(self, task: DownloadTask, tmp_path: Path) -> None:
+        """検証・メタデータ抽出・リネームを後処理ステージへ渡す。"""
+        task.status = "processing"
+        handle = asyncio.create_task(self._process(task, tmp_path))
+        self._processing.add(handle)
+        handle.add_done_callback(self._processing.discard)
+
+    async def _process(self, task: DownloadTask, tmp_path: Path) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            archive_path, metadata = await loop.run_in_executor(
+                self._process_pool,
+                self._finalize_archive,
+                task.set_id,
+                tmp_path,
+                task.artist,
+                task.title,
+                task.total_bytes,
+            )
+        except Exception as exc:
+            self._handle_failure(task, exc)
+        else:
+            if metadata:
+                task.artist, task.title = metadata
+            self._build_display_name(task)
+            task.archive_path = archive_path
+            task.path = archive_path
+            task.status = "completed"
+            task.message = ""
+            task.progress = 1.0
+            task.updated_at = time.time()
+            if self.index:
+                meta = None
+                if task.artist or task.title:
+                    meta = (task.set_id, task.artist or "", task.title or "", "")
+                self.index.mark_owned(task.set_id, meta, archive_path)
+            self._finish(task)
+        finally:
+            self._publish_status(task)
+
+    def _finalize_archive(
+        self,
+        set_id: int,
+        tmp_path: Path,
+        artist: str | None,
+        title: str | None,
+        expected_size: int | None,
+    ) -> tuple[Path, tuple[str, str] | None]:
+        """後処理プールで実行される。イベントループには触らないこと。"""
+        size = tmp_path.stat().st_size
+        if expected_size and size != expected_size:
+            logger.warning(
+                "Size mismatch set_id=%s expected=%s actual=%s",
+                set_id,
+                expected_size,
+                size,
+            )
+        if not zipfile.is_zipfile(tmp_path):
+            logger.error("Invalid archive set_id=%s size=%sB", set_id, size)
+            tmp_path.unlink(missing_ok=True)
+            raise DownloadError(
+                FailureKind.BAD_CONTENT,
+                "downloaded file is not a valid zip/osz",
+            )
+        if size < 20_000:  # だいたい 11KB 近辺の壊れを拾う
+            logger.warning(
+                "Downloaded file is unusually small set_id=%s size=%sB",
+                set_id,
+                size,
+            )
+
+        metadata = self._derive_metadata_from_archive(tmp_path)
+        if metadata:
+            artist, title = metadata
+        archive_path = (
+            self.songs_dir / f"{self._archive_name(set_id, artist, title)}.osz"
+        )
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+        if archive_path.exists():
+            archive_path.unlink()
+        tmp_path.rename(archive_path)
+        logger.info("Archive ready set_id=%s path=%s", set_id, archive_path)
+        return archive_path, metadata
+
+    async def wait_idle(self) -> None:
+        """キュー・後処理・リトライ待ちがすべて捌けるまで待つ。"""
+        while self._scheduler or self._active or self._processing or self._delayed:
+            await asyncio.sleep(0.05)
+
+    def _account_progress(
+        self, task: DownloadTask, downloaded: int, elapsed: float
+    ) -> None:
+        """progress_interval ごとにまとめて速度と進捗を更新する (通知は _progress_ticker)。"""
+        instant_speed = (downloaded - task.bytes_downloaded) / max(1e-3, elapsed)
+        if task.speed_bps is None:
+            task.speed_bps = instant_speed
+        else:
+            task.speed_bps = (task.speed_bps * 0.6) + (instant_speed * 0.4)
+        task.bytes_downloaded = downloaded
+        task.updated_at = time.time()
+        if task.total_bytes:
+            task.progress = min(downloaded / task.total_bytes, 0.999)
+
+    async def _progress_ticker(self) -> None:
+        """実行中タスクの進捗を progress_interval ごとに 1 イベントへまとめて流す。"""
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            if self.history_max_age and self._history:
+                self._trim_history()
+            if not self._event_bus or not self._active:
+                continue
+            running = [self._tasks[s] for s in self._active if s in self._tasks]
+            entries = [
+                {
+                    "set_id": t.set_id,
+                    "progress": t.progress,
+                    "bytes_downloaded": t.bytes_downloaded,
+                    "total_bytes": t.total_bytes,
+                    "speed_bps": t.speed_bps,
+                }
+                for t in running
+            ]
+            self._publish_queue(
+                {
+                    "type": "progress",
+                    "epoch": self._epoch,
+                    "seq": self._seq,
+                    "tasks": entries,
+                    "aggregate": {
+                        "running": len(entries),
+                        "queued": self._queued_count(),
+                        "bytes_downloaded": sum(t.bytes_downloaded for t in running),
+                        "speed_bps": sum(t.speed_bps or 0.0 for t in running),
+                    },
+                }
+            )
+
+    def status(
+        self,
+        *,
+        statuses: set[str] | None = None,
+        set_id: int | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        offset: int = 0,
+        limit: int | None = None,
+    ) -> dict[str, object]:
+        """
+        キューの状態。queued / done は offset と limit でページングする
+        (done は新しい順)。フィルタは status・set_id・updated_at の範囲。
+        見積もりはフィルタに関係なくキュー全体で計算する。
+        """
+        # 待機中: scheduler 内 (priority・投入順) の後ろにリトライ待ちを並べる
+        waiting = sorted(
+            (
+                t
+                for t in self._tasks.values()
+                if t.status == "queued" and t.set_id not in self._scheduler
+            ),
+            key=lambda t: t.next_retry_at or 0.0,
+        )
+        running = [
+            t for t in self._tasks.values() if t.status in {"running", "processing"}
+        ]
+        finished = (self._tasks[s] for s in reversed(self._history))
+
+        def in_range(timestamp: float) -> bool:
+            if since is not None and timestamp < since:
+                return False
+            return until is None or timestamp <= until
+
+        def matches(task: DownloadTask) -> bool:
+            if statuses is not None and task.status not in statuses:
+                return False
+            if set_id is not None and task.set_id != set_id:
+                return False
+            return in_range(task.updated_at or task.created_at)
+
+        end = None if limit is None else offset + limit
+        queued: itertools.chain[PendingEntry | DownloadTask] = itertools.chain(
+            self._scheduler.ordered(), waiting
+        )
+        if statuses is not None and "queued" not in statuses:
+            queued_page, queued_total = [], 0
+        elif set_id is None and since is None and until is None:
+            # フィルタ無しなら件数は数えるだけで、ページ分だけタスク化する
+            queued_page = list(itertools.islice(queued, offset, end))
+            queued_total = len(self._scheduler) + len(waiting)
+        else:
+            hits = [
+                item
+                for item in queued
+                if (set_id is None or item.set_id == set_id)
+                and in_range(
+                    item.queued_at
+                    if isinstance(item, PendingEntry)
+                    else item.updated_at or item.created_at
+                )
+            ]
+            queued_page, queued_total = hits[offset:end], len(hits)
+        filtered_done = [t for t in finished if matches(t)]
+
+        return {
+            "epoch": self._epoch,
+            "seq": self._seq,
+            "queued": [
+                self._serialize_task(
+                    self._tasks.get(item.set_id) or self._materialize(item)
+                    if isinstance(item, PendingEntry)
+                    else item
+                )
+                for item in queued_page
+            ],
+            "running": [self._serialize_task(t) for t in running if matches(t)],
+            "done": [self._serialize_task(t) for t in filtered_done[offset:end]],
+            "queued_total": queued_total,
+            "done_total": len(filtered_done),
+            "paused": self._scheduler.paused,
+            "schedule_policy": self._scheduler.policy,
+            **self._estimate(waiting, running),
+        }
+
+    def configure_history(
+        self, limit: int, max_age: float, spill_path: Path | None
+    ) -> None:
+        """履歴の上限を実行中に変更する (0 = 無制限)。"""
+        self.history_limit = max(0, limit)
+        self.history_max_age = max(0.0, max_age)
+        self.history_spill_path = spill_path
+        self._trim_history()
+
+    def _finish(self, task: DownloadTask) -> None:
+        """終了状態になったタスクを履歴の末尾へ積み、上限を超えた古いものを落とす。"""
+        DOWNLOAD_OUTCOMES.labels(_mirror(task.url), task.status).inc()
+        self._history.pop(task.set_id, None)
+        self._history[task.set_id] = task.updated_at or time.time()
+        self._trim_history()
+
+    def _trim_history(self) -> None:
+        cutoff = time.time() - self.history_max_age if self.history_max_age else None
+        evicted: list[DownloadTask] = []
+        while self._history:
+            set_id, finished_at = next(iter(self._history.items()))
+            within_limit = (
+                not self.history_limit or len(self._history) <= self.history_limit
+            )
+            if within_limit and (cutoff is None or finished_at >= cutoff):
+                break
+            del self._history[set_id]
+            task = self._tasks.get(set_id)
+            if task is not None and task.status in FINISHED_STATUSES:
+                del self._tasks[set_id]
+                evicted.append(task)
+        if not evicted:
+            return
+        if self._event_bus:
+            self._dirty.update(t.set_id for t in evicted)
+            self._publish_status()
+        if self.history_spill_path:
+            lines = "".join(
+                json.dumps(self._serialize_task(t), ensure_ascii=False) + "\n"
+                for t in evicted
+            )
+            try:
+                self._last_spill_task = asyncio.create_task(
+                    self._writer.run(self._append_spill, lines)
+                )
+            except RuntimeError:
+                self._append_spill(lines)
+
+    def _append_spill(self, lines: str) -> None:
+        try:
+            self.history_spill_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.history_spill_path.open("a", encoding="utf-8") as fh:
+                fh.write(lines)
+        except OSError as exc:
+            logger.warning(
+                "Failed to spill task history path=%s error=%s",
+                self.history_spill_path,
+                exc,
+            )
+
+    def unqueued(self, set_ids: list[int]) -> list[int]:
+        """待機中・実行中でない id だけを返す (enqueue したら受け付けられるもの)。"""
+        return [
+            set_id
+            for set_id in dict.fromkeys(set_ids)
+            if set_id not in self._scheduler
+            and (
+                (task := self._tasks.get(set_id)) is None
+                or task.status not in ACTIVE_STATUSES
+            )
+        ]
+
+    def average_set_size(self) -> float | None:
+        """取得済み / HEAD で分かったサイズの平均。実績が無ければ None。"""
+        known = [size for size in self._scheduler.known_sizes() if size]
+        known += [
+            t.total_bytes
             for t in self._tasks.values()
-            if t.status in {"completed", "failed", "skipped"}
+            if t.status == "completed" and t.total_bytes
         ]
+        return sum(known) / len(known) if known else None
 
-        # Backfill metadata for existing tasks
-        all_tasks = queued + running + finished
-        for task in all_tasks:
-            if (
-                (not task.artist or not task.title)
-                and self.index
-                and task.set_id in self.index.metadata
-            ):
-                metadata = self.index.metadata[task.set_id]
-                if len(metadata) >= 4:
-                    _, artist, title, _creator = metadata
-                    if not task.artist:
-                        task.artist = artist
-                    if not task.title:
-                        task.title = title
+    def _estimate(
+        self, waiting: list[DownloadTask], running: list[DownloadTask]
+    ) -> dict[str, object]:
+        """残りバイト数と ETA の見積もり。サイズ不明分は既知サイズの平均で埋める。"""
+        sizes = self._scheduler.known_sizes()
+        sizes += [t.expected_bytes for t in waiting if t.expected_bytes is not None]
+        pending = len(self._scheduler) + len(waiting)
+        known = [size for size in sizes if size]
+        known += [
+            t.total_bytes
+            for t in self._tasks.values()
+            if t.status == "completed" and t.total_bytes
+        ]
+        average = sum(known) / len(known) if known else None
+
+        unknown = pending - len(sizes)
+        remaining = float(sum(sizes))
+        if average is not None:
+            remaining += average * unknown
+        speed = 0.0
+        for task in running:
+            size = task.total_bytes or task.expected_bytes or average
+            if size:
+                remaining += max(0, size - task.bytes_downloaded)
+            speed += task.speed_bps or 0.0
 
+        has_estimate = average is not None or (unknown == 0 and (pending or running))
         return {
-            "queued": [self._serialize_task(t) for t in queued],
-            "running": [self._serialize_task(t) for t in running],
-            "done": [self._serialize_task(t) for t in finished],
+            "estimated_total_bytes": int(remaining) if has_estimate else None,
+            "unknown_size_count": unknown,
+            "eta_seconds": remaining / speed if has_estimate and speed > 0 else None,
         }
 
-    def _publish_status(self) -> None:
-        """Push current queue snapshot to SSE subscribers."""
+    def _publish_status(self, *tasks: DownloadTask) -> None:
+        """
+        変更のあったタスクを記録し、同じループ周回内の変更をまとめて 1 つの差分として流す。
+        クライアントは seq が飛んだら /api/queue/snapshot で取り直す。
+        """
         if not self._event_bus:
             return
+        self._dirty.update(t.set_id for t in tasks)
+        if self._flush_scheduled:
+            return
+        try:
+            asyncio.get_running_loop().call_soon(self._flush_status)
+        except RuntimeError:
+            # event loop not running (during tests); ignore
+            return
+        self._flush_scheduled = True
+
+    def _flush_status(self) -> None:
+        self._flush_scheduled = False
+        dirty, self._dirty = self._dirty, set()
+        self._seq += 1
+        views = {s: self._view(s) for s in dirty}
+        changed = [task for task in views.values() if task is not None]
+        enqueued, self._enqueued = self._enqueued, 0
+        self._publish_queue(
+            {
+                "type": "delta",
+                "epoch": self._epoch,
+                "seq": self._seq,
+                "tasks": [self._serialize_task(t) for t in changed],
+                "removed": [s for s, task in views.items() if task is None],
+                "enqueued": enqueued,
+                "queued_total": self._queued_count(),
+                "done_total": len(self._history),
+                "paused": self._scheduler.paused,
+                "schedule_policy": self._scheduler.policy,
+            }
+        )
+
+    def _queued_count(self) -> int:
+        # スケジューラ内 + リトライ待ち (_delayed には取り消し済みの古い要素も残る)
+        waiting = sum(
+            1
+            for _, set_id in self._delayed
+            if (task := self._tasks.get(set_id)) is not None
+            and task.status == "queued"
+            and task.next_retry_at is not None
+        )
+        return len(self._scheduler) + waiting
+
+    def _publish_queue(self, data: dict[str, object]) -> None:
         try:
             self._last_publish_task = asyncio.create_task(
-                self._event_bus.publish({"topic": "queue", "data": self.status()})
+                self._event_bus.publish({"topic": "queue", "data": data})
+            )
+        except RuntimeError:
+            pass
+
+    def _publish_event(self, kind: str, **data: object) -> None:
+        """pause/resume/cancel などの操作イベントを通知する。"""
+        if not self._event_bus:
+            return
+        try:
+            self._last_event_task = asyncio.create_task(
+                self._event_bus.publish(
+                    {"topic": "queue_event", "data": {"type": kind, **data}}
+                )
             )
         except RuntimeError:
-            # event loop not running (during tests); ignore
             pass
 
     def _serialize_task(self, task: DownloadTask) -> dict[str, object]:
+        self._backfill_metadata(task)
         return {
             "set_id": task.set_id,
             "status": task.status,
+            "priority": task.priority,
             "message": task.message,
             "path": str(task.path) if task.path else None,
             "archive_path": str(task.archive_path) if task.archive_path else None,
             "progress": task.progress,
             "bytes_downloaded": task.bytes_downloaded,
             "total_bytes": task.total_bytes,
+            "expected_bytes": task.expected_bytes,
             "speed_bps": task.speed_bps,
             "updated_at": task.updated_at,
             "display_name": task.display_name,
@@ -352,9 +1174,26 @@ class DownloadManager:
             "title": task.title,
             "artist_unicode": task.artist_unicode,
             "title_unicode": task.title_unicode,
+            "attempts": task.attempts,
+            "last_error": task.last_error,
+            "error_kind": task.error_kind,
+            "next_retry_at": task.next_retry_at,
         }
 
+    def _backfill_metadata(self, task: DownloadTask) -> None:
+        if (task.artist and task.title) or not self.index:
+            return
+        metadata = self.index.metadata.get(task.set_id)
+        if metadata and len(metadata) >= 4:
+            _, artist, title, _creator = metadata
+            if not task.artist:
+                task.artist = artist
+            if not task.title:
+                task.title = title
+
     def _find_existing_archive(self, set_id: int) -> Path | None:
+        if self.index:
+            return self.index.find_archive(set_id)
         patterns = [
             f"{set_id} *.osz",
             f"{set_id}-*.osz",
@@ -415,17 +1254,19 @@ class DownloadManager:
         return None
 
     def _build_display_name(self, task: DownloadTask) -> str:
-        artist = self._sanitize(task.artist or "")
-        title = self._sanitize(task.title or "")
-        if artist and title:
-            name = f"{task.set_id} {artist} - {title}"
-        elif artist or title:
-            name = f"{task.set_id} {artist or title}"
-        else:
-            name = f"{task.set_id}"
+        name = self._archive_name(task.set_id, task.artist, task.title)
         task.display_name = name
         return name
 
+    def _archive_name(self, set_id: int, artist: str | None, title: str | None) -> str:
+        artist = self._sanitize(artist or "")
+        title = self._sanitize(title or "")
+        if artist and title:
+            return f"{set_id} {artist} - {title}"
+        if artist or title:
+            return f"{set_id} {artist or title}"
+        return f"{set_id}"
+
     def _sanitize(self, value: str) -> str:
         invalid = '<>:"/\\|?*'
         sanitized = "".join("_" if ch in invalid else ch for ch in value)
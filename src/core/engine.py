@@ -0,0 +1,446 @@
+import asyncio
+import inspect
+import itertools
+import logging
+import multiprocessing
+import pickle
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any
+
+from core.bandwidth import BandwidthLimiter
+from core.downloader import ENGINE_METRICS, DownloadManager
+from core.metrics import REGISTRY
+from core.scanner import SongIndex
+from core.transport import HttpTransport
+
+logger = logging.getLogger("osu_sync.engine")
+
+# 子プロセスに転送してよい DownloadManager のメソッド
+ENGINE_COMMANDS = frozenset(
+    {
+        "enqueue",
+        "status",
+        "cancel",
+        "set_priority",
+        "pause",
+        "resume",
+        "set_schedule_policy",
+        "configure_history",
+        "configure_bandwidth",
+        "unqueued",
+        "average_set_size",
+        "wait_idle",
+    }
+)
+
+
+class EngineError(RuntimeError):
+    """ダウンロードエンジン (子プロセス) が応答しない / 落ちた。"""
+
+
+class DownloadEngine(ABC):
+    """
+    API 側から見たダウンローダの窓口。メソッドはすべて非同期で、
+    同じプロセスの DownloadManager (LocalEngine) と子プロセス (ProcessEngine) を
+    同じように扱えるようにする。
+    """
+
+    index: SongIndex | None = None
+
+    @abstractmethod
+    async def start(self) -> None: ...
+
+    @abstractmethod
+    async def close(self) -> None: ...
+
+    @abstractmethod
+    async def _call(self, method: str, *args: Any, **kwargs: Any) -> Any: ...
+
+    async def enqueue(
+        self,
+        set_ids: list[int],
+        metadata: dict[int, dict[str, str]] | None = None,
+        priority: int = 0,
+    ) -> list[int]:
+        return await self._call("enqueue", list(set_ids), metadata, priority)
+
+    async def status(self, **filters: Any) -> dict[str, Any]:
+        return await self._call("status", **filters)
+
+    async def cancel(self, set_id: int) -> bool:
+        return await self._call("cancel", set_id)
+
+    async def set_priority(self, set_id: int, priority: int) -> bool:
+        return await self._call("set_priority", set_id, priority)
+
+    async def pause(self, interrupt: bool = False) -> None:
+        await self._call("pause", interrupt=interrupt)
+
+    async def resume(self) -> None:
+        await self._call("resume")
+
+    async def set_schedule_policy(self, policy: str) -> None:
+        await self._call("set_schedule_policy", policy)
+
+    async def configure_history(
+        self, limit: int, max_age: float, spill_path: Path | None
+    ) -> None:
+        await self._call("configure_history", limit, max_age, spill_path)
+
+    async def configure_bandwidth(
+        self, limit_kbps: int, per_task_kbps: int, schedule: object
+    ) -> None:
+        await self._call("configure_bandwidth", limit_kbps, per_task_kbps, schedule)
+
+    async def unqueued(self, set_ids: list[int]) -> list[int]:
+        return await self._call("unqueued", list(set_ids))
+
+    async def average_set_size(self) -> float | None:
+        return await self._call("average_set_size")
+
+    async def wait_idle(self) -> None:
+        await self._call("wait_idle")
+
+    async def metrics_text(self) -> str:
+        return REGISTRY.render()
+
+    async def transport_stats(self) -> dict[str, dict[str, Any]]:
+        return {}
+
+
+class LocalEngine(DownloadEngine):
+    """API と同じイベントループで DownloadManager を動かす (既定)。"""
+
+    def __init__(self, manager: DownloadManager) -> None:
+        self.manager = manager
+        self.index = manager.index
+
+    async def start(self) -> None:
+        await self.manager.start_workers()
+
+    async def close(self) -> None:
+        await self.manager.close()
+
+    async def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        result = getattr(self.manager, method)(*args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+
+class ProcessEngine(DownloadEngine):
+    """
+    DownloadManager を別プロセスで動かし、コマンドとイベントを 2 本のパイプでやり取りする。
+    転送・書き込み・zip 検証が API のイベントループや GIL と競合しなくなる。
+      親 -> 子: (request_id, method, args, kwargs)
+      子 -> 親: ("result", request_id, ok, value) / ("event", event) / ("owned", ...)
+    受信はそれぞれ専用スレッドで行い、イベントループへ call_soon_threadsafe で渡す。
+    """
+
+    START_TIMEOUT = 30.0
+    STOP_TIMEOUT = 10.0
+
+    def __init__(
+        self,
+        options: dict[str, Any],
+        index: SongIndex | None = None,
+        event_bus=None,
+    ) -> None:
+        self._options = options
+        self.index = index
+        self._event_bus = event_bus
+        self._process: multiprocessing.process.BaseProcess | None = None
+        self._commands = None
+        self._events = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._closing = False
+
+    async def start(self) -> None:
+        ctx = multiprocessing.get_context("spawn")
+        command_reader, command_writer = ctx.Pipe(duplex=False)
+        event_reader, event_writer = ctx.Pipe(duplex=False)
+        self._process = ctx.Process(
+            target=run_engine,
+            args=(command_reader, event_writer, self._options),
+            name="osu-sync-engine",
+            daemon=True,
+        )
+        self._process.start()
+        # 子に渡した端は親側では閉じておく (子が落ちたら recv が EOF になる)
+        command_reader.close()
+        event_writer.close()
+        self._commands = command_writer
+        self._events = event_reader
+        self._loop = asyncio.get_running_loop()
+        self._reader = threading.Thread(
+            target=self._read_events, name="osu-sync-engine-reader", daemon=True
+        )
+        self._reader.start()
+        await asyncio.wait_for(self._call("ping"), self.START_TIMEOUT)
+        logger.info("Download engine process started pid=%s", self._process.pid)
+
+    async def close(self) -> None:
+        if self._process is None:
+            return
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._call("shutdown"), self.STOP_TIMEOUT)
+        except (EngineError, TimeoutError):
+            pass
+        await asyncio.to_thread(self._process.join, self.STOP_TIMEOUT)
+        if self._process.is_alive():
+            logger.warning("Download engine did not exit; terminating")
+            self._process.terminate()
+            await asyncio.to_thread(self._process.join, self.STOP_TIMEOUT)
+        self._commands.close()
+        logger.info("Download engine process stopped")
+
+    async def _call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        if self._process is None or not self._process.is_alive():
+            raise EngineError("download engine is not running")
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = future
+        try:
+            self._commands.send((request_id, method, args, kwargs))
+        except (OSError, ValueError) as exc:
+            self._pending.pop(request_id, None)
+            raise EngineError(f"download engine is not reachable: {exc}") from exc
+        return await future
+
+    async def metrics_text(self) -> str:
+        try:
+            engine = await self._call("render_metrics")
+        except EngineError:
+            engine = ""
+        return REGISTRY.render(exclude=ENGINE_METRICS) + engine
+
+    async def transport_stats(self) -> dict[str, dict[str, Any]]:
+        return await self._call("transport_stats")
+
+    def _read_events(self) -> None:
+        while True:
+            try:
+                message = self._events.recv()
+            except (EOFError, OSError):
+                break
+            except Exception as exc:
+                # 受信はできたが復元できなかった (どの要求への返事かも分からない)。
+                # 待っている呼び出しを失敗させ、読み続ける
+                logger.error("Undecodable message from download engine: %r", exc)
+                try:
+                    self._loop.call_soon_threadsafe(
+                        self._fail_pending, EngineError(f"undecodable reply: {exc!r}")
+                    )
+                except RuntimeError:
+                    return
+                continue
+            try:
+                self._loop.call_soon_threadsafe(self._dispatch, message)
+            except RuntimeError:
+                return  # loop closed
+        try:
+            self._loop.call_soon_threadsafe(self._on_exit)
+        except RuntimeError:
+            pass
+
+    def _dispatch(self, message: tuple) -> None:
+        kind = message[0]
+        if kind == "result":
+            _, request_id, ok, value = message
+            future = self._pending.pop(request_id, None)
+            if future is None or future.done():
+                return
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        elif kind == "event":
+            if self._event_bus:
+                self._last_publish_task = asyncio.create_task(
+                    self._event_bus.publish(message[1])
+                )
+        elif kind == "owned":
+            _, set_id, metadata, archive_path = message
+            if self.index:
+                self.index.mark_owned(set_id, metadata, archive_path)
+
+    def _on_exit(self) -> None:
+        if not self._closing:
+            logger.error(
+                "Download engine process exited unexpectedly exitcode=%s",
+                self._process.exitcode if self._process else None,
+            )
+        self._fail_pending(EngineError("download engine exited"))
+
+    def _fail_pending(self, exc: EngineError) -> None:
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+
+# --- 子プロセス側 ---------------------------------------------------------
+
+
+class _PipeEventBus:
+    """DownloadManager の event_bus の代わりに、イベントを親へ送る。"""
+
+    def __init__(self, send) -> None:
+        self._send = send
+
+    async def publish(self, event: dict) -> None:
+        self._send(("event", event))
+
+
+class _EngineIndex(SongIndex):
+    """
+    子プロセス側の索引。osu!.db は親が読んでいるので、ここでは .osz の列挙だけを持ち
+    既存アーカイブの判定とファイル名からのメタデータ補完に使う。
+    DL 完了による所有状態の更新は親の SongIndex へ転送する。
+    """
+
+    def __init__(self, songs_dir: str, send) -> None:
+        super().__init__(songs_dir=songs_dir)
+        self._send = send
+
+    async def load_archives(self) -> None:
+        # 走査中の変更は次回 find_archive で拾えるよう、先に mtime を控える
+        mtime = self._songs_dir_mtime()
+        owned, metadata, archives = await self._scan_osz_fast()
+        # 走査中に mark_owned されたものを優先する
+        self._owned |= owned
+        self._metadata = {**metadata, **self._metadata}
+        self._archives = {**archives, **self._archives}
+        self._archives_mtime = mtime
+
+    def mark_owned(
+        self,
+        set_id: int,
+        metadata: tuple[int, str, str, str] | None = None,
+        archive_path: Path | None = None,
+    ) -> None:
+        super().mark_owned(set_id, metadata, archive_path)
+        self._send(("owned", set_id, metadata, archive_path))
+
+
+def run_engine(commands, events, options: dict[str, Any]) -> None:
+    """子プロセスのエントリポイント (spawn で起動される)。"""
+    if not logging.getLogger().handlers:
+        logging.basicConfig(
+            level=logging.INFO,
+            format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        )
+    try:
+        asyncio.run(_serve(commands, events, dict(options)))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _serve(commands, events, options: dict[str, Any]) -> None:
+    loop = asyncio.get_running_loop()
+    # 送信はすべてこのイベントループのスレッドから行う
+    send = events.send
+
+    transport = HttpTransport(**options.pop("transport", {}))
+    bandwidth_options = options.pop("bandwidth", {})
+    prewarm = options.pop("prewarm", False)
+    index = _EngineIndex(options["songs_dir"], send)
+    manager = DownloadManager(
+        **options,
+        index=index,
+        event_bus=_PipeEventBus(send),
+        bandwidth=BandwidthLimiter(
+            limit_kbps=bandwidth_options.get("limit_kbps", 0),
+            per_task_kbps=bandwidth_options.get("per_task_kbps", 0),
+            schedule=BandwidthLimiter.parse_schedule(bandwidth_options.get("schedule")),
+        ),
+        client=transport.client("download", follow_redirects=True, timeout=60),
+    )
+    await manager.start_workers()
+    # 読み込みが終わるまでは Songs 直下の列挙だけで既存アーカイブを判定する
+    index_task = asyncio.create_task(index.load_archives())
+    if prewarm:
+        prewarm_task = asyncio.create_task(
+            transport.prewarm("download", [options["url_template"]])
+        )
+
+    extra = {
+        "ping": lambda: True,
+        "render_metrics": lambda: REGISTRY.render(include=ENGINE_METRICS),
+        "transport_stats": transport.stats,
+    }
+    inbox: asyncio.Queue = asyncio.Queue()
+
+    def pump() -> None:
+        while True:
+            try:
+                message = commands.recv()
+            except (EOFError, OSError):
+                message = None  # 親が落ちた
+            loop.call_soon_threadsafe(inbox.put_nowait, message)
+            if message is None:
+                return
+
+    threading.Thread(target=pump, name="osu-sync-engine-commands", daemon=True).start()
+
+    async def handle(request_id: int, method: str, args: tuple, kwargs: dict) -> None:
+        try:
+            if method in ENGINE_COMMANDS:
+                result = getattr(manager, method)(*args, **kwargs)
+            elif method in extra:
+                result = extra[method](*args, **kwargs)
+            else:
+                raise EngineError(f"unknown engine command: {method}")
+            if inspect.isawaitable(result):
+                result = await result
+            reply = ("result", request_id, True, result)
+        except Exception as exc:
+            reply = ("result", request_id, False, _portable_error(exc))
+        try:
+            send(reply)
+        except (pickle.PicklingError, TypeError, AttributeError) as exc:
+            # 戻り値や例外が pickle できなかった (送信前に失敗するので再送できる)
+            send(("result", request_id, False, EngineError(repr(exc))))
+
+    # wait_idle などの長いコマンドが他を塞がないよう、1 件ずつタスクにする
+    running: set[asyncio.Task] = set()
+    shutdown_id: int | None = None
+    while True:
+        message = await inbox.get()
+        if message is None:
+            break
+        request_id, method, args, kwargs = message
+        if method == "shutdown":
+            shutdown_id = request_id
+            break
+        job = asyncio.create_task(handle(request_id, method, args, kwargs))
+        running.add(job)
+        job.add_done_callback(running.discard)
+
+    for job in running:
+        job.cancel()
+    index_task.cancel()
+    if prewarm:
+        prewarm_task.cancel()
+    await manager.close()
+    await transport.aclose()
+    if shutdown_id is not None:
+        send(("result", shutdown_id, True, None))
+
+
+def _portable_error(exc: Exception) -> Exception:
+    """
+    親で復元できる例外だけをそのまま返す。引数の違う __init__ を持つ例外
+    (DownloadError など) は dumps できても loads で失敗するので、
+    ここで往復させて確かめ、だめなら EngineError に包む。
+    """
+    try:
+        pickle.loads(pickle.dumps(exc))
+    except Exception:
+        return EngineError(repr(exc))
+    return exc
@@ -0,0 +1,579 @@
+import asyncio
+import bisect
+import logging
+import math
+import re
+import time
+from array import array
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+from core.catalog import FILTER_COLUMNS, MODES, Catalog
+from core.filter_schema import FilterRequest, Group, Rule
+from core.metrics import REGISTRY
+from core.scanner import SongIndex
+
+logger = logging.getLogger("osu_sync.filter_engine")
+
+FILTER_SECONDS = REGISTRY.histogram(
+    "osu_sync_filter_seconds",
+    "Local FilterRequest time by phase (build/evaluate).",
+    ("phase",),
+)
+
+NUMERIC_COLUMNS = frozenset(
+    {
+        "beatmap_id",
+        "set_id",
+        "mode",
+        "stars",
+        "length",
+        "bpm",
+        "cs",
+        "ar",
+        "od",
+        "hp",
+        "plays",
+        "favourites",
+    }
+)
+# 小数で持っている列。= / != は API の丸め (小数 2 桁) 程度の幅を持たせる
+_FLOAT_COLUMNS = frozenset({"stars", "bpm", "cs", "ar", "od", "hp"})
+_FLOAT_EPSILON = 0.005
+
+# Rule.field (大文字小文字・記号は無視) → 列
+_FIELDS = {
+    "cs": "cs",
+    "circlesize": "cs",
+    "ar": "ar",
+    "approachrate": "ar",
+    "od": "od",
+    "overalldifficulty": "od",
+    "accuracy": "od",
+    "hp": "hp",
+    "hpdrain": "hp",
+    "drain": "hp",
+    "bpm": "bpm",
+    "length": "length",
+    "totallength": "length",
+    "drainlength": "length",
+    "stars": "stars",
+    "star": "stars",
+    "sr": "stars",
+    "difficultyrating": "stars",
+    "mode": "mode",
+    "gamemode": "mode",
+    "status": "status",
+    "rankedstatus": "status",
+    "approved": "status",
+    "artist": "artist",
+    "title": "title",
+    "creator": "creator",
+    "mapper": "creator",
+    "version": "version",
+    "difficulty": "version",
+    "difficultyname": "version",
+    "source": "source",
+    "tags": "tags",
+    "plays": "plays",
+    "playcount": "plays",
+    "favourites": "favourites",
+    "favorites": "favourites",
+    "favouritecount": "favourites",
+    "ranked": "ranked",
+    "rankeddate": "ranked",
+    "setid": "set_id",
+    "beatmapsetid": "set_id",
+    "beatmapid": "beatmap_id",
+    "id": "beatmap_id",
+    "owned": "owned",
+}
+_MODE_NAMES = {
+    "osu": 0,
+    "std": 0,
+    "standard": 0,
+    "taiko": 1,
+    "fruits": 2,
+    "catch": 2,
+    "ctb": 2,
+    "mania": 3,
+}
+_OPERATORS = {
+    "=": "=",
+    "==": "=",
+    "!=": "!=",
+    "<>": "!=",
+    ">": ">",
+    ">=": ">=",
+    "<": "<",
+    "<=": "<=",
+    "contains": "contains",
+    "like": "contains",
+    "notcontains": "notcontains",
+    "!contains": "notcontains",
+    "notlike": "notcontains",
+    "startswith": "startswith",
+    "endswith": "endswith",
+}
+_TEXT_ONLY = frozenset({"contains", "notcontains", "startswith", "endswith"})
+# 文字列の部分一致の当てはまり具合は、この件数の標本で見積もる
+_SAMPLE_SIZE = 256
+
+
+class FilterError(ValueError):
+    """FilterRequest を評価できない (未知の列 / 演算子 / 壊れたグループ木)。"""
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[^a-z0-9!<>=]", "", name.lower())
+
+
+class FilterTable:
+    """
+    難易度 1 つを 1 行とした列指向のデータ。数値列は array('d') (欠損は NaN)、文字列列は
+    小文字にした list で持つ。数値列の並べ替え済み索引 (index) は範囲条件を二分探索で引くのと、
+    当てはまる件数の見積もり (条件を評価する順番) に使う。
+    """
+
+    def __init__(self, rows: list[tuple]) -> None:
+        self.rows = rows
+        self.size = len(rows)
+        self.numeric: dict[str, array] = {}
+        self.text: dict[str, list[str]] = {}
+        self._sorted: dict[str, tuple[array, array]] = {}
+        self._postings: dict[str, dict[str, list[int]]] = {}
+        columns = list(zip(*rows, strict=True)) if rows else [()] * len(FILTER_COLUMNS)
+        for name, values in zip(FILTER_COLUMNS, columns, strict=True):
+            if name in NUMERIC_COLUMNS:
+                self.numeric[name] = array(
+                    "d", [math.nan if v is None else v for v in values]
+                )
+            else:
+                lowered = {v: (v or "").lower() for v in set(values)}
+                self.text[name] = [lowered[v] for v in values]
+        step = max(1, self.size // _SAMPLE_SIZE)
+        self.sample = range(0, self.size, step)
+        # set_id → 行番号 (表示用に手持ちのセットを組み立てるとき全行を舐めないように)
+        set_rows: defaultdict[int, list[int]] = defaultdict(list)
+        for i, set_id in enumerate(self.numeric["set_id"]):
+            if set_id == set_id:
+                set_rows[int(set_id)].append(i)
+        self.set_rows: dict[int, list[int]] = dict(set_rows)
+
+    def all_rows(self) -> set[int]:
+        return set(range(self.size))
+
+    def index(self, column: str) -> tuple[array, array]:
+        """(昇順の値, その行番号)。NaN の行は入れない。"""
+        cached = self._sorted.get(column)
+        if cached is None:
+            values = self.numeric[column]
+            order = sorted(
+                (i for i in range(self.size) if values[i] == values[i]),
+                key=values.__getitem__,
+            )
+            cached = (array("d", (values[i] for i in order)), array("q", order))
+            self._sorted[column] = cached
+        return cached
+
+    def postings(self, column: str) -> dict[str, list[int]]:
+        """値 → 行番号 (文字列列の = 用)。"""
+        cached = self._postings.get(column)
+        if cached is None:
+            cached = defaultdict(list)
+            for i, value in enumerate(self.text[column]):
+                cached[value].append(i)
+            self._postings[column] = cached = dict(cached)
+        return cached
+
+    def set_ids(self, rows: Iterable[int]) -> list[int]:
+        """当てはまった行の set_id (新しい順)。"""
+        set_col = self.numeric["set_id"]
+        return sorted({int(set_col[i]) for i in rows}, reverse=True)
+
+
+class _Node:
+    def estimate(self, table: FilterTable) -> int:
+        raise NotImplementedError
+
+    def select(self, table: FilterTable, rows: set[int] | None) -> set[int]:
+        """rows (None = 全行) のうち当てはまる行を返す。"""
+        raise NotImplementedError
+
+
+@dataclass
+class _Numeric(_Node):
+    column: str
+    op: str
+    value: float
+
+    def _bounds(self) -> tuple[float, float]:
+        eps = _FLOAT_EPSILON if self.column in _FLOAT_COLUMNS else 0.0
+        return self.value - eps, self.value + eps
+
+    def _ranges(self, table: FilterTable) -> list[tuple[int, int]]:
+        # 並べ替え済み索引の上の [start, stop)
+        values, _ = table.index(self.column)
+        lo, hi = self._bounds()
+        n = len(values)
+        if self.op == ">":
+            return [(bisect.bisect_right(values, self.value), n)]
+        if self.op == ">=":
+            return [(bisect.bisect_left(values, self.value), n)]
+        if self.op == "<":
+            return [(0, bisect.bisect_left(values, self.value))]
+        if self.op == "<=":
+            return [(0, bisect.bisect_right(values, self.value))]
+        start, stop = bisect.bisect_left(values, lo), bisect.bisect_right(values, hi)
+        if self.op == "=":
+            return [(start, stop)]
+        return [(0, start), (stop, n)]
+
+    def estimate(self, table: FilterTable) -> int:
+        return sum(stop - start for start, stop in self._ranges(table))
+
+    def select(self, table: FilterTable, rows: set[int] | None) -> set[int]:
+        if rows is not None and len(rows) < self.estimate(table):
+            # 候補の方が少なければ候補だけを見る
+            values = table.numeric[self.column]
+            test = self._test()
+            return {i for i in rows if test(values[i])}
+        _, order = table.index(self.column)
+        hit: set[int] = set()
+        for start, stop in self._ranges(table):
+            hit.update(order[start:stop])
+        return hit if rows is None else hit & rows
+
+    def _test(self) -> Callable[[float], bool]:
+        v = self.value
+        lo, hi = self._bounds()
+        # NaN はどの比較でも False になる (欠損は当てはまらない)
+        return {
+            ">": lambda x: x > v,
+            ">=": lambda x: x >= v,
+            "<": lambda x: x < v,
+            "<=": lambda x: x <= v,
+            "=": lambda x: lo <= x <= hi,
+            "!=": lambda x: x < lo or x > hi,
+        }[self.op]
+
+
+@dataclass
+class _Text(_Node):
+    column: str
+    op: str
+    value: str
+
+    def _test(self) -> Callable[[str], bool]:
+        v = self.value
+        return {
+            "=": lambda x: x == v,
+            "!=": lambda x: x != v,
+            ">": lambda x: x > v,
+            ">=": lambda x: x >= v,
+            "<": lambda x: bool(x) and x < v,
+            "<=": lambda x: bool(x) and x <= v,
+            "contains": lambda x: v in x,
+            "notcontains": lambda x: v not in x,
+            "startswith": lambda x: x.startswith(v),
+            "endswith": lambda x: x.endswith(v),
+        }[self.op]
+
+    def estimate(self, table: FilterTable) -> int:
+        if self.op == "=":
+            return len(table.postings(self.column).get(self.value, ()))
+        if self.op == "!=":
+            return table.size - len(table.postings(self.column).get(self.value, ()))
+        values, test = table.text[self.column], self._test()
+        sample = table.sample
+        if not sample:
+            return 0
+        hits = sum(1 for i in sample if test(values[i]))
+        return hits * table.size // len(sample)
+
+    def select(self, table: FilterTable, rows: set[int] | None) -> set[int]:
+        if self.op == "=":
+            hit = set(table.postings(self.column).get(self.value, ()))
+            return hit if rows is None else hit & rows
+        values, test = table.text[self.column], self._test()
+        if rows is None:
+            return {i for i, value in enumerate(values) if test(value)}
+        return {i for i in rows if test(values[i])}
+
+
+@dataclass
+class _Owned(_Node):
+    owned: set[int]
+    want: bool
+
+    def estimate(self, table: FilterTable) -> int:
+        set_col = table.numeric["set_id"]
+        sample = table.sample
+        if not sample:
+            return 0
+        hits = sum(1 for i in sample if (set_col[i] in self.owned) == self.want)
+        return hits * table.size // len(sample)
+
+    def select(self, table: FilterTable, rows: set[int] | None) -> set[int]:
+        set_col, owned, want = table.numeric["set_id"], self.owned, self.want
+        candidates = range(table.size) if rows is None else rows
+        return {i for i in candidates if (set_col[i] in owned) == want}
+
+
+@dataclass
+class _Group(_Node):
+    connector: str
+    negate: bool
+    children: list[_Node] = field(default_factory=list)
+
+    def estimate(self, table: FilterTable) -> int:
+        if not self.children:
+            matched = table.size
+        elif self.connector == "and":
+            matched = min(child.estimate(table) for child in self.children)
+        else:
+            matched = min(
+                table.size, sum(child.estimate(table) for child in self.children)
+            )
+        return table.size - matched if self.negate else matched
+
+    def select(self, table: FilterTable, rows: set[int] | None) -> set[int]:
+        matched = self._select(table, rows)
+        if not self.negate:
+            return matched
+        return (table.all_rows() if rows is None else rows) - matched
+
+    def _select(self, table: FilterTable, rows: set[int] | None) -> set[int]:
+        if not self.children:
+            return table.all_rows() if rows is None else set(rows)
+        ranked = sorted(self.children, key=lambda child: child.estimate(table))
+        if self.connector == "and":
+            # 当てはまりの少ない条件から絞り、空になったら残りは見ない
+            current = rows
+            for child in ranked:
+                current = child.select(table, current)
+                if not current:
+                    break
+            return current
+        # or は当てはまりの多い条件から。まだ当てはまっていない行だけを次に渡し、
+        # 全部当てはまったら残りは見ない
+        remaining = table.all_rows() if rows is None else set(rows)
+        matched: set[int] = set()
+        for child in reversed(ranked):
+            hit = child.select(table, remaining)
+            matched |= hit
+            remaining -= hit
+            if not remaining:
+                break
+        return matched
+
+
+def _parse_length(value: str) -> float:
+    # "3:30" → 210 秒
+    if ":" in value:
+        minutes, _, seconds = value.partition(":")
+        return int(minutes) * 60 + float(seconds)
+    return float(value.rstrip("s"))
+
+
+def _compile_rule(rule: Rule, owned: set[int]) -> _Node:
+    column = _FIELDS.get(_normalize(rule.field))
+    if column is None:
+        raise FilterError(f"unknown filter field: {rule.field}")
+    op = _OPERATORS.get(_normalize(rule.operator))
+    if op is None:
+        raise FilterError(f"unknown operator for {rule.field}: {rule.operator}")
+    raw = rule.value.strip()
+    if column == "owned":
+        if op not in ("=", "!="):
+            raise FilterError(f"owned supports only = and !=: {rule.operator}")
+        want = raw.lower() in {"1", "true", "yes", "on"}
+        return _Owned(owned, want if op == "=" else not want)
+    if column in NUMERIC_COLUMNS:
+        if op in _TEXT_ONLY:
+            raise FilterError(f"{rule.field} is numeric: {rule.operator}")
+        try:
+            if column == "mode" and raw.lower() in _MODE_NAMES:
+                value = float(_MODE_NAMES[raw.lower()])
+            elif column == "length":
+                value = _parse_length(raw)
+            else:
+                value = float(raw)
+        except ValueError as exc:
+            raise FilterError(f"{rule.field} expects a number: {rule.value}") from exc
+        return _Numeric(column, op, value)
+    return _Text(column, op, raw.lower())
+
+
+def compile_filter(request: FilterRequest, owned: set[int]) -> _Node:
+    """
+    FilterRequest のグループ木を評価できる形にする。グループ 0 が根で、parent が
+    自分自身か未知のグループを指すものは根にぶら下げる。
+    """
+    groups: dict[int, Group] = {group.number: group for group in request.groups}
+    children: dict[int, list[int]] = defaultdict(list)
+    for group in request.groups:
+        if group.number == 0:
+            continue
+        parent = group.parent if group.parent in groups or group.parent == 0 else 0
+        if parent == group.number:
+            parent = 0
+        children[parent].append(group.number)
+    rules: dict[int, list[Rule]] = defaultdict(list)
+    for rule in request.rules:
+        if rule.group != 0 and rule.group not in groups:
+            raise FilterError(f"rule refers to unknown group {rule.group}")
+        rules[rule.group].append(rule)
+
+    visited: set[int] = set()
+
+    def build(number: int) -> _Group:
+        if number in visited:
+            raise FilterError(f"group {number} appears twice in the tree")
+        visited.add(number)
+        group = groups.get(number) or Group(number=number)
+        connector = group.connector.strip().lower()
+        if connector not in ("and", "or"):
+            raise FilterError(f"group {number} connector must be and/or")
+        node = _Group(connector, group.not_)
+        node.children += [_compile_rule(rule, owned) for rule in rules[number]]
+        node.children += [build(child) for child in children[number]]
+        return node
+
+    root = build(0)
+    unreachable = set(groups) - visited
+    if unreachable:
+        raise FilterError(f"groups not reachable from the root: {sorted(unreachable)}")
+    return root
+
+
+@dataclass
+class FilterResult:
+    set_ids: list[int]
+    beatmaps: int
+    elapsed_ms: float
+    # 評価に使った列データ。ページを組み立てるときも同じものを使う
+    table: FilterTable = field(repr=False)
+
+
+class FilterEngine:
+    """
+    FilterRequest を手元のデータで評価する。対象は osu!.db の全難易度と、カタログが
+    有効ならカタログの全難易度 (同じ beatmap_id はカタログ側を使う)。
+    列データは両者のどちらかが変わってから最初の検索で作り直す (REBUILD_INTERVAL に 1 回まで)。
+    """
+
+    REBUILD_INTERVAL = 30.0
+
+    def __init__(
+        self,
+        catalog: Callable[[], Catalog | None],
+        index: Callable[[], SongIndex],
+    ) -> None:
+        # どちらも設定変更で作り直されるので都度取りに行く
+        self._catalog = catalog
+        self._index = index
+        self._table: FilterTable | None = None
+        self._key: tuple | None = None
+        self._built_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def search(self, request: FilterRequest) -> FilterResult:
+        started = time.perf_counter()
+        index = self._index()
+        # 木が壊れていれば列データを作る前に弾く
+        root = compile_filter(request, index.owned_set_ids)
+        table = await self.table()
+        evaluated = time.perf_counter()
+        rows = await asyncio.to_thread(root.select, table, None)
+        set_ids = table.set_ids(rows)
+        FILTER_SECONDS.labels("evaluate").observe(time.perf_counter() - evaluated)
+        return FilterResult(
+            set_ids,
+            len(rows),
+            round((time.perf_counter() - started) * 1000, 2),
+            table,
+        )
+
+    async def beatmapsets(
+        self, set_ids: list[int], table: FilterTable
+    ) -> list[dict[str, Any]]:
+        """
+        表示用の beatmapset。カタログに無いもの (手持ちだけ) は、評価に使った table
+        (FilterResult.table) の osu!.db の値で組み立てる。
+        """
+        catalog = self._catalog()
+        found = await catalog.bodies(set_ids) if catalog is not None else {}
+        missing = [set_id for set_id in set_ids if set_id not in found]
+        if missing:
+            found.update(self._describe(table, missing))
+        return [found[set_id] for set_id in set_ids if set_id in found]
+
+    async def table(self) -> FilterTable:
+        catalog, index = self._catalog(), self._index()
+        key = (
+            id(catalog),
+            catalog.revision if catalog is not None else None,
+            id(index),
+            index.revision,
+        )
+        async with self._lock:
+            fresh = time.monotonic() - self._built_at < self.REBUILD_INTERVAL
+            if self._table is None or (key != self._key and not fresh):
+                started = time.perf_counter()
+                self._table = await asyncio.to_thread(self._build, catalog, index)
+                self._key, self._built_at = key, time.monotonic()
+                FILTER_SECONDS.labels("build").observe(time.perf_counter() - started)
+                logger.info(
+                    "Filter table built rows=%s in %.0fms",
+                    self._table.size,
+                    (time.perf_counter() - started) * 1000,
+                )
+            return self._table
+
+    @staticmethod
+    def _build(catalog: Catalog | None, index: SongIndex) -> FilterTable:
+        rows = catalog.filter_rows() if catalog is not None else []
+        seen = {row[0] for row in rows}
+        metadata = index.metadata
+        for beatmap in index.beatmaps:
+            # 未投稿の譜面 (beatmap_id 0) は手持ちの分をそのまま使う
+            if beatmap[0] and beatmap[0] in seen:
+                continue
+            _, artist, title, creator = metadata.get(beatmap[1], (0, "", "", ""))
+            rows.append((*beatmap, artist, title, creator, None, None, None))
+        table = FilterTable(rows)
+        # 索引も作り直しのついでに作っておき、最初の検索を待たせない
+        for column in NUMERIC_COLUMNS:
+            table.index(column)
+        return table
+
+    @staticmethod
+    def _describe(table: FilterTable, set_ids: list[int]) -> dict[int, dict[str, Any]]:
+        found: dict[int, dict[str, Any]] = {}
+        rows = table.rows
+        for row in (rows[i] for sid in set_ids for i in table.set_rows.get(sid, ())):
+            item = found.get(row[1])
+            if item is None:
+                item = found[row[1]] = {
+                    "id": row[1],
+                    "artist": row[14],
+                    "title": row[15],
+                    "creator": row[16],
+                    "status": row[10],
+                    "bpm": row[5],
+                    "beatmaps": [],
+                }
+            mode = row[2]
+            item["beatmaps"].append(
+                {
+                    "id": row[0],
+                    "version": row[11],
+                    "difficulty_rating": row[3],
+                    "total_length": row[4],
+                    "mode": MODES[mode] if mode is not None and 0 <= mode < 4 else "",
+                }
+            )
+        return found
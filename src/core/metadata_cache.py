@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+from core.metrics import REGISTRY
+
+logger = logging.getLogger("osu_sync.metadata_cache")
+
+METADATA_LOOKUPS = REGISTRY.counter(
+    "osu_sync_metadata_lookups_total",
+    "Beatmap / beatmapset metadata lookups by kind and result (cached/fetched/missing).",
+    ("kind", "result"),
+)
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS beatmaps (
+        id INTEGER PRIMARY KEY,
+        beatmapset_id INTEGER,
+        checksum TEXT,
+        fetched_at REAL NOT NULL,
+        body BLOB NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS beatmaps_checksum ON beatmaps (checksum)",
+    """
+    CREATE TABLE IF NOT EXISTS beatmapsets (
+        id INTEGER PRIMARY KEY,
+        fetched_at REAL NOT NULL,
+        body BLOB NOT NULL
+    )
+    """,
+    # 404 だった id / checksum。何度も問い合わせないように覚えておく
+    """
+    CREATE TABLE IF NOT EXISTS missing (
+        kind TEXT NOT NULL,
+        key TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        PRIMARY KEY (kind, key)
+    )
+    """,
+)
+
+# 一覧表示や更新チェックに使わない重い項目
+_DROP_BEATMAP = ("failtimes", "owners")
+_DROP_BEATMAPSET = (
+    "description",
+    "recent_favourites",
+    "related_users",
+    "related_tags",
+    "current_nominations",
+    "current_user_attributes",
+    "pack_tags",
+)
+
+# SQLite の変数上限 (999) に収まるよう IN 句を分ける
+_IN_CHUNK = 500
+
+
+def _pack(value: dict[str, Any], drop: tuple[str, ...]) -> bytes:
+    compact = {k: v for k, v in value.items() if k not in drop}
+    beatmaps = compact.get("beatmaps")
+    if isinstance(beatmaps, list):
+        compact["beatmaps"] = [
+            {k: v for k, v in bm.items() if k not in _DROP_BEATMAP} for bm in beatmaps
+        ]
+    return zlib.compress(
+        json.dumps(compact, ensure_ascii=False, separators=(",", ":")).encode(), 6
+    )
+
+
+def _unpack(body: bytes) -> dict[str, Any]:
+    return json.loads(zlib.decompress(body))
+
+
+def _chunks(values: list, size: int) -> Iterable[list]:
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+class MetadataCache:
+    """
+    /beatmaps, /beatmaps/lookup, /beatmapsets/{id} の結果を SQLite に貯めるローカルキャッシュ。
+    max_age を過ぎたものは無いものとして扱い (取り直させ)、404 だったものも同じ期間覚えておく。
+    sqlite3 の呼び出しはスレッドに逃がす。
+    """
+
+    def __init__(self, path: Path, max_age: float = 7 * 24 * 3600) -> None:
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        try:
+            return self._open()
+        except sqlite3.DatabaseError:
+            logger.warning(
+                "Metadata cache database is corrupt, recreating %s", self.path
+            )
+            self.path.unlink(missing_ok=True)
+            return self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    async def beatmaps(self, ids: list[int]) -> tuple[dict[int, dict], set[int]]:
+        """(見つかったもの, 404 と分かっている id) を返す。"""
+        return await asyncio.to_thread(self._beatmaps_sync, ids)
+
+    async def checksums(self, checksums: list[str]) -> tuple[dict[str, dict], set[str]]:
+        return await asyncio.to_thread(self._checksums_sync, checksums)
+
+    async def beatmapsets(self, ids: list[int]) -> tuple[dict[int, dict], set[int]]:
+        return await asyncio.to_thread(self._beatmapsets_sync, ids)
+
+    async def put_beatmaps(self, beatmaps: list[dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._put_beatmaps_sync, beatmaps)
+
+    async def put_beatmapsets(self, beatmapsets: list[dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._put_beatmapsets_sync, beatmapsets)
+
+    async def mark_missing(self, kind: str, keys: Iterable[object]) -> None:
+        await asyncio.to_thread(self._mark_missing_sync, kind, [str(k) for k in keys])
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            counts = {
+                table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("beatmaps", "beatmapsets", "missing")
+            }
+        return {"path": str(self.path), "max_age": self.max_age, **counts}
+
+    def _beatmaps_sync(self, ids: list[int]) -> tuple[dict[int, dict], set[int]]:
+        rows = self._select("SELECT id, body FROM beatmaps WHERE id IN ({})", ids)
+        found = {row[0]: _unpack(row[1]) for row in rows}
+        return found, {int(k) for k in self._missing("beatmap", ids)}
+
+    def _checksums_sync(self, checksums: list[str]) -> tuple[dict[str, dict], set[str]]:
+        rows = self._select(
+            "SELECT checksum, body FROM beatmaps WHERE checksum IN ({})", checksums
+        )
+        found = {row[0]: _unpack(row[1]) for row in rows}
+        return found, self._missing("checksum", checksums)
+
+    def _beatmapsets_sync(self, ids: list[int]) -> tuple[dict[int, dict], set[int]]:
+        rows = self._select("SELECT id, body FROM beatmapsets WHERE id IN ({})", ids)
+        found = {row[0]: _unpack(row[1]) for row in rows}
+        return found, {int(k) for k in self._missing("beatmapset", ids)}
+
+    def _select(self, sql: str, keys: list, *leading: object) -> list[tuple]:
+        # max_age を過ぎた行は無いものとして扱う
+        cutoff = time.time() - self.max_age
+        rows: list[tuple] = []
+        with self._lock:
+            for chunk in _chunks(keys, _IN_CHUNK):
+                rows += self._conn.execute(
+                    sql.format(",".join("?" * len(chunk))) + " AND fetched_at > ?",
+                    (*leading, *chunk, cutoff),
+                ).fetchall()
+        return rows
+
+    def _missing(self, kind: str, keys: list) -> set[str]:
+        rows = self._select(
+            "SELECT key FROM missing WHERE kind = ? AND key IN ({})",
+            [str(k) for k in keys],
+            kind,
+        )
+        return {row[0] for row in rows}
+
+    def _put_beatmaps_sync(self, beatmaps: list[dict[str, Any]]) -> None:
+        now = time.time()
+        rows = [
+            (
+                bm["id"],
+                bm.get("beatmapset_id"),
+                bm.get("checksum"),
+                now,
+                _pack(bm, _DROP_BEATMAP),
+            )
+            for bm in beatmaps
+            if isinstance(bm.get("id"), int)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO beatmaps"
+                " (id, beatmapset_id, checksum, fetched_at, body) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def _put_beatmapsets_sync(self, beatmapsets: list[dict[str, Any]]) -> None:
+        now = time.time()
+        rows = [
+            (bs["id"], now, _pack(bs, _DROP_BEATMAPSET))
+            for bs in beatmapsets
+            if isinstance(bs.get("id"), int)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO beatmapsets (id, fetched_at, body)"
+                " VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def _mark_missing_sync(self, kind: str, keys: list[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO missing (kind, key, fetched_at) VALUES (?, ?, ?)",
+                [(kind, key, now) for key in keys],
+            )
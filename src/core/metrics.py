@@ -0,0 +1,242 @@
+import bisect
+import math
+from collections.abc import Callable, Iterable
+
+# 秒単位の既定バケット (ローカル I/O から遅いミラーまで)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("_fn", "value")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._fn: Callable[[], float] | None = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set_function(self, fn: Callable[[], float] | None) -> None:
+        """スクレイプ時に fn() の値を返す (キュー長など、数えるより聞く方が安いもの)。"""
+        self._fn = fn
+
+    def get(self) -> float:
+        if self._fn is not None:
+            try:
+                return float(self._fn())
+            except Exception:
+                return math.nan
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ("_upper", "count", "counts", "sum")
+
+    def __init__(self, upper: tuple[float, ...]) -> None:
+        self._upper = upper
+        self.counts = [0] * (len(upper) + 1)  # 末尾は +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self._upper, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values: object):
+        """ラベル値ごとの子を返す。ホットパスでは戻り値を保持して使い回す。"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} expects labels {self.labelnames}, got {values!r}"
+                )
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterable[tuple[str, tuple[str, ...], float, str]]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield self.name, key, child.value, ""
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.dec(amount)
+
+    def set_function(self, fn: Callable[[], float] | None) -> None:
+        self._default.set_function(fn)
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield self.name, key, child.get(), ""
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, help, labelnames)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for upper, count in zip(
+                (*self.buckets, math.inf), child.counts, strict=True
+            ):
+                cumulative += count
+                yield self.name + "_bucket", key, cumulative, _format_value(upper)
+            yield self.name + "_sum", key, child.sum, ""
+            yield self.name + "_count", key, child.count, ""
+
+
+class MetricsRegistry:
+    """
+    プロセス内のメトリクス置き場。記録は属性の加算だけなので常時有効にしておける
+    (ロックは取らない。イベントループ上から記録する前提)。
+    render() で Prometheus のテキスト形式 (0.0.4) に書き出す。
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            # モジュールの再読み込みなどで同名が来たら既存のものを使う
+            if type(existing) is not type(metric):
+                raise ValueError(f"metric {metric.name} already registered")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(
+        self,
+        include: Iterable[str] | None = None,
+        exclude: Iterable[str] = (),
+    ) -> str:
+        """include / exclude はメトリクス名 (別プロセス分と継ぎ合わせるときに使う)。"""
+        include = None if include is None else set(include)
+        exclude = set(exclude)
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            if metric.name in exclude or (
+                include is not None and metric.name not in include
+            ):
+                continue
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, key, value, le in metric._samples():
+                labels = [
+                    f'{name}="{_escape_label(v)}"'
+                    for name, v in zip(metric.labelnames, key, strict=True)
+                ]
+                if le:
+                    labels.append(f'le="{le}"')
+                label_text = "{" + ",".join(labels) + "}" if labels else ""
+                lines.append(f"{sample}{label_text} {_format_value(value)}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+REGISTRY = MetricsRegistry()
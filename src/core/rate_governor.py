@@ -0,0 +1,188 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any
+
+from core.metrics import REGISTRY
+
+GOVERNOR_WAIT = REGISTRY.histogram(
+    "osu_sync_osu_api_wait_seconds",
+    "Time osu! API requests waited for the client-side rate governor.",
+    ("priority",),
+)
+GOVERNOR_WAITING = REGISTRY.gauge(
+    "osu_sync_osu_api_waiting", "osu! API requests waiting for the rate governor."
+)
+GOVERNOR_THROTTLED = REGISTRY.counter(
+    "osu_sync_osu_api_throttled_total",
+    "429 responses that paused the osu! API rate governor.",
+)
+
+
+class Priority(IntEnum):
+    """小さいほど先に通す。"""
+
+    INTERACTIVE = 0  # UI からの検索
+    PREFETCH = 1  # 次ページ先読み / 裏での再検証
+    BULK = 2  # 一括同期 / まとめ引き
+
+
+REQUEST_PRIORITY: ContextVar[Priority] = ContextVar(
+    "osu_request_priority", default=Priority.INTERACTIVE
+)
+
+
+@contextmanager
+def request_priority(priority: Priority) -> Iterator[None]:
+    """この中から送る (この中で作ったタスクも含む) osu! API リクエストの優先度を変える。"""
+    token = REQUEST_PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        REQUEST_PRIORITY.reset(token)
+
+
+class RateGovernor:
+    """
+    osu! API へのリクエストをクライアント側で絞るトークンバケット。
+    待ちが出たら優先度順 (同じ優先度なら到着順) に通し、INTERACTIVE 以外は reserve 個の
+    トークンを残して待つので、裏の処理が走っていても UI の検索はすぐ通る。
+    429 を受けたら Retry-After (無ければ指数バックオフ) の間は全員止め、レートも一時的に下げる。
+    成功が続けば元のレートに戻す。
+    """
+
+    MIN_FACTOR = 0.25
+    RECOVER_STEP = 0.05
+    BACKOFF_BASE = 2.0
+    BACKOFF_MAX = 120.0
+
+    def __init__(self, per_minute: int = 60, burst: int | None = None) -> None:
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wake: asyncio.Event | None = None
+        self._dispatcher: asyncio.Task | None = None
+        self._factor = 1.0
+        self._blocked_until = 0.0
+        self._strikes = 0
+        self.throttled = 0
+        self.configure(per_minute, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        GOVERNOR_WAITING.set_function(lambda: len(self._waiters))
+
+    def configure(self, per_minute: int, burst: int | None = None) -> None:
+        self.per_minute = max(1, per_minute)
+        self.burst = max(1, burst if burst is not None else self.per_minute // 6)
+        # INTERACTIVE のために残しておくトークン数
+        self.reserve = min(3, self.burst - 1)
+
+    @property
+    def rate(self) -> float:
+        """現在のレート (回/秒)。429 の後は下がっている。"""
+        return self.per_minute / 60 * self._factor
+
+    async def acquire(self, priority: Priority | None = None) -> None:
+        priority = REQUEST_PRIORITY.get() if priority is None else priority
+        started = time.monotonic()
+        if not self._waiters and self._try_take(priority, started):
+            GOVERNOR_WAIT.labels(priority.name.lower()).observe(0.0)
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._kick()
+        try:
+            await future
+        finally:
+            GOVERNOR_WAIT.labels(priority.name.lower()).observe(
+                time.monotonic() - started
+            )
+
+    def penalize(self, retry_after: float | None = None) -> float:
+        """429 を受けたときに呼ぶ。全員を止める秒数を返す。"""
+        self._strikes += 1
+        self.throttled += 1
+        GOVERNOR_THROTTLED.inc()
+        delay = retry_after
+        if delay is None:
+            delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** (self._strikes - 1))
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        self._factor = max(self.MIN_FACTOR, self._factor / 2)
+        self._tokens = 0.0
+        self._kick()
+        return delay
+
+    def succeeded(self) -> None:
+        """200 系を受けたときに呼ぶ。下げたレートを少しずつ戻す。"""
+        self._strikes = 0
+        if self._factor < 1.0:
+            self._factor = min(1.0, self._factor + self.RECOVER_STEP)
+
+    def stats(self) -> dict[str, Any]:
+        self._refill(time.monotonic())
+        waiting = {p.name.lower(): 0 for p in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                waiting[Priority(priority).name.lower()] += 1
+        return {
+            "per_minute": self.per_minute,
+            "burst": self.burst,
+            "reserve": self.reserve,
+            "rate_factor": self._factor,
+            "tokens": round(self._tokens, 2),
+            "blocked_for": max(0.0, self._blocked_until - time.monotonic()),
+            "throttled": self.throttled,
+            "waiting": waiting,
+        }
+
+    def _needed(self, priority: int) -> float:
+        return 1.0 if priority == Priority.INTERACTIVE else 1.0 + self.reserve
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            float(self.burst), self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def _try_take(self, priority: int, now: float) -> bool:
+        if now < self._blocked_until:
+            return False
+        self._refill(now)
+        if self._tokens < self._needed(priority):
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def _kick(self) -> None:
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        self._wake.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        assert self._wake is not None
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():  # キャンセルされた待ち手
+                heapq.heappop(self._waiters)
+                continue
+            now = time.monotonic()
+            if self._try_take(priority, now):
+                heapq.heappop(self._waiters)
+                future.set_result(None)
+                continue
+            if now < self._blocked_until:
+                delay = self._blocked_until - now
+            else:
+                delay = (self._needed(priority) - self._tokens) / self.rate
+            # より優先度の高い待ち手や 429 が来たら計算し直す
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(delay, 0.001))
+            except TimeoutError:
+                pass
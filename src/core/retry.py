@@ -0,0 +1,95 @@
+import errno
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from enum import StrEnum
+
+import httpx
+
+
+class FailureKind(StrEnum):
+    """ダウンロード失敗の分類。リトライ可否の判定に使う。"""
+
+    NETWORK = "network"  # 接続失敗 / タイムアウト / 途中切断
+    SERVER_ERROR = "server_error"  # 5xx
+    RATE_LIMITED = "rate_limited"  # 429
+    BAD_CONTENT = "bad_content"  # HTML が返ってきた / zip として壊れている
+    NOT_FOUND = "not_found"  # 404 / 410
+    CLIENT_ERROR = "client_error"  # その他の 4xx
+    DISK_FULL = "disk_full"  # 空き容量不足 (失敗にせず保留する)
+    UNKNOWN = "unknown"
+
+
+TRANSIENT_KINDS = frozenset(
+    {FailureKind.NETWORK, FailureKind.SERVER_ERROR, FailureKind.RATE_LIMITED}
+)
+
+
+class DownloadError(Exception):
+    """分類済みのダウンロード失敗。"""
+
+    def __init__(
+        self, kind: FailureKind, message: str, retry_after: float | None = None
+    ) -> None:
+        super().__init__(message)
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After ヘッダ (秒数 or HTTP-date) を秒に変換する。"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(exc: BaseException) -> tuple[FailureKind, float | None]:
+    """例外を FailureKind と (あれば) サーバ指定の待機秒数に変換する。"""
+    if isinstance(exc, DownloadError):
+        return exc.kind, exc.retry_after
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        if code in (404, 410):
+            return FailureKind.NOT_FOUND, None
+        if code == 429:
+            retry_after = parse_retry_after(exc.response.headers.get("retry-after"))
+            return FailureKind.RATE_LIMITED, retry_after
+        if code >= 500:
+            return FailureKind.SERVER_ERROR, None
+        return FailureKind.CLIENT_ERROR, None
+    if isinstance(exc, httpx.TransportError):
+        return FailureKind.NETWORK, None
+    if isinstance(exc, OSError) and exc.errno in (errno.ENOSPC, errno.EDQUOT):
+        return FailureKind.DISK_FULL, None
+    return FailureKind.UNKNOWN, None
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter for transient failures."""
+
+    max_retries: int = 3
+    base_delay: float = 2.0
+    max_delay: float = 300.0
+    multiplier: float = 2.0
+    retryable: frozenset[FailureKind] = TRANSIENT_KINDS
+
+    def should_retry(self, kind: FailureKind, attempts: int) -> bool:
+        # attempts は既に実行した試行回数 (初回を含む)
+        return kind in self.retryable and attempts <= self.max_retries
+
+    def next_delay(self, attempts: int, retry_after: float | None = None) -> float:
+        ceiling = min(
+            self.max_delay, self.base_delay * (self.multiplier ** max(0, attempts - 1))
+        )
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
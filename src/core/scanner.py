@@ -1,11 +1,59 @@
 import asyncio
+import os
 import re
+import time
 from pathlib import Path
 
 from kaitaistruct import KaitaiStream
 
+from core.metrics import REGISTRY
 from osu_db_construct.osu_db import OsuDb
 
+SCAN_PHASE = REGISTRY.histogram(
+    "osu_sync_scan_phase_seconds",
+    "Duration of each library scan phase (osu_db/osz/merge).",
+    ("phase",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+OWNED_SETS = REGISTRY.gauge("osu_sync_owned_sets", "Beatmap sets found locally.")
+
+# "123456 Artist - Title.osz" / "(123456) Artist - Title.osz" → 123456
+_ARCHIVE_SET_ID = re.compile(r"^\(?(\d+)")
+
+# osu!.db の ranked_status → API の status
+_DB_STATUS = {
+    0: "unknown",
+    1: "graveyard",  # unsubmitted
+    2: "pending",
+    4: "ranked",
+    5: "approved",
+    6: "qualified",
+    7: "loved",
+}
+# フィルタ用に osu!.db から持っておく難易度ごとの値 (LIBRARY_COLUMNS の順)
+LIBRARY_COLUMNS = (
+    "beatmap_id",
+    "set_id",
+    "mode",
+    "stars",
+    "length",
+    "bpm",
+    "cs",
+    "ar",
+    "od",
+    "hp",
+    "status",
+    "version",
+    "source",
+    "tags",
+)
+_STAR_RATINGS = (
+    "star_rating_osu",
+    "star_rating_taiko",
+    "star_rating_ctb",
+    "star_rating_mania",
+)
+
 
 class SongIndex:
     """
@@ -24,10 +72,19 @@ class SongIndex:
         self._metadata: dict[
             int, tuple[int, str, str, str]
         ] = {}  # (set_id, artist, title, creator)
+        # osu!.db の難易度ごとの数値 (LIBRARY_COLUMNS の tuple)。フィルタエンジンが使う
+        self._beatmaps: list[tuple] = []
+        # 読み込み直すたびに増える。フィルタエンジンが列データを作り直す目印
+        self.revision = 0
+        # set_id -> .osz のパス。ダウンローダの既存チェックと共有する
+        self._archives: dict[int, Path] = {}
+        self._archives_mtime: int | None = None
         self._state_lock = asyncio.Lock()
         self._scan_task: asyncio.Task | None = None
         self._scanning = False
         self._event_bus = event_bus
+        # mark_owned やウォッチャの追加分も含め、スクレイプ時点の件数を返す
+        OWNED_SETS.set_function(lambda: len(self._owned))
 
     @property
     def owned_set_ids(self) -> set[int]:
@@ -37,6 +94,10 @@ class SongIndex:
     def metadata(self) -> dict[int, tuple[int, str, str, str]]:
         return self._metadata
 
+    @property
+    def beatmaps(self) -> list[tuple]:
+        return self._beatmaps
+
     async def refresh(self) -> None:
         """
         osu!.db + .oszファイルから楽曲情報をハイブリッドで読み込む。
@@ -45,32 +106,44 @@ class SongIndex:
 
     async def _load_hybrid(self) -> None:
         """osu!.dbと.oszファイルのハイブリッド読み込み"""
-        osu_owned, osu_metadata = set(), {}
-        osz_owned, osz_metadata = set(), {}
+        osu_owned, osu_metadata, osu_beatmaps = set(), {}, []
+        osz_owned, osz_metadata, osz_archives = set(), {}, {}
 
         try:
             # 1. osu!.dbから読み込み
             if self.osu_db_path and Path(self.osu_db_path).exists():
+                started = time.perf_counter()
                 try:
                     self._scan_task = asyncio.create_task(self._parse_osu_db())
-                    osu_owned, osu_metadata = await self._scan_task
+                    osu_owned, osu_metadata, osu_beatmaps = await self._scan_task
                 except Exception as e:
                     print(f"Error parsing osu!.db: {e}")
+                SCAN_PHASE.labels("osu_db").observe(time.perf_counter() - started)
             else:
                 print(f"osu!.db not found at {self.osu_db_path}, using .osz files only")
 
             # 2. .oszファイルから読み込み
+            # 走査中の変更は次回 find_archive で拾えるよう、先に mtime を控える
+            archives_mtime = self._songs_dir_mtime()
+            started = time.perf_counter()
             try:
                 self._scan_task = asyncio.create_task(self._scan_osz_fast())
-                osz_owned, osz_metadata = await self._scan_task
+                osz_owned, osz_metadata, osz_archives = await self._scan_task
             except Exception as e:
                 print(f"Error scanning .osz files: {e}")
+            SCAN_PHASE.labels("osz").observe(time.perf_counter() - started)
 
             # 3. マージ (osu!.dbのメタデータを優先)
+            started = time.perf_counter()
             async with self._state_lock:
                 self._owned = osu_owned.union(osz_owned)
                 # osu!.dbのメタデータを優先し、.oszで補完
                 self._metadata = {**osz_metadata, **osu_metadata}
+                self._beatmaps = osu_beatmaps
+                self.revision += 1
+                self._archives = osz_archives
+                self._archives_mtime = archives_mtime
+            SCAN_PHASE.labels("merge").observe(time.perf_counter() - started)
 
             print(
                 f"Hybrid scan complete: {len(self._owned)} sets total "
@@ -117,27 +190,29 @@ class SongIndex:
 
     async def _parse_osu_db(
         self,
-    ) -> tuple[set[int], dict[int, tuple[int, str, str, str]]]:
+    ) -> tuple[set[int], dict[int, tuple[int, str, str, str]], list[tuple]]:
         """osu!.dbを解析してメタデータを抽出"""
         async with self._state_lock:
             if self._scanning:
-                return set(), {}
+                return set(), {}, []
             self._scanning = True
 
         try:
             # 同期処理なのでスレッドで実行
-            owned, metadata = await asyncio.to_thread(self._parse_osu_db_sync)
-            return owned, metadata
+            return await asyncio.to_thread(self._parse_osu_db_sync)
         finally:
             async with self._state_lock:
                 self._scanning = False
 
     def _parse_osu_db_sync(
         self,
-    ) -> tuple[set[int], dict[int, tuple[int, str, str, str]]]:
+    ) -> tuple[set[int], dict[int, tuple[int, str, str, str]], list[tuple]]:
         """同期でosu!.dbを解析"""
         owned: set[int] = set()
         metadata: dict[int, tuple[int, str, str, str]] = {}
+        beatmaps: list[tuple] = []
+        # 同じセットの難易度で source / tags の文字列を共有する
+        set_text: dict[int, tuple[str, str]] = {}
 
         try:
             with open(self.osu_db_path, "rb") as f:
@@ -182,43 +257,74 @@ class SongIndex:
                     if set_id not in metadata:
                         metadata[set_id] = (set_id, artist, title, creator)
 
+                    source, tags = set_text.setdefault(
+                        set_id,
+                        (
+                            get_string_value(beatmap.song_source),
+                            get_string_value(beatmap.song_tags),
+                        ),
+                    )
+                    mode = beatmap.gameplay_mode
+                    beatmaps.append(
+                        (
+                            beatmap.beatmap_id,
+                            set_id,
+                            mode,
+                            _nomod_stars(beatmap, mode),
+                            beatmap.drain_time,
+                            _main_bpm(beatmap),
+                            float(beatmap.circle_size),
+                            float(beatmap.approach_rate),
+                            float(beatmap.overall_difficulty),
+                            float(beatmap.hp_drain),
+                            _DB_STATUS.get(beatmap.ranked_status, "unknown"),
+                            get_string_value(beatmap.difficulty),
+                            source,
+                            tags,
+                        )
+                    )
+
         except Exception as e:
             print(f"Error reading osu!.db: {e}")
             raise
 
-        return owned, metadata
+        return owned, metadata, beatmaps
 
     async def _scan_osz_fast(
         self,
-    ) -> tuple[set[int], dict[int, tuple[int, str, str, str]]]:
+    ) -> tuple[set[int], dict[int, tuple[int, str, str, str]], dict[int, Path]]:
         """ファイル名からのみ.oszを高速スキャン - O(1) per file"""
         owned: set[int] = set()
         metadata: dict[int, tuple[int, str, str, str]] = {}
+        archives: dict[int, Path] = {}
 
         if not self.songs_dir or not self.songs_dir.exists():
             print(f"Songs directory not found at {self.songs_dir}")
-            return owned, metadata
+            return owned, metadata, archives
 
         # 別スレッドで実行
-        return await asyncio.to_thread(self._scan_osz_sync, owned, metadata)
+        return await asyncio.to_thread(self._scan_osz_sync, owned, metadata, archives)
 
     def _scan_osz_sync(
-        self, owned: set[int], metadata: dict[int, tuple[int, str, str, str]]
-    ) -> tuple[set[int], dict[int, tuple[int, str, str, str]]]:
+        self,
+        owned: set[int],
+        metadata: dict[int, tuple[int, str, str, str]],
+        archives: dict[int, Path],
+    ) -> tuple[set[int], dict[int, tuple[int, str, str, str]], dict[int, Path]]:
         """同期版.oszスキャン"""
         osz_files = list(self.songs_dir.rglob("*.osz"))
         print(f"Scanning {len(osz_files)} .osz files...")
 
         for osz_path in osz_files:
             filename = osz_path.name
-            # "123456 Artist - Title.osz" → 123456
-            match = re.match(r"^(\d+)", filename)
+            match = _ARCHIVE_SET_ID.match(filename)
             if match:
                 set_id = int(match.group(1))
                 if set_id <= 0:
                     continue
 
                 owned.add(set_id)
+                archives.setdefault(set_id, osz_path)
 
                 # osu!.dbにない場合のみファイル名からメタデータ抽出
                 if set_id not in metadata:
@@ -231,7 +337,7 @@ class SongIndex:
                     )  # creatorはファイル名から抽出不可
 
         print(f"Found {len(owned)} unique sets from .osz files")
-        return owned, metadata
+        return owned, metadata, archives
 
     def _extract_metadata_from_filename(self, filename: str) -> tuple[str, str]:
         """ファイル名からアーティストとタイトルを抽出"""
@@ -293,7 +399,10 @@ class SongIndex:
             }
 
     def mark_owned(
-        self, set_id: int, metadata: tuple[int, str, str, str] | None = None
+        self,
+        set_id: int,
+        metadata: tuple[int, str, str, str] | None = None,
+        archive_path: Path | None = None,
     ) -> None:
         """
         ダウンロード完了直後に所有セットを即時反映。
@@ -301,6 +410,53 @@ class SongIndex:
         self._owned.add(set_id)
         if metadata:
             self._metadata[set_id] = metadata
+        if archive_path:
+            self._archives[set_id] = archive_path
+            if archive_path.parent == self.songs_dir:
+                # 自分で置いたファイルのために Songs 全体を再列挙しない
+                self._archives_mtime = self._songs_dir_mtime()
+
+    def find_archive(self, set_id: int) -> Path | None:
+        """
+        set_id の .osz を索引から引く。Songs 直下が外部で変更されていれば
+        (ディレクトリの mtime で判定) その時だけ直下を列挙し直す。
+        """
+        self._sync_archives()
+        path = self._archives.get(set_id)
+        if path is None:
+            return None
+        if not path.exists():
+            self._archives.pop(set_id, None)
+            return None
+        return path
+
+    def _sync_archives(self) -> None:
+        mtime = self._songs_dir_mtime()
+        if mtime is None or mtime == self._archives_mtime:
+            return
+        listed: dict[int, Path] = {}
+        with os.scandir(self.songs_dir) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(".osz"):
+                    continue
+                match = _ARCHIVE_SET_ID.match(entry.name)
+                if match and int(match.group(1)) > 0:
+                    listed.setdefault(int(match.group(1)), Path(entry.path))
+        # 直下から消えたものは落とし、サブフォルダ由来の登録は残す
+        for set_id, path in list(self._archives.items()):
+            if path.parent == self.songs_dir and set_id not in listed:
+                del self._archives[set_id]
+        self._archives.update(listed)
+        self._owned.update(listed)
+        self._archives_mtime = mtime
+
+    def _songs_dir_mtime(self) -> int | None:
+        if not self.songs_dir:
+            return None
+        try:
+            return self.songs_dir.stat().st_mtime_ns
+        except OSError:
+            return None
 
     async def _emit_scan_event(self, payload: dict[str, any]) -> None:
         """Push scan status to SSE subscribers."""
@@ -310,3 +466,22 @@ class SongIndex:
             await self._event_bus.publish({"topic": "scan", "data": payload})
         except Exception as exc:
             print(f"Scan event publish failed: {exc}")
+
+
+def _nomod_stars(beatmap, mode: int) -> float | None:
+    """osu!.db に入っている NoMod の星難易度 (古い osu!.db には無い)。"""
+    if not 0 <= mode < len(_STAR_RATINGS):
+        return None
+    ratings = getattr(beatmap, _STAR_RATINGS[mode], None)
+    for pair in getattr(ratings, "pairs", ()):
+        if pair.mods == 0:
+            return pair.rating
+    return None
+
+
+def _main_bpm(beatmap) -> float | None:
+    """最初の赤線 (継承でないタイミングポイント) の BPM。"""
+    for point in beatmap.timing_points.points:
+        if point.not_inherited.value and point.bpm > 0:
+            return round(60000 / point.bpm, 2)
+    return None
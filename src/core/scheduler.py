@@ -0,0 +1,385 @@
+import asyncio
+import heapq
+import itertools
+import time
+from array import array
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+
+SCHEDULE_POLICIES = ("fifo", "shortest", "fair")
+
+_UNKNOWN_SIZE = 1 << 62  # サイズ未取得は最後尾扱い
+
+
+class PendingEntry(NamedTuple):
+    set_id: int
+    priority: int
+    size: int | None
+    queued_at: float
+    seq: int = -1  # 取り出したときの順番。requeue で同じ位置に戻すのに使う
+
+
+class _Run:
+    """同じ priority でまとめて投入された set_id 列。seq は base_seq からの連番。"""
+
+    __slots__ = ("base_seq", "ids", "pos", "priority", "queued_at")
+
+    def __init__(self, ids: array, priority: int, base_seq: int) -> None:
+        self.ids = ids
+        self.priority = priority
+        self.base_seq = base_seq
+        self.pos = 0
+        self.queued_at = time.time()
+
+    def head(self) -> tuple[int, int]:
+        return self.ids[self.pos], self.base_seq + self.pos
+
+
+class DownloadScheduler:
+    """
+    DL 待ち行列。priority が大きいものから取り出し、同じ priority 内の順序は policy で決める。
+      - fifo: 投入順
+      - shortest: 既知サイズの小さい順 (未取得は後回し)
+      - fair: fifo と shortest を交互に取り出す (大きいセットも飢餓にならない)
+    まとめて投入された id は array の Run として持ち、個別の状態 (_state) は
+    優先度変更・サイズ判明・再投入されたものにだけ作る。優先度を変えた id と 1 件ずつの
+    投入は Run を作らず _single のヒープに積む。
+    削除・優先度変更はヒープを作り直さず、古いエントリを取り出し時に読み飛ばす。
+    """
+
+    def __init__(self, policy: str = "fifo") -> None:
+        # (-priority, head seq, id(run), run)
+        self._fifo: list[tuple[int, int, int, _Run]] = []
+        # (-priority, seq, set_id)。_state を持つ id だけ積む
+        self._single: list[tuple[int, int, int]] = []
+        # (-priority, size, seq, set_id)。サイズが分かったものだけ積む (fifo の間は空)
+        self._sized: list[tuple[int, int, int, int]] = []
+        self._runs: set[_Run] = set()
+        # Run の中の位置が有効な id: set_id -> (run, index)。無い id は _single 側にいる
+        self._where: dict[int, tuple[_Run, int]] = {}
+        self._pending: set[int] = set()
+        # Run の位置から外れた id の状態: set_id -> (priority, seq, size, queued_at)
+        self._state: dict[int, tuple[int, int, int, float]] = {}
+        # Run の中に古い位置が残っているかもしれない id (再投入時は個別に積む)
+        self._tombstones: set[int] = set()
+        self._seq = itertools.count()
+        self._paused = False
+        self._wakeup = asyncio.Event()
+        self._take_shortest = False
+        self.policy = "fifo"
+        self.set_policy(policy)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, set_id: int) -> bool:
+        return set_id in self._pending
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    def set_policy(self, policy: str) -> None:
+        if policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"unknown schedule policy: {policy}")
+        self.policy = policy
+        # fifo の間は _sized に積まないので、切り替えたら _state から作り直す
+        self._sized = []
+        if policy != "fifo":
+            self._sized = [
+                (-priority, size, seq, set_id)
+                for set_id, (priority, seq, size, _) in self._state.items()
+                if size != _UNKNOWN_SIZE and set_id in self._pending
+            ]
+            heapq.heapify(self._sized)
+
+    def put(self, set_id: int, priority: int = 0, size: int | None = None) -> None:
+        self._pending.add(set_id)
+        self._where.pop(set_id, None)
+        self._push(set_id, priority, next(self._seq), _size_key(size), time.time())
+
+    def requeue(
+        self,
+        set_id: int,
+        priority: int,
+        seq: int,
+        size: int | None = None,
+        queued_at: float | None = None,
+    ) -> None:
+        """
+        中断したものを取り出したときの seq (PendingEntry.seq) のまま戻す。
+        後から入ったものより前に、まとめて中断したもの同士は元の順に並ぶ。
+        """
+        self._pending.add(set_id)
+        self._where.pop(set_id, None)
+        self._push(
+            set_id,
+            priority,
+            seq,
+            _size_key(size),
+            time.time() if queued_at is None else queued_at,
+        )
+
+    def put_many(self, set_ids: Iterable[int], priority: int = 0) -> int:
+        """まとめて投入する。既に待機中の id は無視し、追加した件数を返す。"""
+        ids = array("q", (i for i in dict.fromkeys(set_ids) if i not in self._pending))
+        if not ids:
+            return 0
+        self._pending.update(ids)
+        # seq を件数分まとめて確保する
+        base_seq = next(self._seq)
+        self._seq = itertools.count(base_seq + len(ids))
+        run = _Run(ids, priority, base_seq)
+        self._runs.add(run)
+        for index, set_id in enumerate(ids):
+            self._where[set_id] = (run, index)
+            if set_id in self._tombstones:
+                # 古い Run に前の位置が残っているので、この位置だけを有効にする
+                self._state[set_id] = (
+                    priority,
+                    base_seq + index,
+                    _UNKNOWN_SIZE,
+                    run.queued_at,
+                )
+        heapq.heappush(self._fifo, (-priority, base_seq, id(run), run))
+        self._wakeup.set()
+        return len(ids)
+
+    def remove(self, set_id: int) -> bool:
+        if set_id not in self._pending:
+            return False
+        self._pending.discard(set_id)
+        self._state.pop(set_id, None)
+        self._where.pop(set_id, None)
+        self._tombstones.add(set_id)
+        return True
+
+    def reprioritize(self, set_id: int, priority: int) -> bool:
+        entry = self._lookup(set_id)
+        if entry is None:
+            return False
+        # 投入順 (seq) は維持したまま優先度だけ差し替える
+        current, seq, size, queued_at = entry
+        if current != priority:
+            # Run の中の位置は古い優先度のまま残るので読み飛ばさせる
+            self._where.pop(set_id, None)
+            self._tombstones.add(set_id)
+            self._push(set_id, priority, seq, size, queued_at)
+        return True
+
+    def set_size(self, set_id: int, size: int) -> bool:
+        entry = self._lookup(set_id)
+        if entry is None:
+            return False
+        # 順番 (priority, seq) は変わらないので、今の位置のまま状態だけ持つ
+        priority, seq, _, queued_at = entry
+        self._state[set_id] = (priority, seq, _size_key(size), queued_at)
+        if size is not None and self.policy != "fifo":
+            heapq.heappush(self._sized, (-priority, size, seq, set_id))
+        self._compact()
+        return True
+
+    def priority_of(self, set_id: int) -> int | None:
+        entry = self._lookup(set_id)
+        return entry[0] if entry else None
+
+    def entry(self, set_id: int) -> PendingEntry | None:
+        found = self._lookup(set_id)
+        return _to_entry(set_id, found) if found else None
+
+    def known_sizes(self) -> list[int]:
+        return [
+            size
+            for set_id, (_, _, size, _) in self._state.items()
+            if size != _UNKNOWN_SIZE and set_id in self._pending
+        ]
+
+    def pause(self) -> None:
+        self._paused = True
+
+    def resume(self) -> None:
+        self._paused = False
+        self._wakeup.set()
+
+    async def get(self) -> PendingEntry:
+        while True:
+            if not self._paused:
+                entry = self._pop()
+                if entry is not None:
+                    return entry
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    def ordered(self) -> Iterator[PendingEntry]:
+        """待機中の id を (priority, 投入順) で取り出さずに列挙する。"""
+        streams = [_walk(run) for run in self._runs]
+        streams.append(
+            (neg_priority, seq, 0, set_id, None)
+            for neg_priority, seq, set_id in sorted(self._single)
+        )
+        seen: set[int] = set()
+        for neg_priority, seq, _, set_id, run in heapq.merge(*streams):
+            if set_id in seen or not self._valid(
+                set_id, -neg_priority, seq, single=run is None
+            ):
+                continue
+            seen.add(set_id)
+            state = self._state.get(set_id)
+            if state is not None:
+                yield _to_entry(set_id, state)
+            else:
+                yield PendingEntry(set_id, run.priority, None, run.queued_at, seq)
+
+    def _push(
+        self, set_id: int, priority: int, seq: int, size: int, queued_at: float
+    ) -> None:
+        self._state[set_id] = (priority, seq, size, queued_at)
+        heapq.heappush(self._single, (-priority, seq, set_id))
+        if size != _UNKNOWN_SIZE and self.policy != "fifo":
+            heapq.heappush(self._sized, (-priority, size, seq, set_id))
+        self._compact()
+        self._wakeup.set()
+
+    def _compact(self) -> None:
+        # 読み飛ばすだけの古いエントリが溜まりすぎたら、生きているものだけで作り直す
+        live = len(self._state)
+        if len(self._single) > 2 * live + 64:
+            self._single = [
+                (-priority, seq, set_id)
+                for set_id, (priority, seq, _, _) in self._state.items()
+                if set_id not in self._where
+            ]
+            heapq.heapify(self._single)
+        if len(self._sized) > 2 * live + 64:
+            self._sized = [
+                (-priority, size, seq, set_id)
+                for set_id, (priority, seq, size, _) in self._state.items()
+                if size != _UNKNOWN_SIZE
+            ]
+            heapq.heapify(self._sized)
+
+    def _valid(self, set_id: int, priority: int, seq: int, single: bool) -> bool:
+        if set_id not in self._pending:
+            return False
+        state = self._state.get(set_id)
+        if state is None:
+            # _single に積むのは _state を持つ id だけ
+            return not single
+        # _state を持つ id は最新の (priority, seq) のエントリだけが有効
+        return state[:2] == (priority, seq)
+
+    def _lookup(self, set_id: int) -> tuple[int, int, int, float] | None:
+        if set_id not in self._pending:
+            return None
+        state = self._state.get(set_id)
+        if state is not None:
+            return state
+        where = self._where.get(set_id)
+        if where is None:
+            return None
+        run, index = where
+        return run.priority, run.base_seq + index, _UNKNOWN_SIZE, run.queued_at
+
+    def _pop(self) -> PendingEntry | None:
+        if self.policy == "fair":
+            self._take_shortest = not self._take_shortest
+            shortest = self._take_shortest
+        else:
+            shortest = self.policy == "shortest"
+        run_top = self._clean_fifo()
+        single_top = self._clean_single()
+        if run_top is None and single_top is None:
+            return None
+        if single_top is not None and (run_top is None or single_top[:2] < run_top[:2]):
+            fifo_top = single_top
+        else:
+            fifo_top = run_top
+        if shortest:
+            sized_top = self._clean_sized()
+            # サイズ不明のものは最後尾扱いなので、同じ priority なら既知サイズを優先
+            if sized_top is not None and sized_top[0] <= fifo_top[0]:
+                heapq.heappop(self._sized)
+                return self._claim(sized_top[3])
+        if fifo_top is single_top:
+            heapq.heappop(self._single)
+            return self._claim(single_top[2])
+        run = heapq.heappop(self._fifo)[3]
+        set_id, seq = run.head()
+        self._advance(run)
+        return self._claim(set_id, run, seq)
+
+    def _clean_fifo(self) -> tuple[int, int, int, _Run] | None:
+        while self._fifo:
+            neg_priority, seq, _, run = self._fifo[0]
+            set_id, _ = run.head()
+            if self._valid(set_id, -neg_priority, seq, single=False):
+                return self._fifo[0]
+            heapq.heappop(self._fifo)
+            self._advance(run)
+        return None
+
+    def _clean_single(self) -> tuple[int, int, int] | None:
+        while self._single:
+            neg_priority, seq, set_id = self._single[0]
+            if self._valid(set_id, -neg_priority, seq, single=True):
+                return self._single[0]
+            heapq.heappop(self._single)
+        return None
+
+    def _clean_sized(self) -> tuple[int, int, int, int] | None:
+        while self._sized:
+            neg_priority, size, seq, set_id = self._sized[0]
+            state = self._state.get(set_id)
+            if (
+                set_id in self._pending
+                and state
+                and state[:3]
+                == (
+                    -neg_priority,
+                    seq,
+                    size,
+                )
+            ):
+                return self._sized[0]
+            heapq.heappop(self._sized)
+        return None
+
+    def _advance(self, run: _Run) -> None:
+        """先頭を取り出した Run を次の要素で積み直す (使い切ったら捨てる)。"""
+        run.pos += 1
+        if run.pos < len(run.ids):
+            heapq.heappush(
+                self._fifo, (-run.priority, run.base_seq + run.pos, id(run), run)
+            )
+        else:
+            self._runs.discard(run)
+            if not self._runs:
+                self._tombstones.clear()
+
+    def _claim(
+        self, set_id: int, run: _Run | None = None, seq: int = -1
+    ) -> PendingEntry:
+        self._pending.discard(set_id)
+        self._where.pop(set_id, None)
+        state = self._state.pop(set_id, None)
+        if state is not None:
+            # 優先度変更やサイズ判明で状態を持ったものは他のヒープにも残っている
+            self._tombstones.add(set_id)
+            return _to_entry(set_id, state)
+        return PendingEntry(set_id, run.priority, None, run.queued_at, seq)
+
+
+def _walk(run: _Run) -> Iterator[tuple[int, int, int, int, _Run]]:
+    for index in range(run.pos, len(run.ids)):
+        yield -run.priority, run.base_seq + index, id(run), run.ids[index], run
+
+
+def _to_entry(set_id: int, state: tuple[int, int, int, float]) -> PendingEntry:
+    priority, seq, size, queued_at = state
+    return PendingEntry(
+        set_id, priority, None if size == _UNKNOWN_SIZE else size, queued_at, seq
+    )
+
+
+def _size_key(size: int | None) -> int:
+    return _UNKNOWN_SIZE if size is None else size
@@ -0,0 +1,199 @@
+import json
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any
+
+from core.metrics import REGISTRY
+
+SEARCH_CACHE = REGISTRY.counter(
+    "osu_sync_search_cache_total",
+    "Search cache lookups (hit/miss).",
+    ("result",),
+)
+SEARCH_CACHE_EVICTIONS = REGISTRY.counter(
+    "osu_sync_search_cache_evictions_total",
+    "Search cache entries dropped (size/expired).",
+    ("reason",),
+)
+SEARCH_CACHE_BYTES = REGISTRY.gauge(
+    "osu_sync_search_cache_bytes", "Bytes held by the search cache."
+)
+
+# 検索結果の表示 / 一括同期で使う項目だけを残す
+_SET_FIELDS = (
+    "id",
+    "artist",
+    "artist_unicode",
+    "title",
+    "title_unicode",
+    "creator",
+    "favourite_count",
+    "play_count",
+    "status",
+    "preview_url",
+    "ranked_date",
+    "bpm",
+)
+_BEATMAP_FIELDS = ("total_length", "difficulty_rating", "version", "mode")
+_COVER_KEYS = ("card@2x", "cover@2x", "card", "cover")
+
+
+def project_beatmapset(item: dict[str, Any]) -> dict[str, Any]:
+    """beatmapset 1 件から表示に使う項目だけを抜き出す。"""
+    compact = {key: item[key] for key in _SET_FIELDS if item.get(key) is not None}
+    covers = item.get("covers") or {}
+    # 表示に使うのは優先順で最初に見つかった 1 枚だけ
+    for key in _COVER_KEYS:
+        if covers.get(key):
+            compact["covers"] = {key: covers[key]}
+            break
+    compact["beatmaps"] = [
+        {key: bm[key] for key in _BEATMAP_FIELDS if bm.get(key) is not None}
+        for bm in item.get("beatmaps") or []
+    ]
+    return compact
+
+
+def project_search_response(raw: dict[str, Any]) -> dict[str, Any]:
+    """/beatmapsets/search のレスポンスから使う項目だけを抜き出す。"""
+    projected: dict[str, Any] = {
+        "beatmapsets": [
+            project_beatmapset(item) for item in raw.get("beatmapsets") or []
+        ]
+    }
+    for key in ("total", "cursor_string"):
+        if raw.get(key) is not None:
+            projected[key] = raw[key]
+    return projected
+
+
+def canonical_key(params: dict[str, Any]) -> str:
+    """
+    同じ検索になるパラメータを 1 つのキーにまとめる。
+    空の値を落とし、q の大文字小文字と空白の揺れを正規化する。
+    """
+    normalized: dict[str, Any] = {}
+    for key, value in params.items():
+        if value is None or value == "":
+            continue
+        if isinstance(value, bool):
+            value = str(value).lower()
+        elif isinstance(value, str):
+            value = " ".join(value.split())
+            if key == "q":
+                value = value.lower()
+            if not value:
+                continue
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+
+class SearchCache:
+    """
+    検索レスポンスのバイト数上限付き LRU + TTL キャッシュ。
+    値は project_search_response で絞った JSON (compress なら zlib) のバイト列で持ち、
+    上限を超えたら最も使われていないものから捨てる。期限切れは定期的にまとめて掃除する。
+    """
+
+    SWEEP_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl: float = 3600.0,
+        compress: bool = True,
+    ) -> None:
+        self.max_bytes = max(0, max_bytes)
+        self.ttl = ttl
+        self.compress = compress
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._bytes = 0
+        self._next_sweep = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        SEARCH_CACHE_BYTES.set_function(lambda: self._bytes)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        # 統計や LRU 順には影響させない
+        entry = self._entries.get(key)  # type: ignore[arg-type]
+        return entry is not None and entry[0] > time.time()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.time():
+            self._drop(key)
+            self.expirations += 1
+            SEARCH_CACHE_EVICTIONS.labels("expired").inc()
+            entry = None
+        if entry is None:
+            self.misses += 1
+            SEARCH_CACHE.labels("miss").inc()
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        SEARCH_CACHE.labels("hit").inc()
+        return self._decode(entry[1])
+
+    def put(self, key: str, value: dict[str, Any], ttl: float | None = None) -> None:
+        now = time.time()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        blob = self._encode(value)
+        if key in self._entries:
+            self._drop(key)
+        if len(blob) > self.max_bytes:
+            return
+        self._entries[key] = (now + (self.ttl if ttl is None else ttl), blob)
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+            SEARCH_CACHE_EVICTIONS.labels("size").inc()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "compress": self.compress,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _drop(self, key: str) -> None:
+        _, blob = self._entries.pop(key)
+        self._bytes -= len(blob)
+
+    def _sweep(self, now: float) -> None:
+        self._next_sweep = now + self.SWEEP_INTERVAL
+        expired = [key for key, (exp, _) in self._entries.items() if exp <= now]
+        for key in expired:
+            self._drop(key)
+        if expired:
+            self.expirations += len(expired)
+            SEARCH_CACHE_EVICTIONS.labels("expired").inc(len(expired))
+
+    def _encode(self, value: dict[str, Any]) -> bytes:
+        blob = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+        return zlib.compress(blob, 6) if self.compress else blob
+
+    def _decode(self, blob: bytes) -> dict[str, Any]:
+        if self.compress:
+            blob = zlib.decompress(blob)
+        return json.loads(blob)
@@ -0,0 +1,73 @@
+import asyncio
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from core.search_cache import project_search_response
+
+FetchRaw = Callable[[dict[str, Any]], Awaitable[dict[str, Any]]]
+
+
+@dataclass
+class SearchPage:
+    """カーソルで取った 1 ページ分。next_cursor を渡せば続きから再開できる。"""
+
+    beatmapsets: list[dict[str, Any]] = field(default_factory=list)
+    total: int | None = None
+    cursor: str | None = None  # このページを取ったカーソル (None = 先頭)
+    next_cursor: str | None = None  # 再開用のチェックポイント (None = 最後のページ)
+
+
+_DONE = object()
+
+
+async def walk_search(
+    fetch: FetchRaw,
+    params: dict[str, Any],
+    cursor: str | None = None,
+    window: int = 2,
+    raw: bool = False,
+) -> AsyncGenerator[SearchPage, None]:
+    """
+    cursor_string を辿って検索結果を先頭 (または cursor) から最後まで流す。
+    次のページは呼び出し側が処理している間に取りに行き、未消費のページは window 件まで持つ。
+    途中で止めても、受け取った最後のページの next_cursor から再開できる。
+    raw=True なら表示用に絞らず、API の beatmapset をそのまま渡す。
+    """
+    pages: asyncio.Queue = asyncio.Queue(maxsize=max(1, window))
+
+    async def produce() -> None:
+        nonlocal cursor
+        try:
+            while True:
+                query = dict(params)
+                if cursor:
+                    query["cursor_string"] = cursor
+                page = await fetch(query)
+                if not raw:
+                    page = project_search_response(page)
+                page.setdefault("beatmapsets", [])
+                items = page["beatmapsets"]
+                next_cursor = page.get("cursor_string") if items else None
+                await pages.put(
+                    SearchPage(items, page.get("total"), cursor, next_cursor)
+                )
+                if not next_cursor:
+                    break
+                cursor = next_cursor
+            await pages.put(_DONE)
+        except Exception as exc:
+            await pages.put(exc)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await pages.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiolimiter import AsyncLimiter
+
+from core.metrics import REGISTRY
+from core.rate_governor import Priority, request_priority
+from core.search_cache import canonical_key
+
+logger = logging.getLogger("osu_sync.search_prefetch")
+
+SEARCH_PREFETCH = REGISTRY.counter(
+    "osu_sync_search_prefetch_total",
+    "Next-page search prefetches (started/hit/wasted/cancelled/skipped/failed).",
+    ("result",),
+)
+
+SearchCall = Callable[[dict[str, Any]], Awaitable[Any]]
+
+
+class SearchPrefetcher:
+    """
+    /api/search でページ N を返した後、同じ条件の N+1 ページを裏で取ってキャッシュを温める。
+    先読みは per_minute の枠内でだけ行い、枠が無ければ待たずに諦める (ユーザーの検索を優先)。
+    条件が変わったら実行中の先読みは取り消し、温めた分は使われなかったものとして数える。
+    """
+
+    WARM_LIMIT = 32
+
+    def __init__(self, per_minute: int = 30, enabled: bool = True) -> None:
+        self.enabled = enabled and per_minute > 0
+        self.per_minute = per_minute
+        self._limiter = AsyncLimiter(max(1, per_minute), time_period=60)
+        self._query: str | None = None
+        self._task: asyncio.Task | None = None
+        self._detached: set[asyncio.Task] = set()
+        self._pending: str | None = None
+        self._warm: OrderedDict[str, None] = OrderedDict()
+        self.counts = dict.fromkeys(
+            ("started", "hit", "wasted", "cancelled", "skipped", "failed"), 0
+        )
+
+    def observe(self, params: dict[str, Any]) -> None:
+        """ユーザーの検索を受けたら呼ぶ。先読み済み / 先読み中のページならヒット。"""
+        self._switch(params)
+        key = canonical_key(params)
+        if key in self._warm:
+            del self._warm[key]
+            self._count("hit")
+        elif key == self._pending:
+            # 先読みの応答待ちに相乗りする (single-flight で上流は 1 回)。
+            # 使われる先読みなので、この後の条件変更で取り消さない
+            self._count("hit")
+            self._pending = None
+            if self._task is not None:
+                self._detached.add(self._task)
+                self._task.add_done_callback(self._detached.discard)
+                self._task = None
+
+    def schedule(
+        self,
+        params: dict[str, Any],
+        total: int | None,
+        search: SearchCall,
+        cached: Callable[[dict[str, Any]], bool],
+    ) -> None:
+        """params (page を含む) を返した直後に呼ぶ。次ページがあれば裏で取りに行く。"""
+        self._switch(params)
+        if not self.enabled:
+            return
+        page, limit = params.get("page") or 1, params.get("limit") or 0
+        if not limit or (total is not None and page * limit >= total):
+            return
+        next_params = {**params, "page": page + 1}
+        key = canonical_key(next_params)
+        if key in self._warm or key == self._pending or cached(next_params):
+            return
+        if not self._limiter.has_capacity():
+            self._count("skipped")
+            return
+        # 同じ条件でページを飛ばした場合、古い先読みはもう要らない
+        self._cancel()
+        self._pending = key
+        self._task = asyncio.create_task(self._prefetch(key, next_params, search))
+
+    async def close(self) -> None:
+        task = self._cancel()
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+
+    def stats(self) -> dict[str, Any]:
+        started = self.counts["started"]
+        return {
+            "enabled": self.enabled,
+            "per_minute": self.per_minute,
+            **self.counts,
+            "hit_ratio": self.counts["hit"] / started if started else None,
+        }
+
+    async def _prefetch(
+        self, key: str, params: dict[str, Any], search: SearchCall
+    ) -> None:
+        try:
+            await self._limiter.acquire()
+            self._count("started")
+            with request_priority(Priority.PREFETCH):
+                await search(params)
+        except asyncio.CancelledError:
+            self._count("cancelled")
+            raise
+        except Exception as exc:
+            self._count("failed")
+            logger.debug("Search prefetch failed page=%s: %s", params.get("page"), exc)
+        else:
+            if self._pending == key:
+                self._warm[key] = None
+                while len(self._warm) > self.WARM_LIMIT:
+                    self._warm.popitem(last=False)
+                    self._count("wasted")
+        finally:
+            if self._pending == key:
+                self._pending = None
+
+    def _cancel(self) -> asyncio.Task | None:
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            return task
+        return None
+
+    def _switch(self, params: dict[str, Any]) -> None:
+        # page 以外が変わったら別の検索。応答を待たずに古い先読みを止める
+        query = canonical_key({k: v for k, v in params.items() if k != "page"})
+        if query == self._query:
+            return
+        self._cancel()
+        self._pending = None
+        if self._warm:
+            self._count("wasted", len(self._warm))
+            self._warm.clear()
+        self._query = query
+
+    def _count(self, result: str, amount: int = 1) -> None:
+        self.counts[result] += amount
+        SEARCH_PREFETCH.labels(result).inc(amount)
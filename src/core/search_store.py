@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any
+
+from core.metrics import REGISTRY
+
+logger = logging.getLogger("osu_sync.search_store")
+
+SEARCH_STORE = REGISTRY.counter(
+    "osu_sync_search_store_total",
+    "Disk search cache lookups (fresh/stale/miss).",
+    ("result",),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_cache (
+    key TEXT PRIMARY KEY,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL,
+    body BLOB NOT NULL
+)
+"""
+
+
+class SearchStore:
+    """
+    検索レスポンスを SQLite に残し、再起動後も使えるようにするディスクキャッシュ。
+    値は SearchCache と同じ射影済みの dict を zlib 圧縮して持つ。
+    max_age を過ぎたものと、max_bytes を超えた分 (最後に読まれたのが古い順) は消す。
+    sqlite3 の呼び出しはスレッドに逃がし、イベントループを止めない。
+    """
+
+    PRUNE_BATCH = 100
+    SWEEP_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_age: float = 7 * 24 * 3600,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max(0, max_bytes)
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = self._connect()
+        self._bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM search_cache"
+        ).fetchone()[0]
+        self._next_sweep = 0.0
+        self.lookups = {"fresh": 0, "stale": 0, "miss": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        try:
+            conn = self._open()
+            conn.execute("SELECT 1 FROM search_cache LIMIT 1")
+            return conn
+        except sqlite3.DatabaseError:
+            # 壊れていたら作り直す (ただのキャッシュなので捨ててよい)
+            logger.warning("Search cache database is corrupt, recreating %s", self.path)
+            self.path.unlink(missing_ok=True)
+            return self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(_SCHEMA)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS search_cache_accessed"
+            " ON search_cache (accessed_at)"
+        )
+        return conn
+
+    async def get(self, key: str) -> tuple[float, dict[str, Any]] | None:
+        """(保存時刻, 値) を返す。max_age を過ぎたものは無いものとして扱う。"""
+        try:
+            return await asyncio.to_thread(self._get_sync, key)
+        except sqlite3.Error:
+            logger.exception("Search cache read failed key=%s", key)
+            return None
+
+    async def put(self, key: str, value: dict[str, Any]) -> None:
+        # キャッシュに書けなくても検索自体は成功させる
+        try:
+            await asyncio.to_thread(self._put_sync, key, value)
+        except sqlite3.Error:
+            logger.exception("Search cache write failed key=%s", key)
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._clear_sync)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def record(self, result: str) -> None:
+        """呼び出し側が fresh / stale / miss のどれとして使ったかを数える。"""
+        self.lookups[result] += 1
+        SEARCH_STORE.labels(result).inc()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM search_cache"
+            ).fetchone()[0]
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "max_age": self.max_age,
+            **self.lookups,
+        }
+
+    def _get_sync(self, key: str) -> tuple[float, dict[str, Any]] | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stored_at, body FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            stored_at, body = row
+            if now - stored_at >= self.max_age:
+                self._delete(key)
+                return None
+            self._conn.execute(
+                "UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        try:
+            return stored_at, json.loads(zlib.decompress(body))
+        except (zlib.error, ValueError):
+            logger.warning("Dropping unreadable search cache entry key=%s", key)
+            with self._lock:
+                self._delete(key)
+            return None
+
+    def _put_sync(self, key: str, value: dict[str, Any]) -> None:
+        body = zlib.compress(
+            json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode(), 6
+        )
+        if len(body) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._delete(key)
+            self._conn.execute(
+                "INSERT INTO search_cache (key, stored_at, accessed_at, size, body)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, now, now, len(body), body),
+            )
+            self._bytes += len(body)
+            self._prune(now)
+
+    def _clear_sync(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM search_cache")
+            self._bytes = 0
+
+    def _delete(self, key: str) -> None:
+        row = self._conn.execute(
+            "DELETE FROM search_cache WHERE key = ? RETURNING size", (key,)
+        ).fetchone()
+        if row is not None:
+            self._bytes -= row[0]
+
+    def _prune(self, now: float) -> None:
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.SWEEP_INTERVAL
+            removed = self._conn.execute(
+                "DELETE FROM search_cache WHERE stored_at <= ? RETURNING size",
+                (now - self.max_age,),
+            ).fetchall()
+            self._bytes -= sum(size for (size,) in removed)
+        while self._bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM search_cache ORDER BY accessed_at LIMIT ?",
+                (self.PRUNE_BATCH,),
+            ).fetchall()
+            if not rows:
+                self._bytes = 0
+                break
+            for key, size in rows:
+                if self._bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self._bytes -= size
@@ -0,0 +1,52 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, TypeVar
+
+from core.metrics import REGISTRY
+
+T = TypeVar("T")
+
+COALESCED = REGISTRY.counter(
+    "osu_sync_coalesced_requests_total",
+    "Calls that joined an identical in-flight request instead of sending their own.",
+    ("name",),
+)
+
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中なら新しく始めず、その結果 (例外も含む) を共有する。
+    待っている側がキャンセルされても実行中の処理は止めない (他の待ち手のため)。
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.coalesced = 0
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            self.coalesced += 1
+            COALESCED.labels(self.name).inc()
+        return await asyncio.shield(task)
+
+    async def close(self) -> None:
+        tasks = list(self._calls.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _finished(self, key: Hashable, task: asyncio.Task[Any]) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # 待ち手が全員キャンセル済みでも "never retrieved" 警告を出さない
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Callable
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import Any
+
+from core.engine import DownloadEngine
+from core.search_cursor import SearchPage
+
+logger = logging.getLogger("osu_sync.sync_plan")
+
+SearchPages = AsyncGenerator[SearchPage, None]
+
+# サイズ実績が無いときの見積もり: 音源 (~192kbps) + 背景や譜面の固定分
+_AUDIO_BYTES_PER_SEC = 24_000
+_BASE_SET_BYTES = 1_500_000
+
+
+@dataclass
+class SyncPlan:
+    plan_id: str
+    params: dict[str, Any]
+    priority: int = 0
+    dry_run: bool = False
+    state: str = "running"  # running / completed / cancelled / failed
+    total: int | None = None  # 検索 API が返した件数
+    pages: int = 0
+    scanned: int = 0
+    owned: int = 0
+    already_queued: int = 0
+    enqueued: int = 0
+    missing: int = 0  # dry_run でも数える (enqueued + already_queued)
+    estimated_bytes: int = 0
+    estimate_source: str | None = None  # observed / length
+    cursor: str | None = None  # 止まった場合はここから再開できる (None = 先頭 / 完了)
+    error: str | None = None
+    started_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "plan_id": self.plan_id,
+            "params": self.params,
+            "priority": self.priority,
+            "dry_run": self.dry_run,
+            "state": self.state,
+            "total": self.total,
+            "pages": self.pages,
+            "scanned": self.scanned,
+            "owned": self.owned,
+            "already_queued": self.already_queued,
+            "enqueued": self.enqueued,
+            "missing": self.missing,
+            "estimated_bytes": self.estimated_bytes,
+            "estimate_source": self.estimate_source,
+            "cursor": self.cursor,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class SyncPlanner:
+    """
+    検索条件に合う全ページを辿り、未所有のセットをまとめて DL キューに積む。
+    ページは cursor で流れてくる (先読みは渡されたイテレータ側)。ページごとに 1 回 enqueue し、
+    処理し終えたページの next_cursor を plan.cursor に残す。
+    進捗は topic "sync_plan" で流す (progress / completed / cancelled / failed)。
+    """
+
+    HISTORY_LIMIT = 20
+
+    def __init__(
+        self,
+        downloader: Callable[[], DownloadEngine],
+        event_bus=None,
+    ) -> None:
+        # 設定変更でダウンローダ (と SongIndex) が作り直されるので都度取りに行く
+        self._downloader = downloader
+        self._event_bus = event_bus
+        self._plans: OrderedDict[str, SyncPlan] = OrderedDict()
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def start(
+        self,
+        pages: SearchPages,
+        params: dict[str, Any],
+        priority: int = 0,
+        dry_run: bool = False,
+        cursor: str | None = None,
+    ) -> SyncPlan:
+        plan = SyncPlan(
+            plan_id=secrets.token_hex(6),
+            params=params,
+            priority=priority,
+            dry_run=dry_run,
+            cursor=cursor,
+        )
+        self._plans[plan.plan_id] = plan
+        self._trim()
+        self._tasks[plan.plan_id] = asyncio.create_task(self._run(plan, pages))
+        logger.info(
+            "Sync plan started id=%s params=%s dry_run=%s cursor=%s",
+            plan.plan_id,
+            params,
+            dry_run,
+            cursor,
+        )
+        return plan
+
+    def get(self, plan_id: str) -> SyncPlan | None:
+        return self._plans.get(plan_id)
+
+    def plans(self) -> list[SyncPlan]:
+        return list(reversed(self._plans.values()))
+
+    async def cancel(self, plan_id: str) -> bool:
+        task = self._tasks.get(plan_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return True
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _run(self, plan: SyncPlan, pages: SearchPages) -> None:
+        try:
+            async with aclosing(pages):
+                async for page in pages:
+                    if plan.total is None:
+                        plan.total = page.total
+                    await self._apply_page(plan, page.beatmapsets)
+                    plan.cursor = page.next_cursor
+                    self._publish(plan, "progress")
+            plan.state = "completed"
+        except asyncio.CancelledError:
+            plan.state = "cancelled"
+        except Exception as exc:
+            logger.exception("Sync plan failed id=%s", plan.plan_id)
+            plan.state = "failed"
+            plan.error = getattr(exc, "detail", None) or str(exc)
+        finally:
+            plan.finished_at = time.time()
+            self._tasks.pop(plan.plan_id, None)
+            logger.info(
+                "Sync plan %s id=%s pages=%s scanned=%s enqueued=%s",
+                plan.state,
+                plan.plan_id,
+                plan.pages,
+                plan.scanned,
+                plan.enqueued,
+            )
+            self._publish(plan, plan.state)
+
+    async def _apply_page(self, plan: SyncPlan, items: list[dict[str, Any]]) -> None:
+        plan.pages += 1
+        plan.scanned += len(items)
+        downloader = self._downloader()
+        index = downloader.index
+        missing: list[int] = []
+        metadata: dict[int, dict[str, str]] = {}
+        lengths: list[int] = []
+        for item in items:
+            set_id = item.get("id")
+            if not isinstance(set_id, int):
+                continue
+            if index is not None and index.owned(set_id):
+                plan.owned += 1
+                continue
+            missing.append(set_id)
+            metadata[set_id] = {
+                key: item[key]
+                for key in ("artist", "title", "artist_unicode", "title_unicode")
+                if item.get(key)
+            }
+            lengths.append(
+                max(
+                    (bm.get("total_length") or 0 for bm in item.get("beatmaps") or []),
+                    default=0,
+                )
+            )
+        if not missing:
+            return
+
+        if plan.dry_run:
+            accepted = await downloader.unqueued(missing)
+        else:
+            accepted = await downloader.enqueue(missing, metadata, plan.priority)
+        plan.missing += len(missing)
+        plan.already_queued += len(missing) - len(accepted)
+        if not plan.dry_run:
+            plan.enqueued += len(accepted)
+
+        accepted_set = set(accepted)
+        average = await downloader.average_set_size()
+        if average is not None:
+            plan.estimate_source = "observed"
+            plan.estimated_bytes += int(average * len(accepted))
+        else:
+            plan.estimate_source = plan.estimate_source or "length"
+            plan.estimated_bytes += sum(
+                _BASE_SET_BYTES + length * _AUDIO_BYTES_PER_SEC
+                for set_id, length in zip(missing, lengths, strict=True)
+                if set_id in accepted_set
+            )
+
+    def _publish(self, plan: SyncPlan, kind: str) -> None:
+        if not self._event_bus:
+            return
+        try:
+            self._last_publish_task = asyncio.create_task(
+                self._event_bus.publish(
+                    {"topic": "sync_plan", "data": {"type": kind, **plan.to_dict()}}
+                )
+            )
+        except RuntimeError:
+            pass
+
+    def _trim(self) -> None:
+        # 実行中のものは残し、終わった古い計画から捨てる
+        for plan_id in list(self._plans):
+            if len(self._plans) <= self.HISTORY_LIMIT:
+                break
+            if self._plans[plan_id].state != "running":
+                del self._plans[plan_id]
@@ -0,0 +1,150 @@
+import asyncio
+import importlib.util
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger("osu_sync.transport")
+
+
+@dataclass
+class PoolStats:
+    """名前付きクライアントごとの接続統計。"""
+
+    requests: int = 0
+    connections: int = 0  # 新規 TCP 接続 (= ハンドシェイク)
+    tls_handshakes: int = 0
+    ttfb_total: float = 0.0
+    ttfb_count: int = 0
+    ttfb_max: float = 0.0
+
+    def record_ttfb(self, seconds: float) -> None:
+        self.ttfb_total += seconds
+        self.ttfb_count += 1
+        self.ttfb_max = max(self.ttfb_max, seconds)
+
+    def snapshot(self) -> dict[str, Any]:
+        reused = max(0, self.requests - self.connections)
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_requests": reused,
+            "reuse_ratio": reused / self.requests if self.requests else None,
+            "ttfb_avg_ms": (self.ttfb_total / self.ttfb_count * 1000)
+            if self.ttfb_count
+            else None,
+            "ttfb_max_ms": self.ttfb_max * 1000 if self.ttfb_count else None,
+        }
+
+
+class HttpTransport:
+    """
+    アプリ全体で共有する httpx.AsyncClient 群。用途ごとに名前付きで 1 つずつ持ち、
+    プールサイズ / keep-alive / HTTP/2 を一括で設定する。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+    ) -> None:
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._stats: dict[str, PoolStats] = {}
+        self.configure(
+            max_connections, max_keepalive_connections, keepalive_expiry, http2
+        )
+
+    def configure(
+        self,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+        http2: bool,
+    ) -> None:
+        """次に作るクライアントから反映される。既存のものは close() で作り直す。"""
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but 'h2' is not installed; using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+
+    def client(self, name: str, **kwargs: Any) -> httpx.AsyncClient:
+        existing = self._clients.get(name)
+        if existing is not None and not existing.is_closed:
+            return existing
+        stats = self._stats.setdefault(name, PoolStats())
+        client = httpx.AsyncClient(
+            limits=self.limits,
+            http2=self.http2,
+            event_hooks={"request": [self._tracer(stats)]},
+            **kwargs,
+        )
+        self._clients[name] = client
+        logger.info(
+            "HTTP client created name=%s http2=%s limits=%s",
+            name,
+            self.http2,
+            self.limits,
+        )
+        return client
+
+    async def prewarm(self, name: str, urls: list[str]) -> None:
+        """起動直後に各オリジンへ HEAD を投げ、TCP/TLS 接続を張っておく。"""
+        client = self._clients.get(name)
+        if client is None:
+            return
+        origins = {
+            f"{parts.scheme}://{parts.netloc}/"
+            for parts in (urlsplit(url) for url in urls)
+            if parts.scheme in ("http", "https") and parts.netloc
+        }
+
+        async def warm(origin: str) -> None:
+            try:
+                await client.head(origin, timeout=5)
+            except httpx.HTTPError as exc:
+                logger.info("Prewarm failed origin=%s error=%s", origin, exc)
+
+        await asyncio.gather(*(warm(origin) for origin in origins))
+
+    async def close(self, name: str) -> None:
+        client = self._clients.pop(name, None)
+        if client is not None:
+            await client.aclose()
+
+    async def aclose(self) -> None:
+        for name in list(self._clients):
+            await self.close(name)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+    @staticmethod
+    def _tracer(stats: PoolStats):
+        async def on_request(request: httpx.Request) -> None:
+            stats.requests += 1
+            started = time.perf_counter()
+
+            # httpcore の trace 拡張で接続確立 / TLS / 応答ヘッダ受信を拾う
+            async def trace(event: str, info: dict[str, Any]) -> None:
+                if event == "connection.connect_tcp.complete":
+                    stats.connections += 1
+                elif event == "connection.start_tls.complete":
+                    stats.tls_handshakes += 1
+                elif event.endswith("receive_response_headers.complete"):
+                    stats.record_ttfb(time.perf_counter() - started)
+
+            request.extensions["trace"] = trace
+
+        return on_request
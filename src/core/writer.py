@@ -0,0 +1,167 @@
+import asyncio
+import errno
+import os
+import queue
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+
+class DiskWriter:
+    """
+    ダウンロード中のファイル書き込みを専用スレッドへ逃がす。
+    イベントループ側はチャンクを積むだけで、未書き込みバイト数が
+    buffer_bytes を超えたときだけ待たされる (バックプレッシャ)。
+    """
+
+    def __init__(self, buffer_bytes: int = 16 * 1024 * 1024) -> None:
+        self.buffer_bytes = max(0, buffer_bytes)
+        self._ops: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._pending = 0
+        self._drained: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def open(self, path: Path, preallocate: int | None = None) -> "StreamFile":
+        """preallocate にサイズを渡すと先に領域を確保する (断片化とメタデータ更新を減らす)。"""
+        stream = StreamFile(self, path)
+        await self.run(stream._open_sync, preallocate)
+        return stream
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """fn を書き込みスレッドで実行し、結果を待つ (書き込み順は保たれる)。"""
+        loop = self._bind_loop()
+        fut = loop.create_future()
+        self._ops.put((fn, args, fut, 0))
+        return await fut
+
+    def shutdown(self) -> None:
+        if self._thread and self._thread.is_alive():
+            self._ops.put(None)
+
+    async def _submit_write(self, fn: Callable[..., Any], data: bytes) -> None:
+        self._bind_loop()
+        size = len(data)
+        while self._pending > 0 and self._pending + size > self.buffer_bytes:
+            self._drained.clear()
+            await self._drained.wait()
+        self._pending += size
+        self._ops.put((fn, (data,), None, size))
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._drained = asyncio.Event()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="osu-sync-writer", daemon=True
+            )
+            self._thread.start()
+        return loop
+
+    def _release(self, size: int) -> None:
+        self._pending -= size
+        self._drained.set()
+
+    def _run(self) -> None:
+        while True:
+            op = self._ops.get()
+            if op is None:
+                return
+            fn, args, fut, size = op
+            try:
+                result = fn(*args)
+                error = None
+            except BaseException as exc:  # 呼び出し側へ返す
+                result, error = None, exc
+            loop = self._loop
+            if loop is None or loop.is_closed():
+                continue
+            try:
+                if size:
+                    loop.call_soon_threadsafe(self._release, size)
+                if fut is not None:
+                    loop.call_soon_threadsafe(_resolve, fut, result, error)
+            except RuntimeError:
+                # loop closed while we were writing
+                pass
+
+
+def _resolve(fut: asyncio.Future, result: Any, error: BaseException | None) -> None:
+    if fut.done():
+        return
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(result)
+
+
+class StreamFile:
+    """DiskWriter 上で開かれた 1 ファイル。"""
+
+    def __init__(self, writer: DiskWriter, path: Path) -> None:
+        self.path = path
+        self._writer = writer
+        self._fh = None
+        self._error: BaseException | None = None
+        self.preallocated = False
+
+    async def write(self, data: bytes) -> None:
+        if self._error is not None:
+            raise self._error
+        await self._writer._submit_write(self._write_sync, data)
+
+    async def close(self) -> None:
+        await self._writer.run(self._close_sync)
+        if self._error is not None:
+            raise self._error
+
+    async def abort(self) -> None:
+        """書きかけを破棄する。"""
+        try:
+            await self._writer.run(self._close_sync)
+        finally:
+            await self._writer.run(self.path.unlink, True)
+
+    def _open_sync(self, preallocate: int | None = None) -> None:
+        self._fh = self.path.open("wb")
+        if not preallocate:
+            return
+        try:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(self._fh.fileno(), 0, preallocate)
+            else:
+                # Windows: EOF を伸ばすとその場でクラスタが割り当てられる
+                self._fh.truncate(preallocate)
+        except OSError as exc:
+            if exc.errno in (errno.ENOSPC, errno.EDQUOT):
+                self._fh.close()
+                self._fh = None
+                self.path.unlink(missing_ok=True)
+                raise
+            # 非対応のファイルシステムでは普通に書くだけ
+            return
+        self.preallocated = True
+
+    def _write_sync(self, data: bytes) -> None:
+        if self._error is not None or self._fh is None:
+            return
+        try:
+            self._fh.write(data)
+        except OSError as exc:
+            self._error = exc
+
+    def _close_sync(self) -> None:
+        if self._fh is None:
+            return
+        try:
+            if self.preallocated:
+                # 確保したサイズより短く終わった分を切り詰める
+                self._fh.truncate()
+            self._fh.close()
+        except OSError as exc:
+            self._error = self._error or exc
+        finally:
+            self._fh = None
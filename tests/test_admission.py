@@ -0,0 +1,47 @@
+import asyncio
+from collections import namedtuple
+
+import pytest
+
+from core import downloader as downloader_module
+from core.downloader import DownloadManager, DownloadTask
+from core.retry import DownloadError, FailureKind
+
+Usage = namedtuple("Usage", "total used free")
+MB = 1024 * 1024
+
+
+def admit(tmp_path, monkeypatch, free_mb: int, size: int | None) -> dict[int, int]:
+    monkeypatch.setattr(
+        downloader_module.shutil, "disk_usage", lambda _: Usage(0, 0, free_mb * MB)
+    )
+
+    async def run() -> dict[int, int]:
+        manager = DownloadManager(
+            str(tmp_path), "https://example.invalid/{set_id}", min_free_bytes=100 * MB
+        )
+        try:
+            task = DownloadTask(1, "https://example.invalid/1")
+            manager._tasks[1] = task
+            manager._admit(task, size)
+            return manager._reserved
+        finally:
+            await manager.close()
+
+    return asyncio.run(run())
+
+
+def test_unknown_size_is_admitted_above_min_free(tmp_path, monkeypatch):
+    assert admit(tmp_path, monkeypatch, 101, None) == {1: 0}
+
+
+def test_unknown_size_is_held_below_min_free(tmp_path, monkeypatch):
+    with pytest.raises(DownloadError) as info:
+        admit(tmp_path, monkeypatch, 99, None)
+    assert info.value.kind is FailureKind.DISK_FULL
+
+
+def test_known_size_must_fit_above_min_free(tmp_path, monkeypatch):
+    assert admit(tmp_path, monkeypatch, 200, 50 * MB) == {1: 50 * MB}
+    with pytest.raises(DownloadError):
+        admit(tmp_path, monkeypatch, 120, 50 * MB)
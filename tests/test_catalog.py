@@ -0,0 +1,177 @@
+import asyncio
+import time
+
+from core.catalog import (
+    Catalog,
+    CatalogCrawler,
+    CatalogScope,
+    has_query_filters,
+    same_order_as_api,
+)
+from core.search_cursor import SearchPage
+
+
+def beatmapset(set_id: int, updated: str, status: str = "ranked") -> dict:
+    return {
+        "id": set_id,
+        "status": status,
+        "artist": f"artist {set_id}",
+        "title": f"title {set_id}",
+        "creator": "mapper",
+        "last_updated": updated,
+        "beatmaps": [{"id": set_id * 10, "mode_int": 0, "difficulty_rating": 5.0}],
+    }
+
+
+class FakeClient:
+    def __init__(self, pages: list[list[dict]]) -> None:
+        self.pages = pages
+        self.cursors: list[str | None] = []
+
+    async def iter_search(self, cursor=None, **_):
+        start = int(cursor) if cursor else 0
+        self.cursors.append(cursor)
+        for index in range(start, len(self.pages)):
+            next_cursor = str(index + 1) if index + 1 < len(self.pages) else None
+            yield SearchPage(self.pages[index], None, cursor, next_cursor)
+
+
+def test_query_filters_are_detected():
+    assert has_query_filters("stars>5")
+    assert has_query_filters("camellia artist=foo")
+    assert has_query_filters("status=loved")
+    assert has_query_filters("ar>=9.5 length<120")
+    assert not has_query_filters("camellia")
+    assert not has_query_filters("")
+    assert not has_query_filters(None)
+
+
+def test_order_matches_api_only_without_relevance():
+    assert same_order_as_api("", None)
+    assert same_order_as_api("camellia", "plays_desc")
+    assert not same_order_as_api("camellia", None)
+    assert not same_order_as_api("camellia", "relevance_desc")
+
+
+def test_crawl_records_state_and_covers(tmp_path):
+    async def run() -> tuple:
+        catalog = Catalog(tmp_path / "catalog.db")
+        scope = CatalogScope("ranked")
+        client = FakeClient(
+            [
+                [beatmapset(3, "2024-03"), beatmapset(2, "2024-02")],
+                [beatmapset(1, "2024-01")],
+            ]
+        )
+        crawler = CatalogCrawler(catalog, lambda: client, [scope])
+        before = await catalog.covers([scope], "ranked", None)
+        written = await crawler.crawl(client, scope)
+        state = await catalog.crawl_state(scope.key)
+        after = await catalog.covers([scope], "ranked", None)
+        loved = await catalog.covers([scope], "loved", None)
+        found = await catalog.search(q="artist 2", sort="ranked_desc")
+        catalog.close()
+        return before, written, state, after, loved, found
+
+    before, written, state, after, loved, found = asyncio.run(run())
+    assert not before
+    assert written == 3
+    assert state["cursor"] is None
+    assert state["high_water"] == "2024-03"
+    assert state["completed_at"]
+    assert after
+    assert not loved
+    assert [item["id"] for item in found["beatmapsets"]] == [2]
+
+
+def test_incremental_crawl_stops_at_high_water(tmp_path):
+    async def run() -> tuple:
+        catalog = Catalog(tmp_path / "catalog.db")
+        scope = CatalogScope("ranked")
+        await catalog.save_crawl_state(
+            scope.key, high_water="2024-02", full_pass_at=time.time()
+        )
+        client = FakeClient(
+            [
+                [beatmapset(4, "2024-04"), beatmapset(3, "2024-03")],
+                [beatmapset(2, "2024-02"), beatmapset(1, "2024-01")],
+                [beatmapset(0, "2023-12")],
+            ]
+        )
+        crawler = CatalogCrawler(catalog, lambda: client, [scope])
+        written = await crawler.crawl(client, scope)
+        state = await catalog.crawl_state(scope.key)
+        catalog.close()
+        return written, state
+
+    written, state = asyncio.run(run())
+    assert written == 4
+    assert state["high_water"] == "2024-04"
+
+
+class RecheckClient(FakeClient):
+    def __init__(self, pages: list[list[dict]], current: dict[int, dict]) -> None:
+        super().__init__(pages)
+        self.current = current
+        self.rechecked: list[int] = []
+
+    async def get_beatmapsets(self, set_ids):
+        self.rechecked += set_ids
+        return {i: self.current[i] for i in set_ids if i in self.current}
+
+
+def test_full_pass_settles_sets_that_left_the_scope(tmp_path):
+    async def run() -> tuple:
+        catalog = Catalog(tmp_path / "catalog.db")
+        scope = CatalogScope("qualified")
+        await catalog.upsert(
+            [
+                beatmapset(1, "2024-01", "qualified"),
+                beatmapset(2, "2024-02", "qualified"),
+                beatmapset(3, "2024-03", "qualified"),
+            ]
+        )
+        catalog._conn.execute("UPDATE beatmapsets SET crawled_at = 0")
+        # 1 は ranked になり、3 は消された
+        client = RecheckClient(
+            [[beatmapset(2, "2024-02", "qualified")]],
+            {1: beatmapset(1, "2024-01", "ranked")},
+        )
+        crawler = CatalogCrawler(catalog, lambda: client, [scope])
+        await crawler.crawl(client, scope)
+        rows = dict(catalog._conn.execute("SELECT id, status FROM beatmapsets"))
+        state = await catalog.crawl_state(scope.key)
+        catalog.close()
+        return client.rechecked, rows, state
+
+    rechecked, rows, state = asyncio.run(run())
+    assert sorted(rechecked) == [1, 3]
+    assert rows == {1: "ranked", 2: "qualified"}
+    assert state["full_pass_at"] == state["completed_at"]
+
+
+def test_trigger_wakes_crawler_waiting_for_a_client(tmp_path):
+    async def run() -> tuple:
+        catalog = Catalog(tmp_path / "catalog.db")
+        scope = CatalogScope("ranked")
+        client = FakeClient([[beatmapset(1, "2024-01")]])
+        current = None
+        crawler = CatalogCrawler(catalog, lambda: current, [scope])
+        crawler.start()
+        await asyncio.sleep(0.01)
+        idle = await catalog.crawl_state(scope.key)
+        current = client
+        crawler.trigger()
+        for _ in range(100):
+            if (await catalog.crawl_state(scope.key)).get("completed_at"):
+                break
+            await asyncio.sleep(0.01)
+        state = await catalog.crawl_state(scope.key)
+        await crawler.close()
+        catalog.close()
+        return idle, state, client.cursors
+
+    idle, state, cursors = asyncio.run(run())
+    assert "completed_at" not in idle
+    assert state["completed_at"]
+    assert cursors == [None]
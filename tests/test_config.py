@@ -0,0 +1,9 @@
+from api.config import Settings
+
+
+def test_invalid_schedule_policy_falls_back_to_fifo(tmp_path, monkeypatch):
+    monkeypatch.setenv("OSUSYNC_CONFIG_DIR", str(tmp_path))
+    monkeypatch.setenv("OSU_DL_SCHEDULE_POLICY", "bogus")
+    assert Settings().schedule_policy == "fifo"
+    monkeypatch.setenv("OSU_DL_SCHEDULE_POLICY", "Shortest")
+    assert Settings().schedule_policy == "shortest"
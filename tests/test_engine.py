@@ -0,0 +1,78 @@
+import asyncio
+import multiprocessing
+import pickle
+import threading
+
+import pytest
+
+from core.engine import (
+    DownloadEngine,
+    EngineError,
+    ProcessEngine,
+    _EngineIndex,
+    _portable_error,
+)
+from core.retry import DownloadError, FailureKind
+
+
+def test_portable_error_wraps_exceptions_that_cannot_be_restored():
+    error = DownloadError(FailureKind.NOT_FOUND, "gone")
+    with pytest.raises(TypeError):
+        pickle.loads(pickle.dumps(error))
+    wrapped = _portable_error(error)
+    assert isinstance(wrapped, EngineError)
+    assert "gone" in str(wrapped)
+    plain = ValueError("bad")
+    assert _portable_error(plain) is plain
+
+
+def test_undecodable_reply_fails_pending_calls_and_keeps_reading():
+    async def run() -> tuple[Exception, object]:
+        engine = ProcessEngine({})
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        engine._events = reader
+        engine._loop = asyncio.get_running_loop()
+        first = engine._loop.create_future()
+        engine._pending[1] = first
+        thread = threading.Thread(target=engine._read_events, daemon=True)
+        thread.start()
+        error = DownloadError(FailureKind.NOT_FOUND, "gone")
+        writer.send_bytes(pickle.dumps(("result", 1, False, error)))
+        with pytest.raises(EngineError) as info:
+            await asyncio.wait_for(first, 5)
+        second = engine._loop.create_future()
+        engine._pending[2] = second
+        writer.send(("result", 2, True, "ok"))
+        value = await asyncio.wait_for(second, 5)
+        writer.close()
+        await asyncio.to_thread(thread.join, 5)
+        return info.value, value
+
+    error, value = asyncio.run(run())
+    assert "undecodable" in str(error)
+    assert value == "ok"
+
+
+def test_download_engine_is_abstract():
+    with pytest.raises(TypeError):
+        DownloadEngine()
+
+
+def test_child_index_lists_archives_without_reading_osu_db(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "123 Artist - Title.osz").write_bytes(b"")
+    (tmp_path / "456 Other - Song.osz").write_bytes(b"")
+    sent = []
+
+    async def run() -> _EngineIndex:
+        index = _EngineIndex(str(tmp_path), sent.append)
+        index.mark_owned(789, archive_path=tmp_path / "789 New - One.osz")
+        await index.load_archives()
+        return index
+
+    index = asyncio.run(run())
+    assert index.osu_db_path is None
+    assert index.owned_set_ids == {123, 456, 789}
+    assert index.find_archive(123) == tmp_path / "sub" / "123 Artist - Title.osz"
+    assert index.metadata[456][1:3] == ("Other", "Song")
+    assert sent == [("owned", 789, None, tmp_path / "789 New - One.osz")]
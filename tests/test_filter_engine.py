@@ -0,0 +1,154 @@
+import asyncio
+import random
+
+import pytest
+
+from core.catalog import FILTER_COLUMNS
+from core.filter_engine import FilterEngine, FilterError, FilterTable, compile_filter
+from core.filter_schema import FilterRequest, Group, Rule
+from core.scanner import SongIndex
+
+COL = {name: i for i, name in enumerate(FILTER_COLUMNS)}
+ARTISTS = ["Camellia", "xi", "Nekomata Master", "ZUN", None]
+STATUSES = ["ranked", "loved", "graveyard"]
+
+
+def make_rows(count: int, seed: int = 7) -> list[tuple]:
+    rng = random.Random(seed)
+    rows = []
+    for beatmap_id in range(1, count + 1):
+        row = [None] * len(FILTER_COLUMNS)
+        row[COL["beatmap_id"]] = beatmap_id
+        row[COL["set_id"]] = beatmap_id // 4 + 1
+        row[COL["mode"]] = rng.randrange(4)
+        row[COL["stars"]] = round(rng.uniform(0, 9), 2)
+        row[COL["length"]] = rng.randrange(30, 600)
+        row[COL["bpm"]] = rng.choice([None, 120.0, 150.0, 180.0, 222.22])
+        row[COL["cs"]] = rng.choice([3.0, 4.0, 4.2, 5.0, 7.0])
+        row[COL["ar"]] = round(rng.uniform(5, 10), 1)
+        row[COL["status"]] = rng.choice(STATUSES)
+        row[COL["version"]] = rng.choice(["Easy", "Hard", "Insane", "Extra"])
+        row[COL["artist"]] = rng.choice(ARTISTS)
+        row[COL["title"]] = f"song {beatmap_id % 17}"
+        rows.append(tuple(row))
+    return rows
+
+
+def rule(field: str, operator: str, value: str, group: int = 0) -> Rule:
+    return Rule(field=field, operator=operator, value=value, group=group)
+
+
+def evaluate(request: FilterRequest, rows: list[tuple], owned: set[int]) -> set[int]:
+    table = FilterTable(rows)
+    return set(table.set_ids(compile_filter(request, owned).select(table, None)))
+
+
+def expected(rows: list[tuple], predicate) -> set[int]:
+    return {row[COL["set_id"]] for row in rows if predicate(row)}
+
+
+def num(row: tuple, column: str) -> float | None:
+    return row[COL[column]]
+
+
+def text(row: tuple, column: str) -> str:
+    return (row[COL[column]] or "").lower()
+
+
+ROWS = make_rows(3000)
+
+CASES = [
+    (
+        FilterRequest(groups=[], rules=[rule("Stars", ">", "6.5")]),
+        lambda r: num(r, "stars") > 6.5,
+    ),
+    (
+        FilterRequest(
+            groups=[],
+            rules=[rule("cs", "=", "4.2"), rule("bpm", "<=", "150")],
+        ),
+        lambda r: r[COL["cs"]] == 4.2 and (num(r, "bpm") or 1e9) <= 150,
+    ),
+    (
+        FilterRequest(
+            groups=[Group(number=1, connector="or", parent=0)],
+            rules=[
+                rule("status", "=", "loved"),
+                rule("artist", "contains", "came", group=1),
+                rule("Length", ">=", "5:00", group=1),
+            ],
+        ),
+        lambda r: (
+            text(r, "status") == "loved"
+            and ("came" in text(r, "artist") or num(r, "length") >= 300)
+        ),
+    ),
+    (
+        FilterRequest(
+            groups=[Group(number=1, connector="and", not_=True, parent=0)],
+            rules=[
+                rule("mode", "=", "mania"),
+                rule("ar", ">", "8", group=1),
+                rule("version", "!=", "easy", group=1),
+            ],
+        ),
+        lambda r: (
+            num(r, "mode") == 3
+            and not (num(r, "ar") > 8 and text(r, "version") != "easy")
+        ),
+    ),
+    (
+        FilterRequest(groups=[], rules=[rule("bpm", "!=", "222.22")]),
+        lambda r: num(r, "bpm") is not None and abs(num(r, "bpm") - 222.22) > 0.005,
+    ),
+]
+
+
+@pytest.mark.parametrize(("request_", "predicate"), CASES)
+def test_matches_naive_evaluation(request_, predicate):
+    assert evaluate(request_, ROWS, set()) == expected(ROWS, predicate)
+
+
+def test_owned_rule():
+    owned = {1, 2, 3, 50}
+    request = FilterRequest(groups=[], rules=[rule("owned", "=", "true")])
+    assert evaluate(request, ROWS, owned) == owned
+
+
+def test_invalid_trees_are_rejected():
+    with pytest.raises(FilterError):
+        compile_filter(FilterRequest(groups=[], rules=[rule("nope", "=", "1")]), set())
+    with pytest.raises(FilterError):
+        compile_filter(
+            FilterRequest(groups=[], rules=[rule("stars", "contains", "1")]), set()
+        )
+    with pytest.raises(FilterError):
+        compile_filter(
+            FilterRequest(
+                groups=[Group(number=1, connector="xor")],
+                rules=[rule("stars", ">", "1", group=1)],
+            ),
+            set(),
+        )
+
+
+def test_engine_describes_owned_sets_from_the_evaluated_table():
+    index = SongIndex()
+    index._beatmaps = [row[:14] for row in ROWS[:40]]
+    index._metadata = {
+        set_id: (set_id, f"artist {set_id}", f"title {set_id}", "mapper")
+        for set_id in range(1, 12)
+    }
+    index._owned = set(index._metadata)
+    engine = FilterEngine(lambda: None, lambda: index)
+    request = FilterRequest(groups=[], rules=[rule("set_id", "<=", "3")])
+
+    async def run() -> list[dict]:
+        result = await engine.search(request)
+        return await engine.beatmapsets(result.set_ids, result.table)
+
+    items = asyncio.run(run())
+    assert [item["id"] for item in items] == [3, 2, 1]
+    assert items[0]["artist"] == "artist 3"
+    assert sorted(b["id"] for b in items[0]["beatmaps"]) == [8, 9, 10, 11]
+    assert [b["id"] for b in items[2]["beatmaps"]] == [1, 2, 3]
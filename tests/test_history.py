@@ -0,0 +1,58 @@
+import asyncio
+import json
+import time
+
+from core.downloader import DownloadManager, DownloadTask
+
+
+def finish(manager: DownloadManager, set_id: int, finished_at: float) -> None:
+    task = DownloadTask(set_id, f"https://example.invalid/{set_id}")
+    task.status = "completed"
+    task.updated_at = finished_at
+    manager._tasks[set_id] = task
+    manager._finish(task)
+
+
+def test_history_limit_evicts_oldest_and_spills(tmp_path):
+    spill = tmp_path / "history.jsonl"
+
+    async def run() -> DownloadManager:
+        manager = DownloadManager(
+            str(tmp_path / "songs"),
+            "https://example.invalid/{set_id}",
+            history_limit=3,
+            history_spill_path=spill,
+        )
+        now = time.time()
+        for set_id in range(1, 6):
+            finish(manager, set_id, now + set_id)
+        await manager._last_spill_task
+        await manager.close()
+        return manager
+
+    manager = asyncio.run(run())
+    assert list(manager._history) == [3, 4, 5]
+    assert sorted(manager._tasks) == [3, 4, 5]
+    spilled = [json.loads(line) for line in spill.read_text().splitlines()]
+    assert [row["set_id"] for row in spilled] == [1, 2]
+
+
+def test_history_max_age_trims_on_reconfigure(tmp_path):
+    async def run() -> DownloadManager:
+        manager = DownloadManager(
+            str(tmp_path / "songs"), "https://example.invalid/{set_id}"
+        )
+        now = time.time()
+        finish(manager, 1, now - 7200)
+        finish(manager, 2, now - 7100)
+        finish(manager, 3, now - 60)
+        # 再完了したタスクは履歴の末尾へ移る
+        finish(manager, 2, now)
+        assert list(manager._history) == [1, 3, 2]
+        manager.configure_history(limit=0, max_age=3600, spill_path=None)
+        await manager.close()
+        return manager
+
+    manager = asyncio.run(run())
+    assert list(manager._history) == [3, 2]
+    assert sorted(manager._tasks) == [2, 3]
@@ -0,0 +1,59 @@
+import asyncio
+import io
+import os
+import zipfile
+
+import httpx
+
+from core import scanner as scanner_module
+from core.downloader import DownloadManager, DownloadTask
+from core.scanner import SongIndex
+
+
+def osz_bytes() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("a.osu", "osu file format v14\n")
+    return buffer.getvalue()
+
+
+def test_part_files_do_not_trigger_songs_rescan(tmp_path, monkeypatch):
+    scans = []
+    real_scandir = os.scandir
+
+    def counting_scandir(path):
+        scans.append(path)
+        return real_scandir(path)
+
+    monkeypatch.setattr(scanner_module.os, "scandir", counting_scandir)
+    payload = osz_bytes()
+    transport = httpx.MockTransport(
+        lambda _: httpx.Response(
+            200, content=payload, headers={"content-type": "application/zip"}
+        )
+    )
+
+    async def run() -> os.PathLike:
+        index = SongIndex(songs_dir=str(tmp_path))
+        manager = DownloadManager(
+            str(tmp_path),
+            "https://example.invalid/{set_id}",
+            index=index,
+            client=httpx.AsyncClient(transport=transport),
+            min_free_bytes=0,
+        )
+        manager.partial_dir.mkdir()
+        try:
+            assert index.find_archive(1) is None
+            baseline = len(scans)
+            part = await manager._download(DownloadTask(1, "https://example.invalid/1"))
+            assert part.parent == manager.partial_dir
+            assert index.find_archive(1) is None
+            assert len(scans) == baseline
+            return part
+        finally:
+            await manager.close()
+
+    part = asyncio.run(run())
+    assert part.exists()
+    assert [p.name for p in tmp_path.iterdir()] == [".partial"]
@@ -0,0 +1,41 @@
+import asyncio
+
+from core.downloader import DownloadManager
+
+
+def make_manager(songs_dir) -> DownloadManager:
+    return DownloadManager(
+        str(songs_dir), "https://example.invalid/{set_id}", min_free_bytes=0
+    )
+
+
+def test_start_removes_partials_of_tasks_that_are_not_pending(tmp_path):
+    partial = tmp_path / ".partial"
+    partial.mkdir()
+    for name in ("7-111.part", "8-222.part", "junk.part"):
+        (partial / name).write_bytes(b"x")
+
+    async def run() -> None:
+        manager = make_manager(tmp_path)
+        manager.pause()
+        manager.enqueue([7])
+        await manager.start_workers()
+        await manager.close()
+
+    asyncio.run(run())
+    assert sorted(p.name for p in partial.iterdir()) == ["7-111.part"]
+
+
+def test_start_removes_empty_partial_dir(tmp_path):
+    partial = tmp_path / ".partial"
+    partial.mkdir()
+    (partial / "8-222.part").write_bytes(b"x")
+
+    async def run() -> None:
+        manager = make_manager(tmp_path)
+        await manager.start_workers()
+        await manager.close()
+
+    asyncio.run(run())
+    assert not partial.exists()
+    assert tmp_path.exists()
@@ -0,0 +1,32 @@
+import asyncio
+
+import httpx
+
+from core.downloader import DownloadManager
+
+
+def test_pause_interrupt_requeues_transfers_in_their_original_order(tmp_path):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.Event().wait()  # 転送が終わらないミラー
+
+    async def run() -> list[int]:
+        manager = DownloadManager(
+            str(tmp_path),
+            "https://example.invalid/{set_id}",
+            max_concurrency=3,
+            requests_per_minute=6000,
+            client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            min_free_bytes=0,
+        )
+        manager.enqueue([1, 2, 3, 4, 5])
+        await manager.start_workers()
+        while len(manager._active) < 3:
+            await asyncio.sleep(0.01)
+        manager.pause(interrupt=True)
+        while manager._active:
+            await asyncio.sleep(0.01)
+        order = [entry.set_id for entry in manager._scheduler.ordered()]
+        await manager.close()
+        return order
+
+    assert asyncio.run(run()) == [1, 2, 3, 4, 5]
@@ -0,0 +1,64 @@
+import errno
+
+import httpx
+
+from core.retry import (
+    DownloadError,
+    FailureKind,
+    RetryPolicy,
+    classify_error,
+    parse_retry_after,
+)
+
+
+def status_error(code: int, headers: dict | None = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://example.invalid/")
+    response = httpx.Response(code, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+def test_full_jitter_stays_under_exponential_ceiling():
+    policy = RetryPolicy(base_delay=2.0, max_delay=10.0)
+    for attempts, ceiling in ((1, 2.0), (2, 4.0), (3, 8.0), (6, 10.0)):
+        delays = [policy.next_delay(attempts) for _ in range(500)]
+        assert all(0.0 <= delay <= ceiling for delay in delays)
+        # 下半分にも散らばる (equal jitter ではない)
+        assert min(delays) < ceiling / 2
+
+
+def test_retry_after_is_a_floor_capped_by_max_delay():
+    policy = RetryPolicy(base_delay=1.0, max_delay=30.0)
+    assert policy.next_delay(1, retry_after=20.0) == 20.0
+    assert policy.next_delay(1, retry_after=600.0) == 30.0
+
+
+def test_should_retry_only_transient_kinds_within_budget():
+    policy = RetryPolicy(max_retries=2)
+    assert policy.should_retry(FailureKind.NETWORK, 1)
+    assert policy.should_retry(FailureKind.RATE_LIMITED, 2)
+    assert not policy.should_retry(FailureKind.SERVER_ERROR, 3)
+    assert not policy.should_retry(FailureKind.NOT_FOUND, 1)
+    assert not policy.should_retry(FailureKind.BAD_CONTENT, 1)
+
+
+def test_classify_error():
+    assert classify_error(status_error(404)) == (FailureKind.NOT_FOUND, None)
+    assert classify_error(status_error(503)) == (FailureKind.SERVER_ERROR, None)
+    assert classify_error(status_error(429, {"retry-after": "7"})) == (
+        FailureKind.RATE_LIMITED,
+        7.0,
+    )
+    assert classify_error(httpx.ConnectError("down")) == (FailureKind.NETWORK, None)
+    assert classify_error(OSError(errno.ENOSPC, "full")) == (
+        FailureKind.DISK_FULL,
+        None,
+    )
+    error = DownloadError(FailureKind.BAD_CONTENT, "html")
+    assert classify_error(error) == (FailureKind.BAD_CONTENT, None)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("12") == 12.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
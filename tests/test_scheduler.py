@@ -0,0 +1,119 @@
+import asyncio
+
+from core.scheduler import DownloadScheduler
+
+
+def drain(scheduler: DownloadScheduler) -> list[int]:
+    out = []
+    while (entry := scheduler._pop()) is not None:
+        out.append(entry.set_id)
+    return out
+
+
+def test_priority_then_insertion_order():
+    scheduler = DownloadScheduler()
+    scheduler.put_many([1, 2, 3])
+    scheduler.put_many([4, 5], priority=1)
+    scheduler.put(6)
+    assert [e.set_id for e in scheduler.ordered()] == [4, 5, 1, 2, 3, 6]
+    assert drain(scheduler) == [4, 5, 1, 2, 3, 6]
+
+
+def test_reprioritize_keeps_position_within_class():
+    scheduler = DownloadScheduler()
+    scheduler.put_many([1, 2, 3, 4])
+    assert scheduler.reprioritize(3, 5)
+    assert scheduler.priority_of(3) == 5
+    assert scheduler.reprioritize(3, 0)
+    assert drain(scheduler) == [1, 2, 3, 4]
+
+
+def test_readded_ids_keep_their_batch_order():
+    scheduler = DownloadScheduler()
+    scheduler.put_many([1, 2, 3])
+    scheduler.remove(2)
+    scheduler.put_many([10, 2, 11])
+    assert drain(scheduler) == [1, 3, 10, 2, 11]
+
+
+def test_shortest_policy_prefers_known_small_sizes():
+    scheduler = DownloadScheduler("shortest")
+    scheduler.put_many([1, 2, 3])
+    scheduler.set_size(3, 10)
+    scheduler.set_size(2, 50)
+    assert scheduler.entry(3).size == 10
+    assert drain(scheduler) == [3, 2, 1]
+
+
+def test_get_waits_until_resumed():
+    async def run() -> list[int]:
+        scheduler = DownloadScheduler()
+        scheduler.pause()
+        scheduler.put_many([7, 8])
+        waiter = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        scheduler.resume()
+        return [(await waiter).set_id, (await scheduler.get()).set_id]
+
+    assert asyncio.run(run()) == [7, 8]
+
+
+class NoScan(set):
+    """Run を全部なめたら失敗させる (位置は _where から直接引けるはず)。"""
+
+    def __iter__(self):
+        raise AssertionError("runs were scanned")
+
+
+def test_position_index_finds_runs_without_scanning():
+    scheduler = DownloadScheduler()
+    for start in range(0, 2_000, 100):
+        scheduler.put_many(range(start, start + 100))
+    runs = scheduler._runs
+    assert len(runs) == 20
+    assert all(
+        scheduler._where[set_id][0].ids[scheduler._where[set_id][1]] == set_id
+        for set_id in range(2_000)
+    )
+    scheduler._runs = NoScan(runs)
+    assert scheduler.entry(1_234).priority == 0
+    assert scheduler.remove(1_234)
+    assert scheduler.reprioritize(567, 5)
+    assert scheduler.set_size(890, 10)
+    scheduler._runs = runs
+    # Run は作り直さず、位置が外れた id だけが tombstone / _state に載る
+    assert len(scheduler._runs) == 20
+    assert scheduler._tombstones == {1_234, 567}
+    assert set(scheduler._state) == {567, 890}
+    assert 1_234 not in scheduler._where and 567 not in scheduler._where
+    assert scheduler._where[890] == (scheduler._where[899][0], 90)
+    order = [e.set_id for e in scheduler.ordered()]
+    assert order[:2] == [567, 0]
+    assert 1_234 not in order and len(order) == 1_999
+
+
+def test_fifo_does_not_index_sizes_until_policy_changes():
+    scheduler = DownloadScheduler("fifo")
+    scheduler.put_many([1, 2, 3])
+    scheduler.set_size(1, 300)
+    scheduler.set_size(2, 100)
+    scheduler.set_size(3, 200)
+    assert scheduler._sized == []
+    scheduler.set_policy("shortest")
+    assert drain(scheduler) == [2, 3, 1]
+
+
+def test_requeue_restores_original_order_of_interrupted_batch():
+    scheduler = DownloadScheduler()
+    scheduler.put_many([1, 2, 3, 4])
+    scheduler.put(5)
+    running = [scheduler._pop() for _ in range(3)]
+    scheduler.put(6)
+    scheduler.put(9, priority=1)
+    # 中断した転送は終わった順 (ここでは逆順) に戻ってくる
+    for entry in reversed(running):
+        scheduler.requeue(entry.set_id, entry.priority, entry.seq, queued_at=1.0)
+    assert [e.set_id for e in scheduler.ordered()] == [9, 1, 2, 3, 4, 5, 6]
+    assert scheduler.entry(2).queued_at == 1.0
+    assert drain(scheduler) == [9, 1, 2, 3, 4, 5, 6]
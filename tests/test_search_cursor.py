@@ -0,0 +1,106 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from api.osu_client import OsuApiClient
+from core.rate_governor import RateGovernor
+from core.retry import RetryPolicy
+
+PAGES = 4
+PER_PAGE = 3
+
+
+class FakeOsu:
+    """/oauth/token と cursor_string 付きの /beatmapsets/search だけを返す。"""
+
+    def __init__(self, failures: int = 0, status: int = 503) -> None:
+        self.failures = failures
+        self.status = status
+        self.cursors: list[str | None] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/oauth/token":
+            return httpx.Response(200, json={"access_token": "t", "expires_in": 3600})
+        assert request.headers["authorization"] == "Bearer t"
+        if self.failures:
+            self.failures -= 1
+            return httpx.Response(self.status, text="unavailable")
+        cursor = request.url.params.get("cursor_string")
+        self.cursors.append(cursor)
+        page = int(cursor[1:]) if cursor else 0
+        items = [
+            {"id": page * PER_PAGE + i, "title": f"t{page}-{i}"}
+            for i in range(PER_PAGE)
+        ]
+        body = {"beatmapsets": items, "total": PAGES * PER_PAGE}
+        if page + 1 < PAGES:
+            body["cursor_string"] = f"c{page + 1}"
+        return httpx.Response(200, json=body)
+
+
+def make_client(api: FakeOsu) -> OsuApiClient:
+    http = httpx.AsyncClient(transport=httpx.MockTransport(api))
+    return OsuApiClient(1, "secret", client=http, governor=RateGovernor(60000))
+
+
+async def collect(client: OsuApiClient, **kwargs) -> list:
+    pages = []
+    async for page in client.iter_search(**kwargs):
+        pages.append(page)
+    return pages
+
+
+def ids(pages: list) -> list[int]:
+    return [item["id"] for page in pages for item in page.beatmapsets]
+
+
+def test_walks_every_page():
+    api = FakeOsu()
+    pages = asyncio.run(collect(make_client(api), q="camellia"))
+    assert ids(pages) == list(range(PAGES * PER_PAGE))
+    assert [page.cursor for page in pages] == [None, "c1", "c2", "c3"]
+    assert [page.next_cursor for page in pages] == ["c1", "c2", "c3", None]
+    assert pages[0].total == PAGES * PER_PAGE
+    assert api.cursors == [None, "c1", "c2", "c3"]
+
+
+def test_resumes_from_next_cursor():
+    async def run() -> tuple[list, list]:
+        client = make_client(FakeOsu())
+        first = []
+        async for page in client.iter_search(window=1):
+            first.append(page)
+            if len(first) == 2:
+                break
+        rest = await collect(client, cursor=first[-1].next_cursor)
+        return first, rest
+
+    first, rest = asyncio.run(run())
+    assert ids(first) + ids(rest) == list(range(PAGES * PER_PAGE))
+    assert rest[0].cursor == "c2"
+
+
+def test_retries_transient_errors():
+    api = FakeOsu(failures=2)
+    retry = RetryPolicy(max_retries=3, base_delay=0.001, max_delay=0.01)
+    pages = asyncio.run(collect(make_client(api), retry=retry))
+    assert ids(pages) == list(range(PAGES * PER_PAGE))
+    assert api.failures == 0
+
+
+def test_gives_up_after_max_retries():
+    api = FakeOsu(failures=10)
+    retry = RetryPolicy(max_retries=2, base_delay=0.001, max_delay=0.01)
+    with pytest.raises(HTTPException) as info:
+        asyncio.run(collect(make_client(api), retry=retry))
+    assert info.value.status_code == 503
+    assert api.failures == 7
+
+
+def test_client_errors_are_not_retried():
+    api = FakeOsu(failures=1, status=400)
+    with pytest.raises(HTTPException) as info:
+        asyncio.run(collect(make_client(api), retry=RetryPolicy(base_delay=0.001)))
+    assert info.value.status_code == 400
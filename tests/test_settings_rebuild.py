@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+
+from api import config
+from api.main import create_app
+from api.osu_client import OsuApiClient
+
+
+def test_store_change_stops_old_client_revalidation(tmp_path, monkeypatch):
+    monkeypatch.setenv("OSUSYNC_CONFIG_DIR", str(tmp_path))
+    monkeypatch.setenv("OSU_SONGS_DIR", str(tmp_path / "songs"))
+    monkeypatch.setenv("OSU_HTTP_PREWARM", "0")
+    monkeypatch.setenv("OSU_CLIENT_ID", "1")
+    monkeypatch.setenv("OSU_CLIENT_SECRET", "secret")
+    config.settings.__init__()
+
+    async def run() -> tuple:
+        app = create_app()
+        old: OsuApiClient = app.state.osu
+        old_store = app.state.search_store
+        in_flight = asyncio.Event()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/oauth/token":
+                return httpx.Response(200, json={"access_token": "t"})
+            in_flight.set()
+            await asyncio.Event().wait()  # 応答しない上流
+
+        old._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        old._revalidate("k", {"q": "camellia"})
+        task = old._revalidating["k"]
+        await asyncio.wait_for(in_flight.wait(), 5)
+
+        api = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://test"
+        )
+        resp = await api.post("/api/settings", json={"search_store_mb": 32})
+        await api.aclose()
+        await asyncio.sleep(0)
+        # asyncio.run の後始末で消される前に確かめる
+        stopped = task.cancelled()
+        new = app.state.osu
+        await new.aclose()
+        app.state.search_store.close()
+        return resp.status_code, stopped, old, new, old_store, app.state.search_store
+
+    status, stopped, old, new, old_store, new_store = asyncio.run(run())
+    assert status == 200
+    assert stopped
+    assert old._revalidating == {}
+    assert new is not old
+    assert new.store is new_store is not old_store
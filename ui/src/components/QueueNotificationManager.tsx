@@ -1,52 +1,179 @@
-import { useEffect, useRef } from "react";
+import { useEffect } from "react";
 import toast from "react-hot-toast";
 import { useQueryClient } from "@tanstack/react-query";
-import { type QueueStatus } from "../hooks/useApiClient";
+import {
+	apiClient,
+	type QueueDeltaEvent,
+	type QueueEntry,
+	type QueueProgressEvent,
+	type QueueStatus,
+} from "../hooks/useApiClient";
 import { getEventSource } from "../utils/eventSource";
 
+const RUNNING_STATUSES = new Set(["running", "processing"]);
+const QUEUED_STATUSES = new Set(["queued"]);
+// /queue の既定ページサイズに合わせてキャッシュ上の queued / done を切り詰める
+const PAGE_SIZE = 200;
+
+function findEntry(queue: QueueStatus, setId: number): QueueEntry | undefined {
+	return (
+		queue.queued.find((e) => e.set_id === setId) ??
+		queue.running.find((e) => e.set_id === setId) ??
+		queue.done.find((e) => e.set_id === setId)
+	);
+}
+
+function upsert(
+	list: QueueEntry[],
+	entry: QueueEntry,
+	prepend = false,
+): QueueEntry[] {
+	const index = list.findIndex((e) => e.set_id === entry.set_id);
+	if (index >= 0) {
+		const next = list.slice();
+		next[index] = entry;
+		return next;
+	}
+	return prepend ? [entry, ...list] : [...list, entry];
+}
+
+function insertQueued(list: QueueEntry[], entry: QueueEntry): QueueEntry[] {
+	const existing = list.findIndex((e) => e.set_id === entry.set_id);
+	if (existing >= 0 && list[existing].priority === entry.priority) {
+		return upsert(list, entry);
+	}
+	// priority の降順、同じ priority 内は投入順 (後ろに追加)
+	const rest = list.filter((e) => e.set_id !== entry.set_id);
+	const priority = entry.priority ?? 0;
+	const index = rest.findIndex((e) => (e.priority ?? 0) < priority);
+	if (index < 0) return [...rest, entry];
+	return [...rest.slice(0, index), entry, ...rest.slice(index)];
+}
+
+function applyDelta(queue: QueueStatus, delta: QueueDeltaEvent): QueueStatus {
+	const removed = new Set(delta.removed);
+	const kept = (e: QueueEntry) => !removed.has(e.set_id);
+	let queued = queue.queued.filter(kept);
+	let running = queue.running.filter(kept);
+	let done = queue.done.filter(kept);
+
+	for (const entry of delta.tasks) {
+		const inQueued = QUEUED_STATUSES.has(entry.status);
+		const inRunning = RUNNING_STATUSES.has(entry.status);
+		if (!inQueued) queued = queued.filter((e) => e.set_id !== entry.set_id);
+		if (!inRunning) running = running.filter((e) => e.set_id !== entry.set_id);
+		if (inQueued || inRunning) {
+			done = done.filter((e) => e.set_id !== entry.set_id);
+		}
+		if (inQueued) queued = insertQueued(queued, entry);
+		else if (inRunning) running = upsert(running, entry);
+		// done は新しい順
+		else done = upsert(done, entry, true);
+	}
+
+	return {
+		...queue,
+		seq: delta.seq,
+		queued: queued.slice(0, PAGE_SIZE),
+		running,
+		done: done.slice(0, PAGE_SIZE),
+		queued_total: delta.queued_total,
+		done_total: delta.done_total,
+		paused: delta.paused,
+		schedule_policy: delta.schedule_policy,
+	};
+}
+
+function applyProgress(
+	queue: QueueStatus,
+	progress: QueueProgressEvent,
+): QueueStatus {
+	const updates = new Map(progress.tasks.map((t) => [t.set_id, t]));
+	return {
+		...queue,
+		running: queue.running.map((entry) => {
+			const update = updates.get(entry.set_id);
+			return update ? { ...entry, ...update } : entry;
+		}),
+	};
+}
+
 export function QueueNotificationManager() {
-	const previousDoneRef = useRef<Map<number, any>>(new Map());
 	const queryClient = useQueryClient();
 
 	useEffect(() => {
 		const es = getEventSource();
+		let resyncing = false;
+
+		// 差分を取りこぼしたらスナップショットから取り直す
+		const resync = async () => {
+			if (resyncing) return;
+			resyncing = true;
+			try {
+				const snapshot = await apiClient.get<QueueStatus>("/queue/snapshot");
+				queryClient.setQueryData<QueueStatus>(["queue"], snapshot);
+			} catch (error) {
+				console.error("Failed to resync queue:", error);
+			} finally {
+				resyncing = false;
+			}
+		};
+
+		const notifyCompleted = (queue: QueueStatus, delta: QueueDeltaEvent) => {
+			delta.tasks.forEach((entry) => {
+				if (entry.status !== "completed") return;
+				// 既に completed として持っているものは通知しない
+				if (findEntry(queue, entry.set_id)?.status === "completed") return;
+				const displayName =
+					entry.artist && entry.title
+						? `${entry.artist} - ${entry.title}`
+						: `Set ${entry.set_id}`;
+				toast.success(`${displayName}\nDownload completed!`);
+			});
+		};
 
 		const handleMessage = (event: MessageEvent) => {
 			try {
 				const parsed = JSON.parse(event.data);
 				if (parsed.topic !== "queue") return;
-				const queue: QueueStatus = parsed.data;
-
-				// react-query キャッシュを即時更新
-				queryClient.setQueryData<QueueStatus>(["queue"], queue);
+				const data = parsed.data as QueueDeltaEvent | QueueProgressEvent;
+				const queue = queryClient.getQueryData<QueueStatus>(["queue"]);
+				// まだ一度も取得していなければ通常の fetch に任せる
+				if (!queue) return;
+				const seq = queue.seq ?? 0;
 
-				if (!queue?.done) return;
+				if (data.epoch !== queue.epoch) {
+					// サーバ側でダウンローダが作り直され seq が巻き戻った
+					if (data.type === "delta") void resync();
+					return;
+				}
 
-				// 新しくcompletedになったエントリをチェック
-				queue.done.forEach((entry) => {
-					if (entry.status === "completed") {
-						const previousEntry = previousDoneRef.current.get(entry.set_id);
-
-						// まだ通知していない、または状態が変わった場合のみ通知
-						if (!previousEntry || previousEntry.status !== "completed") {
-							const displayName =
-								entry.artist && entry.title
-									? `${entry.artist} - ${entry.title}`
-									: `Set ${entry.set_id}`;
-
-							toast.success(`${displayName}\nDownload completed!`);
-						}
+				if (data.type === "progress") {
+					if (data.seq === seq) {
+						queryClient.setQueryData<QueueStatus>(
+							["queue"],
+							applyProgress(queue, data),
+						);
 					}
-				});
-
-				// 現在のdone状態を保存
-				previousDoneRef.current.clear();
-				queue.done.forEach((entry) => {
-					previousDoneRef.current.set(entry.set_id, {
-						status: entry.status,
-						updated_at: entry.updated_at,
-					});
-				});
+					return;
+				}
+
+				// 取得済みのスナップショットに含まれている差分
+				if (data.seq <= seq) return;
+				if (data.seq !== seq + 1) {
+					// 取りこぼしがあった
+					void resync();
+					return;
+				}
+				notifyCompleted(queue, data);
+				queryClient.setQueryData<QueueStatus>(
+					["queue"],
+					applyDelta(queue, data),
+				);
+				// 追加分は件数しか届かないので、表示中のページを取り直す
+				if (data.enqueued > 0) {
+					void queryClient.invalidateQueries({ queryKey: ["queue"] });
+				}
 			} catch (error) {
 				console.error("Failed to process queue event:", error);
 			}
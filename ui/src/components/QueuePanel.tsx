@@ -172,7 +172,9 @@ function QueuePanel({ data, showUnicode, setShowUnicode }: Props) {
 							<div className="w-2 h-2 bg-text-muted rounded-full"></div>
 							<h3 className="text-sm font-medium">Queued</h3>
 							{data.queued.length > 0 && (
-								<span className="text-xs text-muted-foreground">({data.queued.length})</span>
+								<span className="text-xs text-muted-foreground">
+									({data.queued_total ?? data.queued.length})
+								</span>
 							)}
 						</div>
 						{data.queued.length === 0 ? (
@@ -200,7 +202,9 @@ function QueuePanel({ data, showUnicode, setShowUnicode }: Props) {
 							<div className="w-2 h-2 bg-success rounded-full"></div>
 							<h3 className="text-sm font-medium">Completed</h3>
 							{data.done.length > 0 && (
-								<span className="text-xs text-muted-foreground">({data.done.length})</span>
+								<span className="text-xs text-muted-foreground">
+									({data.done_total ?? data.done.length})
+								</span>
 							)}
 						</div>
 						{data.done.length === 0 ? (
@@ -91,6 +91,7 @@ export interface SearchResponse {
 export interface QueueEntry {
 	set_id: number;
 	status: string;
+	priority?: number;
 	message: string | null;
 	path?: string | null;
 	archive_path?: string | null;
@@ -102,14 +103,59 @@ export interface QueueEntry {
 	progress?: number | null;
 	bytes_downloaded: number;
 	total_bytes?: number | null;
+	expected_bytes?: number | null;
 	speed_bps?: number | null;
 	updated_at?: number | null;
+	attempts?: number;
+	last_error?: string | null;
+	error_kind?: string | null;
+	next_retry_at?: number | null;
 }
 
 export interface QueueStatus {
+	epoch?: string | null;
+	seq?: number;
 	queued: QueueEntry[];
 	running: QueueEntry[];
 	done: QueueEntry[];
+	queued_total?: number;
+	done_total?: number;
+	paused?: boolean;
+	schedule_policy?: string;
+	estimated_total_bytes?: number | null;
+	unknown_size_count?: number;
+	eta_seconds?: number | null;
+}
+
+// SSE queue トピック: 変更のあったタスクだけの差分
+export interface QueueDeltaEvent {
+	type: "delta";
+	epoch: string;
+	seq: number;
+	tasks: QueueEntry[];
+	removed: number[];
+	enqueued: number;
+	queued_total: number;
+	done_total: number;
+	paused: boolean;
+	schedule_policy: string;
+}
+
+// SSE queue トピック: 実行中タスクの進捗をまとめたもの
+export interface QueueProgressEvent {
+	type: "progress";
+	epoch: string;
+	seq: number;
+	tasks: Pick<
+		QueueEntry,
+		"set_id" | "progress" | "bytes_downloaded" | "total_bytes" | "speed_bps"
+	>[];
+	aggregate: {
+		running: number;
+		queued: number;
+		bytes_downloaded: number;
+		speed_bps: number;
+	};
 }
 
 export interface IndexSummary {
@@ -127,6 +173,7 @@ export interface Settings {
 	download_query_options: string;
 	max_concurrency: number;
 	requests_per_minute: number;
+	max_retries: number;
 	player_volume: number;
 }
 